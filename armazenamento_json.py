@@ -0,0 +1,458 @@
+"""Armazenamento em arquivo JSON seguro contra falhas e escritas concorrentes.
+
+Cada coleção é guardada em dois arquivos:
+
+- o snapshot (ex.: `dados.json`), uma lista JSON no mesmo formato de
+  sempre, regravado apenas na compactação, via arquivo temporário +
+  `os.replace` (a troca é atômica: nunca fica um arquivo pela metade);
+- o journal (ex.: `dados.json.journal`), onde cada escrita acrescenta uma
+  linha com a operação (`gravar` um item ou `remover` um id). O custo de
+  uma escrita é proporcional à alteração, não ao tamanho do arquivo.
+
+O estado é o snapshot com o journal reaplicado por cima. Quando o journal
+passa de `limite_journal` operações ele é compactado num novo snapshot.
+Uma transação é aplicada em memória (tudo ou nada) antes de ir para o
+journal: uma operação que não se aplica é recusada sem deixar rastro no
+disco.
+
+As escritas são serializadas por um lock de thread e por um `flock` no
+arquivo `<snapshot>.lock`, o que permite mais de um processo (workers)
+usando os mesmos arquivos. Antes de cada operação o estado em memória é
+sincronizado com o disco: se só o journal cresceu, apenas as linhas novas
+são lidas.
+
+Em memória os itens ficam num dicionário por id (`obter` é O(1)) e, se
+configurados, em índices secundários (`indices={'categorias': funcao}`,
+consultados com `buscar`), mantidos a cada operação aplicada. Um índice
+pode também ser um objeto próprio com `reconstruir(itens)`, `incluir(item)`
+e `excluir(item)` (ex.: o índice de texto de `busca.py`), consultado com
+`consultar`. Os IDs novos
+vêm de uma sequência monotônica (`proximo_id`): o maior id já gravado. Ela
+é persistida na primeira linha do journal depois de cada compactação, para
+que remover o último item não faça o seu id ser reutilizado.
+"""
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from serializacao import carregar, para_bytes
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas o lock entre threads
+    fcntl = None
+
+log = logging.getLogger('dashboards.armazenamento')
+
+
+class ArquivoCorrompido(ValueError):
+    """O snapshot não pôde ser lido. Nada é gravado por cima dele."""
+
+
+class IndiceChaves:
+    """Índice secundário chave -> ids, com as chaves de cada item dadas por `funcao(item)`."""
+
+    def __init__(self, funcao):
+        self.funcao = funcao
+        self.ids = {}
+
+    def reconstruir(self, itens):
+        self.ids = {}
+        for item in itens:
+            self.incluir(item)
+
+    def incluir(self, item):
+        # As chaves são calculadas antes de alterar o índice: se `funcao`
+        # falhar, o índice fica como estava
+        for chave in list(self.funcao(item)):
+            self.ids.setdefault(chave, set()).add(item['id'])
+
+    def excluir(self, item):
+        for chave in list(self.funcao(item)):
+            ids = self.ids.get(chave)
+            if ids is not None:
+                ids.discard(item['id'])
+                if not ids:
+                    del self.ids[chave]
+
+
+class Transacao:
+    """Operações acumuladas dentro de `ArquivoJSON.transacao()`.
+
+    Leituras enxergam as alterações já feitas na própria transação. As
+    operações só são gravadas (e aplicadas ao estado compartilhado) quando
+    o bloco `with` termina sem exceção.
+    """
+
+    def __init__(self, arquivo):
+        self._arquivo = arquivo
+        self._alterados = {}
+        self._operacoes = []
+        self._sequencia = arquivo._sequencia
+
+    def obter(self, item_id):
+        if item_id in self._alterados:
+            return self._alterados[item_id]
+        return self._arquivo._itens.get(item_id)
+
+    def itens(self):
+        """Todos os itens, já com as alterações desta transação."""
+        for item_id, item in self._arquivo._itens.items():
+            if item_id in self._alterados:
+                if self._alterados[item_id] is not None:
+                    yield self._alterados[item_id]
+            else:
+                yield item
+        for item_id, item in self._alterados.items():
+            if item is not None and item_id not in self._arquivo._itens:
+                yield item
+
+    def buscar(self, indice, chave):
+        """Itens com `chave` no índice `indice`, já com as alterações desta transação."""
+        indice = self._arquivo._indices[indice]
+        ids = set(indice.ids.get(chave, ()))
+        for item_id, item in self._alterados.items():
+            if item is not None and chave in indice.funcao(item):
+                ids.add(item_id)
+            else:
+                ids.discard(item_id)
+        return [self.obter(item_id) for item_id in sorted(ids)]
+
+    def proximo_id(self):
+        """Próximo id livre, nunca reutilizado (nem o de um item já removido)."""
+        self._sequencia += 1
+        return self._sequencia
+
+    def gravar(self, item):
+        """Insere ou substitui o item (identificado pelo campo `id`)."""
+        self._alterados[item['id']] = item
+        self._sequencia = max(self._sequencia, item['id'])
+        self._operacoes.append({'op': 'gravar', 'item': item})
+
+    def remover(self, item_id):
+        self._alterados[item_id] = None
+        self._operacoes.append({'op': 'remover', 'id': item_id})
+
+
+class ArquivoJSON:
+    """Coleção de itens com campo `id` persistida em snapshot + journal.
+
+    `indices` mapeia o nome de um índice secundário para uma função que
+    devolve as chaves de um item (ex.: a lista de categorias de uma planilha)
+    ou para um objeto com a interface de `IndiceChaves`.
+    """
+
+    def __init__(self, caminho, limite_journal=1000, sincronizar_disco=True, indices=None):
+        self.caminho = caminho
+        self.caminho_journal = caminho + '.journal'
+        self.caminho_lock = caminho + '.lock'
+        self.limite_journal = limite_journal
+        self.sincronizar_disco = sincronizar_disco
+        self._lock = threading.RLock()
+        self._itens = None
+        self._indices = {
+            nome: indice if hasattr(indice, 'incluir') else IndiceChaves(indice)
+            for nome, indice in (indices or {}).items()
+        }
+        self._sequencia = 0
+        self._snapshot_stat = None
+        self._journal_offset = 0
+        self._journal_operacoes = 0
+        self._observadores = []
+
+    # ---------- API pública ----------
+
+    def observar(self, callback):
+        """Registra `callback()` para ser chamado após cada escrita confirmada."""
+        self._observadores.append(callback)
+
+    def ler(self):
+        """Lista de todos os itens (cópia rasa da lista; não altere os itens)."""
+        with self._lock, self._lock_arquivo(compartilhado=True):
+            self._sincronizar()
+            return list(self._itens.values())
+
+    def obter(self, item_id):
+        with self._lock, self._lock_arquivo(compartilhado=True):
+            self._sincronizar()
+            return self._itens.get(item_id)
+
+    def existentes(self, ids):
+        """Subconjunto de `ids` que existe na coleção (uma única sincronização)."""
+        with self._lock, self._lock_arquivo(compartilhado=True):
+            self._sincronizar()
+            return {item_id for item_id in ids if item_id in self._itens}
+
+    def buscar(self, indice, chave):
+        """Itens com `chave` no índice secundário `indice`, em ordem de id."""
+        with self._lock, self._lock_arquivo(compartilhado=True):
+            self._sincronizar()
+            return [self._itens[item_id] for item_id in sorted(self._indices[indice].ids.get(chave, ()))]
+
+    def consultar(self, indice, funcao):
+        """Retorna `funcao(objeto do índice)`, executada com o estado sincronizado
+        e sem escritas concorrentes (o índice não deve escapar da função)."""
+        with self._lock, self._lock_arquivo(compartilhado=True):
+            self._sincronizar()
+            return funcao(self._indices[indice])
+
+    def contagens(self, indice):
+        """Quantidade de itens por chave do índice `indice` (sem percorrer os itens)."""
+        with self._lock, self._lock_arquivo(compartilhado=True):
+            self._sincronizar()
+            return {chave: len(ids) for chave, ids in self._indices[indice].ids.items()}
+
+    def tamanho(self):
+        with self._lock, self._lock_arquivo(compartilhado=True):
+            self._sincronizar()
+            return len(self._itens)
+
+    def sequencia(self):
+        """Maior id já usado na coleção (inclusive por itens removidos)."""
+        with self._lock, self._lock_arquivo(compartilhado=True):
+            self._sincronizar()
+            return self._sequencia
+
+    def assinatura(self):
+        """Identifica o conteúdo em disco sem lê-lo (para validar caches)."""
+        return (self._stat(self.caminho), self._stat(self.caminho_journal))
+
+    @contextlib.contextmanager
+    def transacao(self):
+        """Bloco de leitura-modificação-escrita exclusivo entre threads e processos."""
+        with self._lock, self._lock_arquivo(compartilhado=False):
+            self._sincronizar()
+            transacao = Transacao(self)
+            yield transacao
+            if transacao._operacoes:
+                # Aplica primeiro (tudo ou nada) e só então grava: uma operação
+                # que não se aplica nunca chega ao journal
+                desfazer = self._aplicar(transacao._operacoes)
+                try:
+                    self._anexar(transacao._operacoes)
+                except BaseException:
+                    desfazer()
+                    raise
+                if self._journal_operacoes >= self.limite_journal:
+                    self._compactar()
+        if transacao._operacoes:
+            self._notificar()
+
+    def substituir(self, itens):
+        """Troca a coleção inteira (grava um novo snapshot e zera o journal)."""
+        with self._lock, self._lock_arquivo(compartilhado=False):
+            try:
+                self._sincronizar()
+            except ArquivoCorrompido:
+                pass  # o snapshot ilegível é justamente o que será trocado
+            sequencia = self._sequencia
+            self._definir_itens(itens)
+            self._sequencia = max(self._sequencia, sequencia)
+            self._compactar()
+        self._notificar()
+
+    # ---------- internos ----------
+
+    @contextlib.contextmanager
+    def _lock_arquivo(self, compartilhado):
+        if fcntl is None:
+            yield
+            return
+        with open(self.caminho_lock, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_SH if compartilhado else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _stat(caminho):
+        try:
+            st = os.stat(caminho)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _notificar(self):
+        for callback in self._observadores:
+            callback()
+
+    def _sincronizar(self):
+        """Atualiza o estado em memória com o que está em disco (lock adquirido)."""
+        snapshot_stat = self._stat(self.caminho)
+        journal_stat = self._stat(self.caminho_journal)
+        journal_tamanho = journal_stat[2] if journal_stat else 0
+        if self._itens is None or snapshot_stat != self._snapshot_stat or journal_tamanho < self._journal_offset:
+            self._carregar_snapshot(snapshot_stat)
+        if journal_tamanho > self._journal_offset:
+            self._reaplicar_journal()
+
+    def _carregar_snapshot(self, snapshot_stat):
+        itens = []
+        if snapshot_stat is not None:
+            try:
+                with open(self.caminho, 'rb') as f:
+                    itens = carregar(f.read())
+            except json.JSONDecodeError as e:
+                raise ArquivoCorrompido(f'{self.caminho} está corrompido: {e}') from e
+            if not isinstance(itens, list):
+                raise ArquivoCorrompido(f'{self.caminho} não contém uma lista')
+        self._definir_itens(itens)
+        self._snapshot_stat = snapshot_stat
+        self._journal_offset = 0
+        self._journal_operacoes = 0
+
+    def _reaplicar_journal(self):
+        """Aplica as linhas do journal a partir do último offset lido.
+
+        Uma última linha sem `\\n` (escrita interrompida) é ignorada e será
+        descartada na próxima escrita. O offset avança linha a linha, depois
+        de cada operação tratada: uma falha no meio não pula as seguintes.
+        Uma operação que não se aplica (ex.: gravada por uma versão antiga,
+        sem validação) é descartada com um aviso no log, sem alterar o
+        estado; a próxima compactação a remove do disco.
+        """
+        with open(self.caminho_journal, 'rb') as f:
+            f.seek(self._journal_offset)
+            for linha in f:
+                if not linha.endswith(b'\n'):
+                    break
+                if linha.strip():
+                    try:
+                        self._aplicar_operacao(carregar(linha))
+                    except Exception as e:
+                        log.warning('%s: operação descartada no offset %d: %s',
+                                    self.caminho_journal, self._journal_offset, e)
+                        self._journal_operacoes += 1
+                self._journal_offset += len(linha)
+
+    def _definir_itens(self, itens):
+        self._itens = {item['id']: item for item in itens}
+        self._sequencia = max(self._itens, default=0)
+        for indice in self._indices.values():
+            indice.reconstruir(self._itens.values())
+
+    def _aplicar(self, operacoes):
+        """Aplica as operações de uma transação: todas ou nenhuma.
+
+        Retorna uma função que desfaz a aplicação (usada se a gravação no
+        journal falhar).
+        """
+        sequencia, contagem = self._sequencia, self._journal_operacoes
+        inversas = []
+
+        def desfazer():
+            for inversa in reversed(inversas):
+                if inversa is not None:
+                    self._aplicar_operacao(inversa)
+            self._sequencia, self._journal_operacoes = sequencia, contagem
+
+        try:
+            for op in operacoes:
+                inversas.append(self._aplicar_operacao(op))
+        except BaseException:
+            desfazer()
+            raise
+        return desfazer
+
+    def _aplicar_operacao(self, op):
+        """Aplica uma operação ao estado em memória e retorna a operação
+        inversa (None se não houver o que desfazer). Se falhar, o estado
+        (itens e índices) fica como estava."""
+        tipo = op.get('op') if isinstance(op, dict) else None
+        if tipo == 'sequencia':
+            # Cabeçalho do journal, não conta para a compactação
+            self._sequencia = max(self._sequencia, int(op['valor']))
+            return None
+        if tipo == 'gravar':
+            novo = op['item']
+            item_id = novo['id'] if isinstance(novo, dict) else None
+        elif tipo == 'remover':
+            novo = None
+            item_id = op['id']
+        else:
+            raise ValueError(f'operação desconhecida: {op!r}')
+        if not isinstance(item_id, int) or isinstance(item_id, bool):
+            raise ValueError(f'id inválido: {item_id!r}')
+
+        anterior = self._itens.get(item_id)
+        self._reindexar(anterior, novo)
+        if novo is not None:
+            self._itens[item_id] = novo
+            self._sequencia = max(self._sequencia, item_id)
+        else:
+            self._itens.pop(item_id, None)
+        self._journal_operacoes += 1
+        if anterior is not None:
+            return {'op': 'gravar', 'item': anterior}
+        return {'op': 'remover', 'id': item_id} if novo is not None else None
+
+    def _reindexar(self, anterior, novo):
+        """Troca `anterior` por `novo` em todos os índices (qualquer um pode ser
+        None). Se um índice recusar `novo`, os já alterados são restaurados."""
+        alterados = []
+        try:
+            for indice in self._indices.values():
+                if anterior is not None:
+                    indice.excluir(anterior)
+                if novo is not None:
+                    try:
+                        indice.incluir(novo)
+                    except BaseException:
+                        if anterior is not None:
+                            indice.incluir(anterior)
+                        raise
+                alterados.append(indice)
+        except BaseException:
+            for indice in alterados:
+                if novo is not None:
+                    indice.excluir(novo)
+                if anterior is not None:
+                    indice.incluir(anterior)
+            raise
+
+    def _anexar(self, operacoes):
+        dados = b''.join(para_bytes(op) + b'\n' for op in operacoes)
+        with open(self.caminho_journal, 'ab') as f:
+            # Descarta restos de uma escrita interrompida antes de anexar
+            if f.tell() > self._journal_offset:
+                f.truncate(self._journal_offset)
+            f.write(dados)
+            f.flush()
+            if self.sincronizar_disco:
+                os.fsync(f.fileno())
+        self._journal_offset += len(dados)
+
+    def _compactar(self):
+        """Grava o estado atual como novo snapshot (atômico) e zera o journal."""
+        diretorio = os.path.dirname(os.path.abspath(self.caminho))
+        fd, temporario = tempfile.mkstemp(prefix='.' + os.path.basename(self.caminho), dir=diretorio)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(para_bytes(list(self._itens.values()), indentar=True))
+                f.flush()
+                if self.sincronizar_disco:
+                    os.fsync(f.fileno())
+            os.replace(temporario, self.caminho)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temporario)
+            raise
+        # Só depois do snapshot trocado: se cair aqui, reaplicar o journal
+        # antigo sobre o snapshot novo produz o mesmo estado. O journal novo
+        # começa pela sequência, que o snapshot sozinho não guarda (o maior
+        # id pode ter sido removido).
+        cabecalho = b''
+        if self._sequencia > max(self._itens, default=0):
+            cabecalho = para_bytes({'op': 'sequencia', 'valor': self._sequencia}) + b'\n'
+        with open(self.caminho_journal, 'wb') as f:
+            f.write(cabecalho)
+            f.flush()
+            if self.sincronizar_disco:
+                os.fsync(f.fileno())
+        self._snapshot_stat = self._stat(self.caminho)
+        self._journal_offset = len(cabecalho)
+        self._journal_operacoes = 0
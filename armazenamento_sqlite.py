@@ -0,0 +1,87 @@
+"""Banco SQLite embutido: o meio-termo entre os arquivos JSON e o PostgreSQL.
+
+Selecionado por `ARMAZENAMENTO=sqlite` (arquivo em `SQLITE_PATH`, padrão
+`dados.db` no diretório de trabalho), sem servidor de banco. Usa o mesmo
+esquema do PostgreSQL (`Categoria`, `Planilha`, `planilha_categoria`),
+criado por `migracoes.py`, com índices e transações de verdade.
+
+Cada conexão é configurada por `configurar_conexao`:
+
+- `journal_mode=WAL`: leitores não bloqueiam o escritor nem são
+  bloqueados por ele (cada leitura vê o último commit feito antes dela);
+- `synchronous=NORMAL`: com WAL, um commit não espera o fsync do arquivo
+  principal; uma queda de energia pode perder os últimos commits, nunca
+  corromper o banco;
+- `busy_timeout` (`SQLITE_BUSY_TIMEOUT_MS`, padrão 5000): um segundo
+  escritor espera a vez em vez de falhar com "database is locked";
+- `foreign_keys=ON`: o `ON DELETE CASCADE` de `planilha_categoria` passa a
+  valer (no SQLite vem desligado);
+- cache de páginas de 20 MB, temporários em memória e leitura por `mmap`.
+
+`DATABASE_URL=sqlite:///...` continua funcionando e recebe a mesma
+configuração.
+"""
+import os
+
+import busca
+
+# Valores fixos; o busy_timeout vem do ambiente (ver `configurar_conexao`)
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('foreign_keys', 'ON'),
+    ('cache_size', '-20000'),
+    ('temp_store', 'MEMORY'),
+    ('mmap_size', str(256 * 1024 * 1024)),
+)
+
+
+def url_configurada(ambiente=None):
+    """URL do banco escolhida pela configuração, ou None para os arquivos JSON.
+
+    `DATABASE_URL` tem prioridade; sem ela, `ARMAZENAMENTO=sqlite` usa o
+    arquivo `SQLITE_PATH`.
+    """
+    ambiente = os.environ if ambiente is None else ambiente
+    url = ambiente.get('DATABASE_URL')
+    if url:
+        if url.startswith('postgres://'):
+            url = url.replace('postgres://', 'postgresql://', 1)
+        return url
+    modo = (ambiente.get('ARMAZENAMENTO') or 'json').strip().lower()
+    if modo == 'sqlite':
+        return 'sqlite:///' + os.path.abspath(ambiente.get('SQLITE_PATH') or 'dados.db')
+    if modo != 'json':
+        raise ValueError(f'ARMAZENAMENTO inválido: {modo!r} (use json ou sqlite, ou defina DATABASE_URL)')
+    return None
+
+
+def configurar_conexao(conexao):
+    """Aplica os PRAGMAs e registra `busca_normalizar` numa conexão sqlite3 nova.
+
+    Deve rodar fora de transação (evento `connect`): `journal_mode` não
+    muda dentro de uma.
+    """
+    espera = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    cursor = conexao.cursor()
+    try:
+        cursor.execute(f'PRAGMA busy_timeout = {espera}')
+        for nome, valor in PRAGMAS:
+            cursor.execute(f'PRAGMA {nome} = {valor}')
+    finally:
+        cursor.close()
+    busca.registrar_sqlite(conexao)
+
+
+def opcoes_engine():
+    """Opções de `create_engine` para o SQLite (sobrepõem as do PostgreSQL)."""
+    return {
+        # Um arquivo local: conexões são baratas, não há por que reciclá-las
+        # nem testá-las antes do uso
+        'pool_pre_ping': False,
+        'connect_args': {
+            # O pool entrega a conexão a qualquer thread (uma por vez)
+            'check_same_thread': False,
+            'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')) / 1000,
+        },
+    }
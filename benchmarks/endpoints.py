@@ -0,0 +1,266 @@
+"""Benchmark dos endpoints da API nos modos JSON e banco de dados.
+
+Para cada combinação de modo de armazenamento e tamanho de catálogo, um
+processo separado (o modo é decidido no import de `main`) é iniciado num
+diretório temporário, o catálogo sintético é semeado e as operações são
+executadas pelo test client do Flask:
+
+- `listar` (cache quente), `listar_frio` (cache invalidado antes de cada
+  chamada), `listar_pagina` (`?limit=100` a partir de um cursor aleatório),
+  `listar_categoria` (`?categoria=<id>&limit=100`);
+- `obter`, `criar`, `editar`, `deletar` de planilhas;
+- `sugerir`: `GET /api/planilhas/sugestoes?q=` com prefixos e trechos de
+  palavras dos títulos;
+- `cascata_categoria`: `DELETE /api/categorias/<id>`, que remove a
+  categoria de todas as planilhas associadas;
+- `migrar`: `POST /api/migrate` com o catálogo inteiro (só nos modos com
+  banco; é também como esses modos são semeados, depois de criado o
+  esquema por `migracoes.py`).
+
+Catálogo: `--categorias` categorias; cada planilha recebe de 0 a `--fanout`
+categorias, sorteadas com popularidade desigual (poucas categorias muito
+usadas, muitas pouco usadas). A semente é fixa, então os dados são os mesmos
+entre execuções.
+
+O resultado (latências p50/p90/p99/máx em ms e operações por segundo) é
+impresso em JSON, ou gravado em `--saida`, para comparar versões.
+
+Uso:
+    python benchmarks/endpoints.py --tamanhos 1000,10000 --modos json,sqlite
+    python benchmarks/endpoints.py --modos postgresql --database-url postgresql://localhost/bench
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEMENTE = 20240501
+
+
+# ==================== CATÁLOGO SINTÉTICO ====================
+
+def gerar_catalogo(tamanho, num_categorias, fanout, semente=SEMENTE):
+    """Retorna `(categorias, planilhas)` no formato dos arquivos JSON."""
+    aleatorio = random.Random(semente)
+    inicio = datetime(2024, 1, 1)
+    categorias = [
+        {'id': i, 'nome': f'Categoria {i}', 'criado_em': inicio.isoformat(), 'atualizado_em': inicio.isoformat()}
+        for i in range(1, num_categorias + 1)
+    ]
+    # Popularidade ~ 1/posição: a categoria 1 aparece muito mais que a última
+    pesos = [1 / i for i in range(1, num_categorias + 1)]
+    ids = [c['id'] for c in categorias]
+    planilhas = []
+    for i in range(1, tamanho + 1):
+        quantidade = aleatorio.randint(0, fanout) if num_categorias else 0
+        escolhidas = sorted(set(aleatorio.choices(ids, weights=pesos, k=quantidade)))
+        momento = (inicio + timedelta(minutes=i)).isoformat()
+        planilhas.append({
+            'id': i,
+            'titulo': f'Dashboard {i} {aleatorio.choice(["vendas", "estoque", "financeiro", "rh", "marketing"])}',
+            'url': f'https://exemplo.com/dash/{i}',
+            'imagem': None,
+            'criado_em': momento,
+            'atualizado_em': momento,
+            'categorias': escolhidas,
+        })
+    return categorias, planilhas
+
+
+# ==================== MEDIÇÃO ====================
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return None
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def resumir(latencias, total_s, erros=0):
+    """Estatísticas (ms) de uma lista de latências em segundos."""
+    ordenados = sorted(latencias)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None  # noqa: E731
+    return {
+        'n': len(ordenados),
+        'erros': erros,
+        'p50_ms': ms(_percentil(ordenados, 50)),
+        'p90_ms': ms(_percentil(ordenados, 90)),
+        'p99_ms': ms(_percentil(ordenados, 99)),
+        'max_ms': ms(ordenados[-1] if ordenados else None),
+        'media_ms': ms(sum(ordenados) / len(ordenados) if ordenados else None),
+        'ops_por_s': round(len(ordenados) / total_s, 1) if total_s > 0 else None,
+    }
+
+
+def medir(operacao, argumentos, status_esperado, preparar=None):
+    """Executa `operacao(arg)` para cada argumento; só o tempo da chamada é medido."""
+    latencias, erros = [], 0
+    total = 0.0
+    for argumento in argumentos:
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        resposta = operacao(argumento)
+        decorrido = time.perf_counter() - inicio
+        total += decorrido
+        if resposta.status_code != status_esperado:
+            erros += 1
+            continue
+        latencias.append(decorrido)
+    return resumir(latencias, total, erros)
+
+
+# ==================== EXECUÇÃO DE UM CENÁRIO (processo filho) ====================
+
+def executar_cenario(modo, tamanho, args):
+    """Roda no diretório temporário, com DATABASE_URL já definido pelo pai."""
+    categorias, planilhas = gerar_catalogo(tamanho, args.categorias, args.fanout)
+    with open('categorias.json', 'w', encoding='utf-8') as f:
+        json.dump(categorias, f, ensure_ascii=False)
+    with open('dados.json', 'w', encoding='utf-8') as f:
+        json.dump(planilhas, f, ensure_ascii=False)
+
+    inicio = time.perf_counter()
+    sys.path.insert(0, RAIZ)
+    import main
+    cliente = main.app.test_client()
+    resultado = {'modo': modo, 'tamanho': tamanho, 'import_s': round(time.perf_counter() - inicio, 3), 'operacoes': {}}
+    operacoes = resultado['operacoes']
+    aleatorio = random.Random(SEMENTE + 1)
+    repeticoes = args.repeticoes
+
+    if main.USING_DB:
+        import migracoes
+        engine = migracoes.criar_engine(main.database_url)
+        migracoes.migrar(engine)
+        engine.dispose()
+        operacoes['migrar'] = medir(lambda _: cliente.post('/api/migrate'), [None], 200)
+    else:
+        operacoes['migrar'] = {'pulado': 'sem DATABASE_URL'}
+
+    ids = [p['id'] for p in planilhas]
+    operacoes['listar'] = medir(lambda _: cliente.get('/api/planilhas'), range(max(3, repeticoes // 10)), 200)
+    operacoes['listar_frio'] = medir(lambda _: cliente.get('/api/planilhas'), range(max(3, repeticoes // 20)), 200,
+                                     preparar=main.cache_planilhas.invalidar)
+    cursores = [aleatorio.choice(ids) for _ in range(repeticoes)]
+    operacoes['listar_pagina'] = medir(lambda c: cliente.get(f'/api/planilhas?limit=100&cursor={c}'), cursores, 200)
+    filtros = [aleatorio.randint(1, args.categorias) for _ in range(repeticoes)] if args.categorias else []
+    operacoes['listar_categoria'] = medir(lambda c: cliente.get(f'/api/planilhas?categoria={c}&limit=100'), filtros, 200)
+    termos = ['ve', 'vend', 'Estoq', 'financ', 'marketi', 'dash 12', 'board 7', 'rh', 'ceiro', 'dash/9']
+    operacoes['sugerir'] = medir(lambda q: cliente.get('/api/planilhas/sugestoes', query_string={'q': q}),
+                                 [aleatorio.choice(termos) for _ in range(repeticoes)], 200)
+    operacoes['obter'] = medir(lambda i: cliente.get(f'/api/planilhas/{i}'),
+                               [aleatorio.choice(ids) for _ in range(repeticoes)], 200)
+
+    criadas = []
+
+    def criar(i):
+        resposta = cliente.post('/api/planilhas', json={
+            'titulo': f'Nova {i}', 'url': f'https://exemplo.com/nova/{i}',
+            'categorias': sorted(set(aleatorio.choices(range(1, args.categorias + 1), k=2))) if args.categorias else [],
+        })
+        if resposta.status_code == 201:
+            criadas.append(resposta.get_json()['dado']['id'])
+        return resposta
+
+    operacoes['criar'] = medir(criar, range(repeticoes), 201)
+    operacoes['editar'] = medir(lambda i: cliente.put(f'/api/planilhas/{i}', json={'titulo': f'Editada {i}'}),
+                                [aleatorio.choice(ids) for _ in range(repeticoes)], 200)
+    operacoes['deletar'] = medir(lambda i: cliente.delete(f'/api/planilhas/{i}'), criadas, 200)
+
+    # As categorias mais populares primeiro: o pior caso da cascata
+    cascata = list(range(1, min(args.categorias, max(1, repeticoes // 10)) + 1))
+    operacoes['cascata_categoria'] = medir(lambda c: cliente.delete(f'/api/categorias/{c}'), cascata, 200)
+    return resultado
+
+
+# ==================== ORQUESTRAÇÃO (processo pai) ====================
+
+def _url_do_modo(modo, diretorio, args):
+    if modo == 'json':
+        return None
+    if modo == 'sqlite':
+        return f'sqlite:///{os.path.join(diretorio, "bench.db")}'
+    if modo == 'postgresql':
+        if not args.database_url:
+            raise SystemExit('o modo postgresql exige --database-url (o banco será apagado)')
+        return args.database_url
+    raise SystemExit(f'modo desconhecido: {modo}')
+
+
+def _versao():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _argumentos_comuns(args):
+    return ['--categorias', str(args.categorias), '--fanout', str(args.fanout), '--repeticoes', str(args.repeticoes)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--modos', default='json,sqlite', help='json, sqlite e/ou postgresql')
+    parser.add_argument('--tamanhos', default='1000,10000,100000', help='quantidade de planilhas por cenário')
+    parser.add_argument('--categorias', type=int, default=50)
+    parser.add_argument('--fanout', type=int, default=4, help='máximo de categorias por planilha')
+    parser.add_argument('--repeticoes', type=int, default=200, help='chamadas por operação')
+    parser.add_argument('--database-url', help='banco PostgreSQL descartável para o modo postgresql')
+    parser.add_argument('--saida', help='arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--executar', nargs=2, metavar=('MODO', 'TAMANHO'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.executar:
+        print(json.dumps(executar_cenario(args.executar[0], int(args.executar[1]), args)))
+        return
+
+    relatorio = {
+        'versao': _versao(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'parametros': {'categorias': args.categorias, 'fanout': args.fanout, 'repeticoes': args.repeticoes},
+        'cenarios': [],
+    }
+    for modo in args.modos.split(','):
+        for tamanho in (int(t) for t in args.tamanhos.split(',')):
+            diretorio = tempfile.mkdtemp(prefix=f'bench-{modo}-{tamanho}-')
+            env = dict(os.environ)
+            env.pop('DATABASE_URL', None)
+            env.pop('SOCKETIO_MESSAGE_QUEUE', None)
+            url = _url_do_modo(modo, diretorio, args)
+            if url:
+                env['DATABASE_URL'] = url
+            print(f'{modo} / {tamanho} planilhas...', file=sys.stderr)
+            try:
+                execucao = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--executar', modo, str(tamanho)] + _argumentos_comuns(args),
+                    cwd=diretorio, env=env, capture_output=True, text=True,
+                )
+                if execucao.returncode != 0:
+                    relatorio['cenarios'].append({'modo': modo, 'tamanho': tamanho, 'erro': execucao.stderr[-2000:]})
+                else:
+                    relatorio['cenarios'].append(json.loads(execucao.stdout.strip().splitlines()[-1]))
+            finally:
+                shutil.rmtree(diretorio, ignore_errors=True)
+
+    saida = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(saida + '\n')
+    else:
+        print(saida)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Benchmark do tempo de inicialização de um worker.
+
+Cada repetição é um processo Python novo, como um worker do gunicorn
+recém-iniciado, que mede:
+
+- `import_s`: `import main`;
+- `app_s`: criação da aplicação (`main.app`);
+- `primeira_requisicao_s`: o primeiro `GET /api/planilhas`;
+- `total_s`: do início do processo até a primeira resposta (inclui o
+  próprio interpretador e os imports de Flask/SQLAlchemy);
+- `consultas_sql`: comandos SQL executados até a primeira resposta.
+
+Antes das repetições, o banco de cada modo recebe o esquema (por
+`migracoes.py`, quando existe na árvore medida) e o catálogo sintético de
+`--tamanho` planilhas (por `POST /api/migrate`); o tempo das migrações
+sai em `migracoes_s`. Os workers medidos encontram, portanto, um banco já
+pronto, como numa reinicialização em produção.
+
+`--raiz` aponta para outra cópia do repositório (ex.: um `git worktree`
+de uma versão anterior), para comparar as duas árvores com os mesmos
+dados. O resultado (mediana e máximo de cada medida) é impresso em JSON.
+
+Uso:
+    python benchmarks/inicializacao.py --modos json,sqlite --repeticoes 10
+    python benchmarks/inicializacao.py --raiz ../versao-anterior --modos sqlite
+    python benchmarks/inicializacao.py --modos postgresql --database-url postgresql://localhost/bench
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from endpoints import RAIZ, _url_do_modo, _versao, gerar_catalogo
+
+MEDIDAS = ('import_s', 'app_s', 'primeira_requisicao_s', 'total_s', 'consultas_sql')
+
+
+# ==================== PROCESSOS FILHOS ====================
+
+def preparar(raiz, tamanho, categorias, fanout):
+    """Grava o catálogo em JSON e, nos modos com banco, cria o esquema e o semeia."""
+    dados_categorias, planilhas = gerar_catalogo(tamanho, categorias, fanout)
+    with open('categorias.json', 'w', encoding='utf-8') as f:
+        json.dump(dados_categorias, f, ensure_ascii=False)
+    with open('dados.json', 'w', encoding='utf-8') as f:
+        json.dump(planilhas, f, ensure_ascii=False)
+    resultado = {'migracoes_s': None}
+    if not os.environ.get('DATABASE_URL'):
+        return resultado
+    sys.path.insert(0, raiz)
+    if os.path.exists(os.path.join(raiz, 'migracoes.py')):
+        import migracoes
+        inicio = time.perf_counter()
+        engine = migracoes.criar_engine(os.environ['DATABASE_URL'])
+        migracoes.migrar(engine)
+        engine.dispose()
+        resultado['migracoes_s'] = round(time.perf_counter() - inicio, 4)
+    import main
+    resposta = main.app.test_client().post('/api/migrate')
+    if resposta.status_code != 200:
+        raise SystemExit(f'POST /api/migrate falhou: {resposta.status_code} {resposta.get_data(as_text=True)[:500]}')
+    return resultado
+
+
+def medir_inicializacao(raiz, inicio_processo):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    consultas = [0]
+
+    def contar(*_):
+        consultas[0] += 1
+
+    # Vale para todas as engines, inclusive as criadas no import de `main`
+    event.listen(Engine, 'before_cursor_execute', contar)
+    sys.path.insert(0, raiz)
+
+    inicio = time.perf_counter()
+    import main
+    importado = time.perf_counter()
+    app = main.app
+    criado = time.perf_counter()
+    resposta = app.test_client().get('/api/planilhas')
+    respondido = time.perf_counter()
+    fim_processo = time.time()
+    if resposta.status_code != 200:
+        raise SystemExit(f'GET /api/planilhas falhou: {resposta.status_code}')
+    return {
+        'import_s': importado - inicio,
+        'app_s': criado - importado,
+        'primeira_requisicao_s': respondido - criado,
+        'total_s': fim_processo - inicio_processo,
+        'consultas_sql': consultas[0],
+    }
+
+
+# ==================== ORQUESTRAÇÃO (processo pai) ====================
+
+def _executar(argumentos, diretorio, env):
+    execucao = subprocess.run([sys.executable, os.path.abspath(__file__)] + argumentos,
+                              cwd=diretorio, env=env, capture_output=True, text=True)
+    if execucao.returncode != 0:
+        raise RuntimeError(execucao.stderr[-2000:])
+    return json.loads(execucao.stdout.strip().splitlines()[-1])
+
+
+def _resumir(amostras):
+    resumo = {}
+    for medida in MEDIDAS:
+        valores = [a[medida] for a in amostras]
+        if medida == 'consultas_sql':
+            resumo[medida] = {'mediana': statistics.median(valores), 'max': max(valores)}
+        else:
+            resumo[medida] = {'mediana_ms': round(statistics.median(valores) * 1000, 1),
+                              'max_ms': round(max(valores) * 1000, 1)}
+    return resumo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--modos', default='json,sqlite', help='json, sqlite e/ou postgresql')
+    parser.add_argument('--raiz', default=RAIZ, help='cópia do repositório a medir (padrão: esta)')
+    parser.add_argument('--tamanho', type=int, default=1000, help='planilhas no catálogo')
+    parser.add_argument('--categorias', type=int, default=50)
+    parser.add_argument('--fanout', type=int, default=4, help='máximo de categorias por planilha')
+    parser.add_argument('--repeticoes', type=int, default=10, help='processos medidos por modo')
+    parser.add_argument('--database-url', help='banco PostgreSQL descartável para o modo postgresql')
+    parser.add_argument('--saida', help='arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--preparar', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--medir', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    raiz = os.path.abspath(args.raiz)
+
+    if args.preparar:
+        print(json.dumps(preparar(raiz, args.tamanho, args.categorias, args.fanout)))
+        return
+    if args.medir:
+        print(json.dumps(medir_inicializacao(raiz, float(os.environ['INICIO_PROCESSO']))))
+        return
+
+    relatorio = {
+        'versao': _versao() if raiz == RAIZ else raiz,
+        'parametros': {'tamanho': args.tamanho, 'repeticoes': args.repeticoes},
+        'cenarios': [],
+    }
+    for modo in args.modos.split(','):
+        diretorio = tempfile.mkdtemp(prefix=f'bench-inicio-{modo}-')
+        env = dict(os.environ)
+        env.pop('DATABASE_URL', None)
+        env.pop('SOCKETIO_MESSAGE_QUEUE', None)
+        url = _url_do_modo(modo, diretorio, args)
+        if url:
+            env['DATABASE_URL'] = url
+        print(f'{modo}...', file=sys.stderr)
+        comuns = ['--raiz', raiz, '--tamanho', str(args.tamanho),
+                  '--categorias', str(args.categorias), '--fanout', str(args.fanout)]
+        try:
+            cenario = {'modo': modo, **_executar(['--preparar'] + comuns, diretorio, env)}
+            amostras = []
+            for _ in range(args.repeticoes):
+                # O relógio começa antes do interpretador do filho subir
+                env['INICIO_PROCESSO'] = repr(time.time())
+                amostras.append(_executar(['--medir'] + comuns, diretorio, env))
+            cenario.update(_resumir(amostras))
+        except RuntimeError as e:
+            cenario = {'modo': modo, 'erro': str(e)}
+        finally:
+            shutil.rmtree(diretorio, ignore_errors=True)
+        relatorio['cenarios'].append(cenario)
+
+    saida = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(saida + '\n')
+    else:
+        print(saida)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""Benchmark de concorrência dos modos assíncronos (ver servidor.py).
+
+Para cada modo, sobe `servidor.py` num diretório temporário (modo JSON,
+arquivos vazios + algumas planilhas), e mede:
+
+- requisições REST por segundo (`GET /api/planilhas`) com `--concorrencia`
+  clientes simultâneos, antes e depois de abrir as conexões WebSocket;
+- quantas das `--conexoes` conexões WebSocket (protocolo delta) o servidor
+  aceitou e manteve abertas;
+- memória (RSS) e número de threads do processo do servidor com as
+  conexões abertas, e o custo médio de memória por conexão.
+
+O cliente é todo assíncrono (asyncio + simple-websocket), então não é ele o
+gargalo. Modos cujo pacote não está instalado são pulados. O resultado é
+impresso em JSON.
+
+Uso:
+    python benchmarks/modos_servidor.py --modos threading,gevent --conexoes 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import simple_websocket
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Segundos de espera por cada etapa do handshake; receive() devolve None ao estourar
+TEMPO_HANDSHAKE = 30
+# Handshakes em andamento ao mesmo tempo
+HANDSHAKES_SIMULTANEOS = 50
+
+
+def _memoria(pid):
+    """(RSS em KiB, threads) do processo, lidos de /proc (Linux)."""
+    valores = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for linha in f:
+                chave, _, valor = linha.partition(':')
+                valores[chave] = valor.split()[0] if valor.split() else ''
+    except FileNotFoundError:
+        return None, None
+    return int(valores.get('VmRSS', 0)), int(valores.get('Threads', 0))
+
+
+def _modo_disponivel(modo):
+    if modo == 'threading':
+        return True
+    try:
+        __import__(modo)
+    except ImportError:
+        return False
+    return True
+
+
+def _subir_servidor(modo, porta, diretorio, planilhas):
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE=modo, PORT=str(porta), HOST='127.0.0.1')
+    env.pop('DATABASE_URL', None)
+    env.pop('SOCKETIO_MESSAGE_QUEUE', None)
+    processo = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, 'servidor.py')], cwd=diretorio, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f'http://127.0.0.1:{porta}'
+    limite = time.time() + 30
+    while True:
+        try:
+            urllib.request.urlopen(base + '/api/teste', timeout=1).read()
+            break
+        except OSError:
+            if processo.poll() is not None or time.time() > limite:
+                processo.kill()
+                raise RuntimeError(f'servidor no modo {modo} não subiu')
+            time.sleep(0.1)
+    for i in range(planilhas):
+        corpo = json.dumps({'titulo': f'Planilha {i}', 'url': f'https://exemplo/{i}'}).encode()
+        pedido = urllib.request.Request(base + '/api/planilhas', data=corpo, method='POST',
+                                        headers={'Content-Type': 'application/json'})
+        urllib.request.urlopen(pedido).read()
+    return processo
+
+
+async def _get(porta, caminho):
+    leitor, escritor = await asyncio.open_connection('127.0.0.1', porta)
+    try:
+        escritor.write(f'GET {caminho} HTTP/1.0\r\nHost: 127.0.0.1\r\n\r\n'.encode())
+        await escritor.drain()
+        resposta = await leitor.read()
+    finally:
+        escritor.close()
+    return resposta.startswith(b'HTTP/1.1 200') or resposta.startswith(b'HTTP/1.0 200')
+
+
+async def _rest(porta, concorrencia, duracao):
+    """Requisições por segundo de `concorrencia` clientes em laço por `duracao` s."""
+    fim = time.perf_counter() + duracao
+    contagem = {'ok': 0, 'erro': 0}
+
+    async def cliente():
+        while time.perf_counter() < fim:
+            try:
+                sucesso = await _get(porta, '/api/planilhas')
+            except OSError:
+                sucesso = False
+            contagem['ok' if sucesso else 'erro'] += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(concorrencia)))
+    decorrido = time.perf_counter() - inicio
+    return {'req_por_s': round(contagem['ok'] / decorrido, 1), 'erros': contagem['erro']}
+
+
+async def _conectar_websocket(porta):
+    """Abre uma conexão Socket.IO (transporte websocket, protocolo delta)."""
+    url = f'ws://127.0.0.1:{porta}/socket.io/?EIO=4&transport=websocket&protocolo=delta'
+    ws = await simple_websocket.AioClient.connect(url)
+    # O pedido de conexão ao namespace '/' vai junto, sem esperar o pacote de
+    # abertura do Engine.IO: o AioClient às vezes só entrega esse primeiro
+    # quadro quando chega o seguinte.
+    await ws.send('40')
+    aberto = False
+    while True:
+        pacote = await ws.receive(timeout=TEMPO_HANDSHAKE)
+        if pacote is None:
+            raise ConnectionError('handshake não concluído')
+        if pacote.startswith('0'):
+            aberto = True
+        elif pacote.startswith('40') and aberto:
+            return ws
+        elif pacote.startswith('44'):
+            raise ConnectionError('namespace recusado')
+
+
+async def _manter(ws):
+    """Responde aos pings do Engine.IO enquanto a conexão estiver aberta."""
+    try:
+        while True:
+            pacote = await ws.receive()
+            if pacote is None:
+                return
+            if pacote == '2':
+                await ws.send('3')
+    except (simple_websocket.ConnectionClosed, asyncio.CancelledError):
+        return
+
+
+async def _medir_modo(modo, processo, porta, args):
+    resultado = {'modo': modo}
+    rss_base, threads_base = _memoria(processo.pid)
+    resultado['ocioso'] = {'rss_kib': rss_base, 'threads': threads_base}
+    resultado['rest_sem_websocket'] = await _rest(porta, args.concorrencia, args.duracao)
+
+    conexoes, falhas = [], 0
+    inicio = time.perf_counter()
+    semaforo = asyncio.Semaphore(HANDSHAKES_SIMULTANEOS)
+
+    async def abrir():
+        nonlocal falhas
+        async with semaforo:
+            try:
+                conexoes.append(await _conectar_websocket(porta))
+            except (OSError, ConnectionError, simple_websocket.ConnectionError, asyncio.TimeoutError):
+                falhas += 1
+
+    await asyncio.gather(*(abrir() for _ in range(args.conexoes)))
+    tarefas = [asyncio.ensure_future(_manter(ws)) for ws in conexoes]
+    resultado['websocket'] = {
+        'abertas': len(conexoes),
+        'falhas': falhas,
+        'tempo_abertura_s': round(time.perf_counter() - inicio, 2),
+    }
+    await asyncio.sleep(1)
+    rss, threads = _memoria(processo.pid)
+    resultado['com_websocket'] = {'rss_kib': rss, 'threads': threads}
+    if conexoes and rss and rss_base:
+        resultado['websocket']['kib_por_conexao'] = round((rss - rss_base) / len(conexoes), 1)
+    resultado['rest_com_websocket'] = await _rest(porta, args.concorrencia, args.duracao)
+
+    for tarefa in tarefas:
+        tarefa.cancel()
+    for ws in conexoes:
+        try:
+            await ws.close()
+        except Exception:
+            pass
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--modos', default='threading,gevent,eventlet')
+    parser.add_argument('--conexoes', type=int, default=1000, help='conexões WebSocket simultâneas')
+    parser.add_argument('--concorrencia', type=int, default=50, help='clientes REST simultâneos')
+    parser.add_argument('--duracao', type=float, default=5.0, help='segundos de carga REST por medição')
+    parser.add_argument('--planilhas', type=int, default=100, help='planilhas criadas antes da medição')
+    parser.add_argument('--porta', type=int, default=5055)
+    args = parser.parse_args()
+
+    resultados = []
+    for modo in args.modos.split(','):
+        if not _modo_disponivel(modo):
+            resultados.append({'modo': modo, 'pulado': f'pacote {modo} não instalado'})
+            continue
+        diretorio = tempfile.mkdtemp(prefix=f'bench-{modo}-')
+        processo = _subir_servidor(modo, args.porta, diretorio, args.planilhas)
+        try:
+            resultados.append(asyncio.run(_medir_modo(modo, processo, args.porta, args)))
+        finally:
+            processo.terminate()
+            try:
+                processo.wait(10)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+            shutil.rmtree(diretorio, ignore_errors=True)
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
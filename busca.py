@@ -0,0 +1,284 @@
+"""Busca por digitação (typeahead) nos títulos e URLs das planilhas.
+
+O texto é comparado normalizado: sem acentos, em minúsculas e com a
+pontuação trocada por espaços ("Relatório/Vendas 2024" -> "relatorio vendas
+2024"). Cada palavra digitada precisa aparecer no título ou na URL; palavras
+de até 2 letras só casam com o início de uma palavra.
+
+Ordem dos resultados (nível, depois título mais curto, depois id):
+
+0. o título começa com o texto digitado;
+1. cada palavra digitada começa uma palavra do título;
+2. as palavras aparecem em qualquer ponto do título;
+3. as palavras aparecem só na URL (ou parte nela, parte no título).
+
+No modo JSON a busca usa `IndiceTexto`, um índice de trigramas em memória
+mantido pelo `ArquivoJSON` a cada escrita. No banco, ver `DDL_POSTGRESQL`
+(extensão `pg_trgm` e índices GIN) e `registrar_sqlite`.
+"""
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left
+
+MINIMO_CARACTERES = 2
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+# Para termos muito comuns, quantos candidatos no máximo são examinados
+MAXIMO_VERIFICACOES = 20000
+
+_SEPARADORES = re.compile(r'[\W_]+')
+
+
+def sem_acentos(texto):
+    """Minúsculas e sem acentos, mantendo a pontuação."""
+    texto = str(texto or '').casefold()
+    if texto.isascii():
+        return texto
+    return ''.join(c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c))
+
+
+def normalizar(texto):
+    """Texto comparável: sem acentos, minúsculo, pontuação vira espaço."""
+    return _SEPARADORES.sub(' ', sem_acentos(texto)).strip()
+
+
+def trigramas(texto_normalizado):
+    """Trigramas das palavras, cada uma precedida de um espaço (' da', 'das', ...)."""
+    gramas = set()
+    for palavra in texto_normalizado.split():
+        marcada = ' ' + palavra
+        for i in range(len(marcada) - 2):
+            gramas.add(marcada[i:i + 3])
+    return gramas
+
+
+def preparar_consulta(consulta):
+    """`(frase, palavras)` normalizadas, ou None se a consulta for curta demais."""
+    frase = normalizar(consulta)
+    palavras = frase.split()
+    if len(frase) < MINIMO_CARACTERES or all(len(p) < 2 for p in palavras):
+        return None
+    return frase, palavras
+
+
+def _contem(texto, palavra):
+    if len(palavra) >= 3:
+        return palavra in texto
+    return (' ' + palavra) in (' ' + texto)
+
+
+def nivel(titulo, url, frase, palavras):
+    """Nível do resultado (0 a 3, ver acima) ou None se não casar.
+
+    `titulo` e `url` já normalizados; `frase` é a consulta normalizada e
+    `palavras` as suas palavras."""
+    if all(_contem(titulo, p) for p in palavras):
+        if titulo.startswith(frase):
+            return 0
+        marcado = ' ' + titulo
+        if all((' ' + p) in marcado for p in palavras):
+            return 1
+        return 2
+    if all(_contem(url, p) or _contem(titulo, p) for p in palavras):
+        return 3
+    return None
+
+
+class IndiceTexto:
+    """Índice de título e URL para `ArquivoJSON(indices=...)`.
+
+    Cada palavra do vocabulário aponta para a lista das planilhas que a
+    contêm, ordenada pela chave de desempate `(tamanho do título, id)`; os
+    trigramas apontam para as palavras. Uma busca escolhe a palavra digitada
+    com menos planilhas candidatas, percorre essas planilhas em ordem de
+    chave e para assim que os k melhores resultados estão garantidos.
+
+    O índice só é montado na primeira busca. Remoções apenas descartam o
+    texto da planilha; as entradas velhas das listas são ignoradas na busca
+    e limpas quando passam de um quarto do total.
+    """
+
+    def __init__(self, campo_titulo='titulo', campo_url='url'):
+        self.campo_titulo = campo_titulo
+        self.campo_url = campo_url
+        self._itens = ()
+        self._pronto = False
+        # palavra -> chaves (tamanho do título, id) em ordem
+        self._palavras = {}
+        # trigrama -> palavras que o contêm
+        self._gramas = {}
+        # id -> (título normalizado, URL normalizada, chave)
+        self._textos = {}
+        # (título normalizado, chave) em ordem, para contar os títulos com um prefixo
+        self._titulos = []
+        self._obsoletos = 0
+
+    # ---------- manutenção (chamada pelo ArquivoJSON) ----------
+
+    def reconstruir(self, itens):
+        """`itens` é a visão dos itens da coleção; a montagem fica para a primeira busca."""
+        self._itens = itens
+        self._pronto = False
+        self._palavras, self._gramas, self._textos, self._titulos = {}, {}, {}, []
+        self._obsoletos = 0
+
+    def incluir(self, item):
+        if not self._pronto:
+            return
+        titulo, url, chave = self._preparar(item)
+        self._textos[item['id']] = (titulo, url, chave)
+        _inserir_ordenado(self._titulos, (titulo, chave))
+        for palavra in set(titulo.split()) | set(url.split()):
+            chaves = self._palavras.get(palavra)
+            if chaves is None:
+                self._palavras[palavra] = [chave]
+                self._indexar_palavra(palavra)
+            else:
+                _inserir_ordenado(chaves, chave)
+
+    def excluir(self, item):
+        if self._pronto and self._textos.pop(item['id'], None) is not None:
+            self._obsoletos += 1
+
+    # ---------- montagem ----------
+
+    def _preparar(self, item):
+        titulo = normalizar(item.get(self.campo_titulo))
+        url = normalizar(item.get(self.campo_url))
+        return titulo, url, (len(titulo), item['id'])
+
+    def _indexar_palavra(self, palavra):
+        for grama in trigramas(palavra):
+            self._gramas.setdefault(grama, set()).add(palavra)
+
+    def _montar(self, textos):
+        self._textos = textos
+        self._palavras, self._gramas = {}, {}
+        titulos = []
+        for titulo, url, chave in textos.values():
+            titulos.append((titulo, chave))
+            for palavra in set(titulo.split()) | set(url.split()):
+                chaves = self._palavras.get(palavra)
+                if chaves is None:
+                    self._palavras[palavra] = [chave]
+                else:
+                    chaves.append(chave)
+        for palavra, chaves in self._palavras.items():
+            chaves.sort()
+            self._indexar_palavra(palavra)
+        titulos.sort()
+        self._titulos = titulos
+        self._obsoletos = 0
+        self._pronto = True
+
+    def _garantir(self):
+        if not self._pronto:
+            textos = {}
+            for item in self._itens:
+                titulo, url, chave = self._preparar(item)
+                textos[item['id']] = (titulo, url, chave)
+            self._montar(textos)
+        elif self._obsoletos > max(1000, len(self._textos) // 4):
+            self._montar(self._textos)
+
+    # ---------- busca ----------
+
+    def _palavras_com(self, termo):
+        """Palavras do vocabulário que casam com `termo` (regra de `_contem`)."""
+        if len(termo) >= 3:
+            conjuntos = [self._gramas.get(termo[i:i + 3], set()) for i in range(len(termo) - 2)]
+            candidatas = set.intersection(*sorted(conjuntos, key=len))
+            return [p for p in candidatas if termo in p]
+        # Palavras curtas: só o início da palavra (trigrama ' xy')
+        return [p for p in self._gramas.get(' ' + termo, ()) if p.startswith(termo)]
+
+    def _com_prefixo(self, frase):
+        inicio = bisect_left(self._titulos, (frase,))
+        # Todo título que começa com `frase` é menor que `frase` + o maior caractere
+        fim = bisect_left(self._titulos, (frase + '\U0010ffff',), inicio)
+        # Pode incluir entradas obsoletas: a busca só deixa de parar mais cedo
+        return fim - inicio
+
+    def sugerir(self, consulta, limite=LIMITE_PADRAO):
+        """IDs das `limite` planilhas que melhor casam com `consulta`, em ordem."""
+        preparada = preparar_consulta(consulta)
+        if preparada is None:
+            return []
+        frase, palavras = preparada
+        self._garantir()
+        # A palavra digitada mais seletiva define os candidatos
+        melhores = None
+        # Limite superior dos níveis 0 e 1: planilhas com alguma palavra que
+        # começa com o termo (para cada termo; vale o menor)
+        maximo_nivel_1 = None
+        for termo in palavras:
+            if len(termo) < 2:
+                continue
+            encontradas = self._palavras_com(termo)
+            listas = [self._palavras[p] for p in encontradas]
+            if melhores is None or sum(map(len, listas)) < sum(map(len, melhores)):
+                melhores = listas
+            com_inicio = sum(len(self._palavras[p]) for p in encontradas if p.startswith(termo))
+            maximo_nivel_1 = com_inicio if maximo_nivel_1 is None else min(maximo_nivel_1, com_inicio)
+        if not melhores:
+            return []
+
+        # Em ordem de chave cada nível já sai ordenado
+        niveis = ([], [], [], [])
+        total_nivel_0 = self._com_prefixo(frase)
+        anterior = None
+        for verificados, chave in enumerate(heapq.merge(*melhores)):
+            if verificados >= MAXIMO_VERIFICACOES:
+                break
+            if chave == anterior:
+                continue  # a mesma planilha em mais de uma palavra
+            anterior = chave
+            textos = self._textos.get(chave[1])
+            if textos is None or textos[2] != chave:
+                continue  # entrada obsoleta (planilha removida ou alterada)
+            n = nivel(textos[0], textos[1], frase, palavras)
+            if n is None or len(niveis[n]) >= limite:
+                continue
+            niveis[n].append(chave[1])
+            # Daqui em diante nada supera o que já foi encontrado
+            if len(niveis[0]) >= limite:
+                break
+            if len(niveis[0]) >= total_nivel_0:
+                acima = len(niveis[0]) + len(niveis[1])
+                if acima >= limite or (acima >= maximo_nivel_1 and acima + len(niveis[2]) >= limite):
+                    break
+        return [item_id for ids in niveis for item_id in ids][:limite]
+
+
+def _inserir_ordenado(lista, valor):
+    i = bisect_left(lista, valor)
+    if i == len(lista) or lista[i] != valor:
+        lista.insert(i, valor)
+
+
+# ==================== BANCO DE DADOS ====================
+# Os dois bancos expõem a função SQL `busca_normalizar(texto)`, equivalente a
+# `normalizar`, usada nas consultas e, no PostgreSQL, nos índices GIN de
+# trigramas que atendem `LIKE '%termo%'`.
+
+DDL_POSTGRESQL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE EXTENSION IF NOT EXISTS unaccent',
+    # unaccent() não é IMMUTABLE (depende do search_path): o invólucro fixa o
+    # dicionário para poder ser usado num índice
+    "CREATE OR REPLACE FUNCTION busca_normalizar(texto text) RETURNS text "
+    "AS $$ SELECT btrim(regexp_replace(lower(public.unaccent('public.unaccent'::regdictionary, texto)), "
+    "'[^[:alnum:]]+', ' ', 'g')) $$ "
+    "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT",
+    'CREATE INDEX IF NOT EXISTS ix_planilhas_titulo_trgm ON planilhas '
+    'USING gin (busca_normalizar(titulo) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_planilhas_url_trgm ON planilhas '
+    'USING gin (busca_normalizar(url) gin_trgm_ops)',
+)
+
+
+def registrar_sqlite(conexao):
+    """Registra `busca_normalizar` numa conexão sqlite3 (evento `connect`)."""
+    conexao.create_function('busca_normalizar', 1, lambda texto: normalizar(texto) if texto is not None else None,
+                            deterministic=True)
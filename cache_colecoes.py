@@ -0,0 +1,203 @@
+"""Cache em memória (read-through) das coleções de planilhas e categorias.
+
+Cada coleção guarda um snapshot da lista carregada, identificado por um
+número de versão que é incrementado a cada invalidação. Corpos já
+serializados (ex.: a resposta JSON de `GET /api/planilhas`) ficam
+guardados junto com o snapshot, acompanhados do ETag calculado a partir
+do conteúdo, e são descartados quando a versão muda. O mesmo vale para as
+versões comprimidas (gzip/brotli) desses corpos.
+"""
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+from compressao import codificar
+
+
+def calcular_etag(corpo):
+    """ETag forte (sem aspas) derivado do conteúdo serializado."""
+    if isinstance(corpo, str):
+        corpo = corpo.encode('utf-8')
+    return hashlib.sha1(corpo).hexdigest()
+
+
+def _agora_em_segundos():
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+class CacheColecao:
+    """Snapshot versionado de uma coleção, seguro para uso entre threads.
+
+    `carregar` é chamado apenas em caso de falha (cache vazio ou
+    invalidado). `assinatura`, se fornecida, é consultada a cada leitura e,
+    quando muda (ex.: mtime do arquivo JSON alterado por outro processo),
+    força uma nova carga.
+
+    Os objetos retornados são compartilhados entre requisições e não devem
+    ser alterados por quem os lê.
+    """
+
+    def __init__(self, nome, carregar, assinatura=None):
+        self.nome = nome
+        self._carregar = carregar
+        self._assinatura = assinatura
+        self._lock = threading.RLock()
+        self._versao = 1
+        self._dados = None
+        self._indice = None
+        self._assinatura_dados = None
+        self._corpos = {}
+        self._derivados = {}
+        self._modificado_em = _agora_em_segundos()
+        self.acertos = 0
+        self.falhas = 0
+
+    @property
+    def versao(self):
+        # Sem o lock: não espera por uma carga em andamento (a leitura de um
+        # int é atômica)
+        return self._versao
+
+    @property
+    def modificado_em(self):
+        """Instante (UTC, resolução de segundos) em que a versão atual passou a valer."""
+        with self._lock:
+            return self._modificado_em
+
+    def _garantir(self):
+        # Chamado com o lock adquirido
+        assinatura = self._assinatura() if self._assinatura else None
+        if self._dados is not None and assinatura == self._assinatura_dados:
+            self.acertos += 1
+            return
+        if self._dados is not None:
+            # Alterado por fora (outro processo): conta como nova versão
+            self._descartar()
+        self.falhas += 1
+        self._dados = self._carregar()
+        self._assinatura_dados = assinatura
+
+    def _descartar(self):
+        self._versao += 1
+        self._dados = None
+        self._indice = None
+        self._corpos = {}
+        self._derivados = {}
+        # Instante real da invalidação (nunca adiantado em relação ao relógio,
+        # o que violaria o Date da resposta). Duas versões no mesmo segundo
+        # compartilham o Last-Modified; quem distingue as duas é o ETag.
+        self._modificado_em = max(_agora_em_segundos(), self._modificado_em)
+
+    def obter(self):
+        """Retorna a lista completa da versão atual."""
+        with self._lock:
+            self._garantir()
+            return self._dados
+
+    def obter_versionado(self):
+        """Retorna `(versao, dados)` de forma consistente."""
+        with self._lock:
+            self._garantir()
+            return self._versao, self._dados
+
+    def _item(self, item_id):
+        # Chamado com o lock adquirido e os dados garantidos
+        if self._indice is None:
+            self._indice = {item['id']: item for item in self._dados}
+        return self._indice.get(item_id)
+
+    def obter_por_id(self, item_id):
+        """Busca um item pelo campo `id` usando um índice montado por versão."""
+        with self._lock:
+            self._garantir()
+            return self._item(item_id)
+
+    def obter_por_ids(self, ids):
+        """Itens com os `ids` informados, na mesma ordem (os ausentes ficam de
+        fora), numa única leitura do cache."""
+        with self._lock:
+            self._garantir()
+            return [item for item in map(self._item, ids) if item is not None]
+
+    def derivado(self, chave, construir):
+        """Estrutura derivada dos dados (ex.: índices), construída uma vez por versão.
+
+        `construir(dados)` deve retornar um objeto autocontido: quem o recebe
+        pode continuar usando-o mesmo depois de uma invalidação.
+        """
+        with self._lock:
+            self._garantir()
+            valor = self._derivados.get(chave)
+            if valor is None:
+                valor = construir(self._dados)
+                self._derivados[chave] = valor
+            return valor
+
+    def corpo(self, chave, serializar):
+        """Retorna o corpo serializado de `chave` para a versão atual.
+
+        `serializar(dados)` só é chamado uma vez por versão e por chave.
+        """
+        return self.representacao(chave, serializar)[0]
+
+    def representacao(self, chave, serializar, codificacao=None):
+        """Retorna `(corpo, etag, modificado_em, codificacao)` de `chave` para a versão atual.
+
+        Os valores são lidos sob o mesmo lock, portanto sempre correspondem
+        à mesma versão. Com `codificacao` ('gzip' ou 'br'), o corpo vem
+        comprimido (uma vez por versão) se passar do limiar de compressão;
+        o último valor indica a codificação aplicada, ou None.
+        """
+        with self._lock:
+            self._garantir()
+            entrada = self._corpos.get(chave)
+            if entrada is None:
+                corpo = serializar(self._dados)
+                entrada = (corpo, calcular_etag(corpo))
+                self._corpos[chave] = entrada
+            return self._codificada(chave, entrada, codificacao)
+
+    def representacao_item(self, item_id, serializar, codificacao=None):
+        """Como `representacao`, para um único item: `serializar(item)`.
+
+        Retorna `(None, None, modificado_em, None)` se o item não existir.
+        """
+        with self._lock:
+            self._garantir()
+            chave = ('item', item_id)
+            entrada = self._corpos.get(chave)
+            if entrada is None:
+                item = self._item(item_id)
+                if item is None:
+                    return None, None, self._modificado_em, None
+                corpo = serializar(item)
+                entrada = (corpo, calcular_etag(corpo))
+                self._corpos[chave] = entrada
+            return self._codificada(chave, entrada, codificacao)
+
+    def _codificada(self, chave, entrada, codificacao):
+        # Chamado com o lock adquirido
+        if codificacao is not None:
+            chave_codificada = (chave, codificacao)
+            comprimida = self._corpos.get(chave_codificada)
+            if comprimida is None:
+                comprimida = codificar(entrada[0], entrada[1], codificacao)
+                self._corpos[chave_codificada] = comprimida
+            return comprimida[0], comprimida[1], self._modificado_em, comprimida[2]
+        return entrada[0], entrada[1], self._modificado_em, None
+
+    def invalidar(self):
+        """Descarta o snapshot atual; a próxima leitura recarrega os dados."""
+        with self._lock:
+            self._descartar()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'versao': self._versao,
+                'carregado': self._dados is not None,
+                'itens': len(self._dados) if self._dados is not None else 0,
+                'corpos_serializados': len(self._corpos),
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+            }
@@ -0,0 +1,109 @@
+"""Compressão negociada (brotli/gzip) das respostas JSON.
+
+A codificação é escolhida pelo cabeçalho `Accept-Encoding` do cliente,
+preferindo brotli (se o pacote `brotli` estiver instalado) e depois gzip.
+Corpos menores que `LIMIAR` bytes (`COMPRESSAO_LIMIAR`, padrão 1024) vão
+sem compressão: o ganho não compensa o custo.
+
+As listagens em cache comprimem uma vez por versão (ver
+`CacheColecao.representacao`); as demais respostas JSON são comprimidas no
+`after_request` instalado por `instalar`.
+"""
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # sem brotli: só gzip
+    brotli = None
+
+LIMIAR = int(os.environ.get('COMPRESSAO_LIMIAR', '1024'))
+# Em ordem de preferência quando o cliente aceita as duas com o mesmo peso
+CODIFICACOES = ('br', 'gzip') if brotli is not None else ('gzip',)
+TIPOS_COMPRESSIVEIS = ('application/json', 'application/x-ndjson', 'text/plain')
+
+
+def negociar(accept_encoding):
+    """Melhor codificação aceita pelo cliente, ou None (identidade)."""
+    if not accept_encoding:
+        return None
+    pesos = {}
+    for parte in accept_encoding.split(','):
+        nome, _, parametros = parte.strip().partition(';')
+        nome = nome.strip().lower()
+        peso = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                peso = float(parametros[2:])
+            except ValueError:
+                peso = 0.0
+        if nome:
+            pesos[nome] = peso
+    curinga = pesos.get('*', 0.0)
+    candidatas = [(pesos.get(c, curinga), -i, c) for i, c in enumerate(CODIFICACOES)]
+    peso, _, codificacao = max(candidatas)
+    return codificacao if peso > 0 else None
+
+
+def comprimir(corpo, codificacao):
+    if isinstance(corpo, str):
+        corpo = corpo.encode('utf-8')
+    if codificacao == 'br':
+        return brotli.compress(corpo, quality=5)
+    if codificacao == 'gzip':
+        # mtime fixo: o mesmo corpo gera sempre os mesmos bytes
+        return gzip.compress(corpo, compresslevel=6, mtime=0)
+    raise ValueError(f'Codificação não suportada: {codificacao}')
+
+
+def vale_comprimir(corpo):
+    return len(corpo) >= LIMIAR
+
+
+def codificar(corpo, etag, codificacao):
+    """Representação comprimida de `corpo`: `(corpo, etag, codificacao)`.
+
+    Sem `codificacao` (ou com um corpo pequeno) devolve o corpo original e
+    `codificacao` None. O ETag da versão comprimida recebe o sufixo
+    `-<codificacao>`, para não se confundir com o da versão sem compressão.
+    """
+    if codificacao is None or not vale_comprimir(corpo):
+        return corpo, etag, None
+    return comprimir(corpo, codificacao), f'{etag}-{codificacao}', codificacao
+
+
+def _compressivel(resposta):
+    return (
+        resposta.status_code == 200
+        and not resposta.direct_passthrough
+        and not resposta.is_streamed
+        and 'Content-Encoding' not in resposta.headers
+        and resposta.mimetype in TIPOS_COMPRESSIVEIS
+    )
+
+
+def instalar(app):
+    """Comprime no `after_request` as respostas JSON que ainda não vieram comprimidas."""
+
+    @app.after_request
+    def _comprimir_resposta(resposta):
+        if not _compressivel(resposta):
+            return resposta
+        resposta.vary.add('Accept-Encoding')
+        codificacao = negociar(request.headers.get('Accept-Encoding'))
+        if codificacao is None:
+            return resposta
+        corpo = resposta.get_data()
+        if not vale_comprimir(corpo):
+            return resposta
+        resposta.set_data(comprimir(corpo, codificacao))
+        resposta.headers['Content-Encoding'] = codificacao
+        # Cada codificação é uma representação diferente: ETag próprio
+        etag, fraco = resposta.get_etag()
+        if etag:
+            resposta.set_etag(f'{etag}-{codificacao}', weak=fraco)
+        return resposta
+
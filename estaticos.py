@@ -0,0 +1,159 @@
+"""Entrega do front-end embutido (`static/`) com fingerprint e pré-compressão.
+
+No primeiro acesso cada arquivo de `static/` (menos o `index.html`) ganha um
+nome com o hash do conteúdo, servido em `/assets/`:
+
+    /app.js        ->  /assets/app.3f2a9c1b7e.js
+    /img/Logo.png  ->  /assets/img/Logo.9d41c07a22.png
+
+As referências `src`/`href` do `index.html` são reescritas para esses nomes.
+Como o nome muda sempre que o conteúdo muda, os arquivos com hash são
+servidos com `Cache-Control: immutable` e um ano de validade; só o
+`index.html` é revalidado (ETag, resposta 304). Uma visita repetida custa
+uma requisição pequena em vez de baixar tudo de novo.
+
+Arquivos de texto (JS, CSS, SVG, HTML) têm versões gzip/brotli geradas
+uma única vez, na montagem do manifesto, e escolhidas pelo `Accept-Encoding`. Os caminhos
+originais (`/app.js`, `/img/...`) continuam funcionando pela rota estática
+padrão do Flask.
+
+Em desenvolvimento, uma alteração em `static/` é detectada no próximo
+acesso ao `index.html` e o manifesto é refeito.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response, abort, request
+
+from cache_colecoes import calcular_etag
+from compressao import CODIFICACOES, comprimir, negociar
+
+PREFIXO = '/assets/'
+UM_ANO = 365 * 24 * 3600
+EXTENSOES_TEXTO = ('.js', '.css', '.svg', '.html', '.json', '.txt')
+# Só vale guardar a versão comprimida se ela economizar pelo menos isso
+GANHO_MINIMO = 0.9
+
+_REFERENCIA = re.compile(r'''(?P<atributo>\b(?:src|href)\s*=\s*)(?P<aspas>["'])(?P<caminho>/[^"'?#]*)(?:\?[^"'#]*)?(?P=aspas)''')
+
+
+class _Ativo:
+    __slots__ = ('conteudo', 'mimetype', 'etag', 'variantes')
+
+    def __init__(self, conteudo, mimetype, comprimivel):
+        self.conteudo = conteudo
+        self.mimetype = mimetype
+        self.etag = calcular_etag(conteudo)
+        # codificacao -> corpo comprimido
+        self.variantes = {}
+        if comprimivel:
+            for codificacao in CODIFICACOES:
+                comprimido = comprimir(conteudo, codificacao)
+                if len(comprimido) <= len(conteudo) * GANHO_MINIMO:
+                    self.variantes[codificacao] = comprimido
+
+    def resposta(self, cache_control):
+        codificacao = negociar(request.headers.get('Accept-Encoding'))
+        corpo = self.variantes.get(codificacao) if codificacao else None
+        resposta = Response(corpo if corpo is not None else self.conteudo, mimetype=self.mimetype)
+        if corpo is not None:
+            resposta.headers['Content-Encoding'] = codificacao
+            resposta.set_etag(f'{self.etag}-{codificacao}')
+        else:
+            resposta.set_etag(self.etag)
+        if self.variantes:
+            resposta.vary.add('Accept-Encoding')
+        resposta.headers['Cache-Control'] = cache_control
+        return resposta.make_conditional(request)
+
+
+class PipelineEstaticos:
+    """Manifesto (caminho original -> caminho com hash) e conteúdo em memória."""
+
+    def __init__(self, diretorio, pagina='index.html'):
+        self.diretorio = diretorio
+        self.pagina = pagina
+        self._lock = threading.Lock()
+        self._assinatura = None
+        self.manifesto = {}
+        self._ativos = {}
+        self._indice = None
+        # Montado no primeiro acesso (`atualizar`), não ao criar a aplicação
+
+    def _arquivos(self):
+        for raiz, _, nomes in os.walk(self.diretorio):
+            for nome in sorted(nomes):
+                if nome.startswith('.'):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                yield os.path.relpath(caminho, self.diretorio).replace(os.sep, '/'), caminho
+
+    def _assinatura_atual(self):
+        assinatura = []
+        for relativo, caminho in self._arquivos():
+            st = os.stat(caminho)
+            assinatura.append((relativo, st.st_mtime_ns, st.st_size))
+        return tuple(assinatura)
+
+    def atualizar(self):
+        """Refaz manifesto, conteúdos e `index.html` se algo mudou em disco."""
+        assinatura = self._assinatura_atual()
+        with self._lock:
+            if assinatura == self._assinatura:
+                return
+            manifesto, ativos = {}, {}
+            pagina = None
+            for relativo, caminho in self._arquivos():
+                with open(caminho, 'rb') as f:
+                    conteudo = f.read()
+                if relativo == self.pagina:
+                    pagina = conteudo
+                    continue
+                base, extensao = os.path.splitext(relativo)
+                hash_conteudo = hashlib.sha256(conteudo).hexdigest()[:10]
+                nome = f'{base}.{hash_conteudo}{extensao}'
+                mimetype = mimetypes.guess_type(relativo)[0] or 'application/octet-stream'
+                manifesto['/' + relativo] = PREFIXO + nome
+                ativos[nome] = _Ativo(conteudo, mimetype, extensao.lower() in EXTENSOES_TEXTO)
+            self.manifesto = manifesto
+            self._ativos = ativos
+            self._indice = None
+            if pagina is not None:
+                self._indice = _Ativo(self.reescrever(pagina.decode('utf-8')).encode('utf-8'),
+                                      'text/html', True)
+            self._assinatura = assinatura
+
+    def reescrever(self, html):
+        """Troca as referências a arquivos conhecidos pelos nomes com hash."""
+        def trocar(m):
+            destino = self.manifesto.get(m.group('caminho'))
+            if destino is None:
+                return m.group(0)
+            return f'{m.group("atributo")}{m.group("aspas")}{destino}{m.group("aspas")}'
+        return _REFERENCIA.sub(trocar, html)
+
+    def _garantir(self):
+        if self._assinatura is None:
+            self.atualizar()
+
+    def url(self, caminho):
+        """Caminho com hash de um arquivo de `static/` (ex.: '/app.js')."""
+        self._garantir()
+        return self.manifesto.get(caminho, caminho)
+
+    def resposta_indice(self):
+        self.atualizar()
+        if self._indice is None:
+            abort(404)
+        # no-cache: o navegador guarda, mas revalida (ETag) a cada visita
+        return self._indice.resposta('no-cache')
+
+    def resposta_ativo(self, nome):
+        self._garantir()
+        ativo = self._ativos.get(nome)
+        if ativo is None:
+            abort(404)
+        return ativo.resposta(f'public, max-age={UM_ANO}, immutable')
@@ -0,0 +1,115 @@
+"""Fila de mensagens para distribuir eventos Socket.IO entre workers/processos.
+
+Com mais de um worker, cada processo só conhece os próprios clientes
+WebSocket. Configurando `SOCKETIO_MESSAGE_QUEUE`, os `emit` passam por uma
+fila compartilhada e todo worker repassa o evento aos seus clientes:
+
+- `redis://...`, `amqp://...` etc.: filas suportadas pelo próprio
+  python-socketio (exigem os pacotes `redis` ou `kombu`);
+- `sqlite:///caminho/fila.db`: `GerenciadorSQLite`, implementado aqui, que
+  usa um arquivo SQLite em modo WAL como fila. Não precisa de nenhum
+  serviço externo e serve para vários workers na mesma máquina (e para
+  testes).
+"""
+import json
+import sqlite3
+import threading
+import time
+
+import socketio
+
+PREFIXO_SQLITE = 'sqlite:///'
+
+
+class GerenciadorSQLite(socketio.PubSubManager):
+    """`PubSubManager` do python-socketio apoiado numa tabela SQLite.
+
+    Cada `emit` vira uma linha; cada processo consulta periodicamente as
+    linhas com id maior que a última lida. Mensagens mais antigas que
+    `retencao` segundos são apagadas por quem publica.
+    """
+    name = 'sqlite'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None,
+                 intervalo=0.05, retencao=60.0):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.caminho = url[len(PREFIXO_SQLITE):] if url.startswith(PREFIXO_SQLITE) else url
+        self.intervalo = intervalo
+        self.retencao = retencao
+        self._local = threading.local()
+        self._ultima_limpeza = 0.0
+        with self._conexao() as conexao:
+            conexao.execute(
+                'CREATE TABLE IF NOT EXISTS socketio_mensagens ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' canal TEXT NOT NULL,'
+                ' dados TEXT NOT NULL,'
+                ' criado_em REAL NOT NULL)'
+            )
+
+    def _conexao(self):
+        # sqlite3 não compartilha conexões entre threads: uma por thread
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexao = conexao
+        return conexao
+
+    def _publish(self, data):
+        agora = time.time()
+        conexao = self._conexao()
+        conexao.execute(
+            'INSERT INTO socketio_mensagens (canal, dados, criado_em) VALUES (?, ?, ?)',
+            (self.channel, json.dumps(data), agora),
+        )
+        if agora - self._ultima_limpeza > self.retencao:
+            self._ultima_limpeza = agora
+            conexao.execute('DELETE FROM socketio_mensagens WHERE criado_em < ?', (agora - self.retencao,))
+
+    def _listen(self):
+        conexao = self._conexao()
+        ultimo = conexao.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_mensagens').fetchone()[0]
+        while True:
+            linhas = conexao.execute(
+                'SELECT id, dados FROM socketio_mensagens WHERE id > ? AND canal = ? ORDER BY id',
+                (ultimo, self.channel),
+            ).fetchall()
+            for ultimo, dados in linhas:
+                yield json.loads(dados)
+            if not linhas:
+                self.server.sleep(self.intervalo)
+
+
+def opcoes_fila(url):
+    """Argumentos para `SocketIO(...)` conforme a URL da fila (vazia = sem fila)."""
+    if not url:
+        return {}
+    if url.startswith(PREFIXO_SQLITE):
+        return {'client_manager': GerenciadorSQLite(url)}
+    return {'message_queue': url}
+
+
+def observar_emissoes(servidor, evento, callback):
+    """Chama `callback(dados)` para cada `evento` entregue por este processo,
+    inclusive os vindos de outros workers pela fila.
+
+    Só tem efeito com um `PubSubManager` (fila configurada). O python-socketio
+    só começa a escutar a fila quando o primeiro cliente conecta; aqui a
+    escuta começa já, para que um worker sem clientes também seja avisado.
+    """
+    gerenciador = servidor.manager
+    if not isinstance(gerenciador, socketio.PubSubManager):
+        return
+    original = gerenciador._handle_emit
+
+    def _handle_emit(message):
+        if message.get('event') == evento:
+            callback(message.get('data'))
+        original(message)
+
+    gerenciador._handle_emit = _handle_emit
+    if not servidor.manager_initialized:
+        servidor.manager_initialized = True
+        gerenciador.initialize()
@@ -1,125 +1,171 @@
 
 # ==================== IMPORTS E APP ====================
-from flask import Flask, request, jsonify, Response, send_from_directory, render_template_string
+from flask import Blueprint, Flask, current_app, request, jsonify, Response, render_template_string, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from flask_socketio import SocketIO
+from sqlalchemy.exc import SQLAlchemyError
+from flask_socketio import SocketIO, emit, join_room
 import json
 import os
-from datetime import datetime
+from bisect import bisect_right
+from datetime import datetime, timezone
 import functools
 
+from armazenamento_json import ArquivoJSON
+import armazenamento_sqlite
+import busca
+from cache_colecoes import CacheColecao, calcular_etag
+from compressao import codificar, instalar as instalar_compressao, negociar
+from estaticos import PipelineEstaticos
+from fila_mensagens import observar_emissoes, opcoes_fila
+import replicas
+from migracoes import comando_migrar, criar_engine as criar_engine_migracoes, migrar
+from metricas import PoolMedido, instrumentar_app, instrumentar_socketio, instrumentar_sqlalchemy
+from serializacao import JSON_SOCKETIO, ProvedorJSON, carregar, para_bytes
+from sobrecarga import coalescer, instalar as instalar_sobrecarga
+from transmissao import SALA_DELTA, SALA_LEGADO, AgendadorTransmissao
+
 CORS_ORIGINS = '*'
-app = Flask(__name__, static_folder='static', static_url_path='')
-CORS(app)
+
+# A aplicação é montada por `create_app()` (fim do arquivo). Este módulo só
+# declara as extensões, os modelos e as rotas; nada aqui conecta ao banco.
+# `main.app` continua disponível (gunicorn main:app, servidor.py) e é criada
+# no primeiro acesso.
 
 # ==================== CONFIGURAÇÃO DO BANCO ====================
 
 import urllib.parse
 
-database_url = os.environ.get('DATABASE_URL')
-
-if database_url and database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
+# DATABASE_URL (PostgreSQL) ou ARMAZENAMENTO=sqlite (arquivo SQLITE_PATH, ver
+# armazenamento_sqlite.py); sem nenhum dos dois, arquivos JSON
+database_url = armazenamento_sqlite.url_configurada()
 
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Configuração de Pool de Conexões para melhor performance
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_size': 10,
-    'pool_recycle': 3600,
-    'pool_pre_ping': True,
-    'max_overflow': 20,
-}
+# Detecta se devemos usar o banco de dados
+USING_DB = bool(database_url)
 
-db = SQLAlchemy(app)
+# Ligada à aplicação em create_app (só com banco: sem URL o Flask-SQLAlchemy
+# 3.x recusa inicializar e a aplicação usa os arquivos JSON).
+# O esquema é criado pelas migrações (migracoes.py), não no import. A sessão
+# manda as leituras das requisições GET às réplicas, se houver (ver replicas.py).
+db = SQLAlchemy(session_options={'class_': replicas.SessaoRoteada})
 
 # ==================== SOCKET ====================
 
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# Ligado à aplicação em create_app (ver lá as opções de fila e modo assíncrono)
+socketio = SocketIO()
+
+# Alterações são agrupadas e enviadas em segundo plano (ver transmissao.py)
+transmissao = AgendadorTransmissao(socketio, janela=float(os.environ.get('SOCKET_JANELA', '0.05')))
+instrumentar_socketio(socketio)
+
+# Rotas HTTP da aplicação, registradas em create_app
+rotas = Blueprint('dashboards', __name__)
+
+
+@socketio.on('connect')
+def socket_conectar():
+    # Clientes novos pedem o protocolo delta; os demais recebem os eventos antigos
+    if request.args.get('protocolo') == 'delta':
+        join_room(SALA_DELTA)
+        emit('estado', transmissao.estado())
+    else:
+        join_room(SALA_LEGADO)
+
+
+@socketio.on('ressincronizar')
+def socket_ressincronizar(dados):
+    """Reenvia as mensagens perdidas desde `dados['desde']` ou pede recarga completa."""
+    dados = dados or {}
+    mensagens = transmissao.mensagens_desde(dados.get('epoca'), dados.get('desde'))
+    if mensagens is None:
+        emit('ressincronizacao', {'completo': True, **transmissao.estado()})
+    else:
+        emit('ressincronizacao', {'completo': False, 'epoca': dados.get('epoca'), 'mensagens': mensagens})
+
+# ======= MODELS (usados quando USING_DB == True) =======
+planilha_categoria = db.Table(
+    'planilha_categoria',
+    db.Column('planilha_id', db.Integer, db.ForeignKey('planilhas.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('categoria_id', db.Integer, db.ForeignKey('categorias.id', ondelete='CASCADE'), primary_key=True),
+    # A PK cobre buscas por planilha; este índice cobre o filtro por categoria
+    db.Index('ix_planilha_categoria_categoria_id', 'categoria_id', 'planilha_id')
+)
+
+class Categoria(db.Model):
+    __tablename__ = 'categorias'
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String(255), nullable=False)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    atualizado_em = db.Column(db.DateTime, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'nome': self.nome,
+            'criado_em': self.criado_em.isoformat() if self.criado_em else None,
+            'atualizado_em': self.atualizado_em.isoformat() if self.atualizado_em else None
+        }
 
-# Detecta se devemos usar o banco de dados (DATABASE_URL fornecido)
-USING_DB = bool(database_url)
+class Planilha(db.Model):
+    __tablename__ = 'planilhas'
+    id = db.Column(db.Integer, primary_key=True)
+    titulo = db.Column(db.String(255), nullable=False)
+    url = db.Column(db.String(2048), nullable=False)
+    imagem = db.Column(db.String(2048), nullable=True)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    atualizado_em = db.Column(db.DateTime, onupdate=datetime.utcnow, index=True)
+    categorias = db.relationship('Categoria', secondary=planilha_categoria, lazy='select', backref=db.backref('planilhas', lazy=True))
+
+    def to_dict(self, categoria_ids=None):
+        """Serializa a planilha. Quem já tem os IDs das categorias (ex.: listagem
+        carregada em lote) deve passá-los em `categoria_ids`, evitando uma
+        consulta extra por planilha."""
+        if categoria_ids is None:
+            categoria_ids = [c.id for c in self.categorias]
+        return {
+            'id': self.id,
+            'titulo': self.titulo,
+            'url': self.url,
+            'imagem': self.imagem,
+            'criado_em': self.criado_em.isoformat() if self.criado_em else None,
+            'atualizado_em': self.atualizado_em.isoformat() if self.atualizado_em else None,
+            'categorias': list(categoria_ids)
+        }
 
-# ======= MODELS (quando USING_DB == True) =======
-if USING_DB:
-    planilha_categoria = db.Table(
-        'planilha_categoria',
-        db.Column('planilha_id', db.Integer, db.ForeignKey('planilhas.id', ondelete='CASCADE'), primary_key=True),
-        db.Column('categoria_id', db.Integer, db.ForeignKey('categorias.id', ondelete='CASCADE'), primary_key=True)
-    )
+# ==================== FRONTEND ====================
+# Arquivos de static/ com hash no nome, pré-comprimidos (ver estaticos.py);
+# o manifesto é montado no primeiro acesso, não na inicialização
+estaticos = PipelineEstaticos(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
 
-    class Categoria(db.Model):
-        __tablename__ = 'categorias'
-        id = db.Column(db.Integer, primary_key=True)
-        nome = db.Column(db.String(255), nullable=False)
-        criado_em = db.Column(db.DateTime, default=datetime.utcnow)
-        atualizado_em = db.Column(db.DateTime, onupdate=datetime.utcnow)
-
-        def to_dict(self):
-            return {
-                'id': self.id,
-                'nome': self.nome,
-                'criado_em': self.criado_em.isoformat() if self.criado_em else None,
-                'atualizado_em': self.atualizado_em.isoformat() if self.atualizado_em else None
-            }
-
-    class Planilha(db.Model):
-        __tablename__ = 'planilhas'
-        id = db.Column(db.Integer, primary_key=True)
-        titulo = db.Column(db.String(255), nullable=False)
-        url = db.Column(db.String(2048), nullable=False)
-        imagem = db.Column(db.String(2048), nullable=True)
-        criado_em = db.Column(db.DateTime, default=datetime.utcnow)
-        atualizado_em = db.Column(db.DateTime, onupdate=datetime.utcnow)
-        categorias = db.relationship('Categoria', secondary=planilha_categoria, lazy='subquery', backref=db.backref('planilhas', lazy=True))
-
-        def to_dict(self):
-            return {
-                'id': self.id,
-                'titulo': self.titulo,
-                'url': self.url,
-                'imagem': self.imagem,
-                'criado_em': self.criado_em.isoformat() if self.criado_em else None,
-                'atualizado_em': self.atualizado_em.isoformat() if self.atualizado_em else None,
-                'categorias': [c.id for c in self.categorias]
-            }
-
-    # Cria as tabelas automaticamente (seguro na inicialização)
-    with app.app_context():
-        db.create_all()
 
-# ==================== FRONTEND ====================
-# Rota para servir a página principal
-@app.route('/')
+# Rota para servir a página principal (referências reescritas para /assets/)
+@rotas.route('/')
 def index():
-    return send_from_directory(app.static_folder, 'index.html')
+    return estaticos.resposta_indice()
+
+
+# Arquivos com hash no nome: cache de um ano, imutável
+@rotas.route('/assets/<path:nome>')
+def ativo_estatico(nome):
+    return estaticos.resposta_ativo(nome)
 
 # ========== Associação de Planilha a Categoria ==========
 
 # PUT - Atualizar categorias de uma planilha
-@app.route('/api/planilhas/<int:planilha_id>/categorias', methods=['PUT'])
+@rotas.route('/api/planilhas/<int:planilha_id>/categorias', methods=['PUT'])
 def atualizar_categorias_planilha(planilha_id):
     """Atualiza as categorias associadas a uma planilha"""
     try:
-        planilhas = carregar_planilhas()
-        categorias = carregar_categorias()
-        idx = next((i for i, p in enumerate(planilhas) if p['id'] == planilha_id), None)
-        if idx is None:
-            return jsonify({'sucesso': False, 'mensagem': f'Planilha com ID {planilha_id} não encontrada'}), 404
         body = request.get_json()
         if not body or 'categorias' not in body or not isinstance(body['categorias'], list):
             return jsonify({'sucesso': False, 'mensagem': 'É necessário fornecer uma lista de IDs de categorias'}), 400
-        # Filtra apenas categorias existentes
-        ids_validos = [c['id'] for c in categorias]
-        novas_categorias = [cid for cid in body['categorias'] if cid in ids_validos]
-        planilhas[idx]['categorias'] = novas_categorias
-        planilhas[idx]['atualizado_em'] = datetime.now().isoformat()
-        salvar_planilhas(planilhas)
+        # Apenas categorias existentes são associadas; no banco só a diferença é gravada
+        planilha = definir_categorias_planilha(planilha_id, body['categorias'])
+        if planilha is None:
+            return jsonify({'sucesso': False, 'mensagem': f'Planilha com ID {planilha_id} não encontrada'}), 404
         # Emitir evento WebSocket para atualizar todos os clientes
-        socketio.emit('planilha_editada', {'dado': planilhas[idx]})
-        return jsonify({'sucesso': True, 'mensagem': 'Categorias da planilha atualizadas', 'dado': planilhas[idx]}), 200
+        transmissao.gravado('planilha', planilha)
+        return jsonify({'sucesso': True, 'mensagem': 'Categorias da planilha atualizadas', 'dado': planilha}), 200
     except Exception as e:
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao atualizar categorias da planilha: {str(e)}'}), 500
 
@@ -129,57 +175,73 @@ def remover_categoria_de_planilhas(categoria_id):
     Remove todas as planilhas associadas à categoria informada.
     Qualquer planilha que contenha esse ID em sua lista de categorias será deletada.
     """
-    planilhas = carregar_planilhas()
-    total_antes = len(planilhas)
-    # Mantém apenas planilhas que NÃO possuem essa categoria
-    planilhas_filtradas = [
-        p for p in planilhas
-        if not ('categorias' in p and categoria_id in p['categorias'])
-    ]
-    if len(planilhas_filtradas) != total_antes:
-        salvar_planilhas(planilhas_filtradas)
-        # Emitir evento WebSocket para atualizar todos os clientes quando planilhas são removidas
-        socketio.emit('planilhas_atualizadas', {})
+    removidas = remover_planilhas_da_categoria(categoria_id)
+    # Emitir evento WebSocket para atualizar todos os clientes quando planilhas são removidas
+    # (uma única entrada com todos os IDs, na mesma mensagem da remoção da categoria)
+    transmissao.removido('planilha', removidas)
 
 
 # ==================== CATEGORIAS ====================
 
-# GET - Listar todas as categorias
-@app.route('/api/categorias', methods=['GET'])
+# GET - Listar todas as categorias (com `?com_contagem=1`, cada uma traz `total_planilhas`)
+@rotas.route('/api/categorias', methods=['GET'])
+@coalescer
 def listar_categorias():
-    categorias = carregar_categorias()
-    return jsonify({'sucesso': True, 'total': len(categorias), 'dados': categorias}), 200
+    try:
+        if request.args.get('com_contagem', '').lower() in ('1', 'true', 'sim'):
+            _, contagens = contar_planilhas_por_categoria()
+            categorias = [{**c, 'total_planilhas': contagens.get(c['id'], 0)} for c in cache_categorias.obter()]
+            return resposta_calculada({'sucesso': True, 'total': len(categorias), 'dados': categorias})
+        return resposta_lista(cache_categorias)
+    except Exception as e:
+        return jsonify({'sucesso': False, 'mensagem': f'Erro ao listar categorias: {str(e)}'}), 500
+
+# GET - Resumo das facetas: quantas planilhas há no total, sem categoria e em cada categoria
+@rotas.route('/api/categorias/resumo', methods=['GET'])
+@coalescer
+def resumo_categorias():
+    try:
+        total, contagens = contar_planilhas_por_categoria()
+        facetas = [
+            {'id': c['id'], 'nome': c.get('nome'), 'total_planilhas': contagens.get(c['id'], 0)}
+            for c in cache_categorias.obter()
+        ]
+        # Mais usadas primeiro; empates pela ordem de criação
+        facetas.sort(key=lambda f: (-f['total_planilhas'], f['id']))
+        return resposta_calculada({
+            'sucesso': True,
+            'total_planilhas': total,
+            'sem_categoria': contagens.get(None, 0),
+            'categorias': facetas
+        })
+    except Exception as e:
+        return jsonify({'sucesso': False, 'mensagem': f'Erro ao resumir categorias: {str(e)}'}), 500
 
 # GET - Obter uma categoria específica
-@app.route('/api/categorias/<int:categoria_id>', methods=['GET'])
+@rotas.route('/api/categorias/<int:categoria_id>', methods=['GET'])
+@coalescer
 def obter_categoria(categoria_id):
-    categorias = carregar_categorias()
-    categoria = next((c for c in categorias if c['id'] == categoria_id), None)
-    if categoria:
-        return jsonify({'sucesso': True, 'dado': categoria}), 200
+    resposta = resposta_item(cache_categorias, categoria_id)
+    if resposta is not None:
+        return resposta
     return jsonify({'sucesso': False, 'mensagem': f'Categoria com ID {categoria_id} não encontrada'}), 404
 
 # POST - Criar uma nova categoria
-@app.route('/api/categorias', methods=['POST'])
+@rotas.route('/api/categorias', methods=['POST'])
 def criar_categoria():
     try:
-        categorias = carregar_categorias()
-        nova = request.get_json()
-        if not nova or 'nome' not in nova:
+        dados = request.get_json()
+        if not dados or 'nome' not in dados:
             return jsonify({'sucesso': False, 'mensagem': 'Nome da categoria é obrigatório'}), 400
-        novo_id = max([c['id'] for c in categorias], default=0) + 1
-        nova['id'] = novo_id
-        nova['criado_em'] = datetime.now().isoformat()
-        categorias.append(nova)
-        salvar_categorias(categorias)
+        nova = inserir_categoria(dados)
         # Emitir evento WebSocket para atualizar todos os clientes
-        socketio.emit('categoria_criada', {'dado': nova})
+        transmissao.gravado('categoria', nova, criado=True)
         return jsonify({'sucesso': True, 'mensagem': 'Categoria criada com sucesso', 'dado': nova}), 201
     except Exception as e:
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao criar categoria: {str(e)}'}), 500
 
 # PUT - Editar uma categoria
-@app.route('/api/categorias/<int:categoria_id>', methods=['PUT'])
+@rotas.route('/api/categorias/<int:categoria_id>', methods=['PUT'])
 def editar_categoria(categoria_id):
     try:
         if USING_DB:
@@ -194,50 +256,62 @@ def editar_categoria(categoria_id):
                 categoria.nome = atualizados['nome']
             categoria.atualizado_em = datetime.utcnow()
             db.session.commit()
-            socketio.emit('categoria_atualizada', {'id': categoria_id, 'dados': categoria.to_dict()})
+            transmissao.gravado('categoria', categoria.to_dict())
             return jsonify({'sucesso': True, 'mensagem': 'Categoria atualizada com sucesso', 'dado': categoria.to_dict()}), 200
         
         # Fallback para arquivos JSON
-        categorias = carregar_categorias()
-        idx = next((i for i, c in enumerate(categorias) if c['id'] == categoria_id), None)
-        if idx is None:
-            return jsonify({'sucesso': False, 'mensagem': f'Categoria com ID {categoria_id} não encontrada'}), 404
-        atualizados = request.get_json()
-        if not atualizados:
-            return jsonify({'sucesso': False, 'mensagem': 'Nenhum dado fornecido para atualização'}), 400
-        categorias[idx].update(atualizados)
-        categorias[idx]['id'] = categoria_id
-        categorias[idx]['atualizado_em'] = datetime.now().isoformat()
-        salvar_categorias(categorias)
+        with arquivo_categorias.transacao() as t:
+            atual = t.obter(categoria_id)
+            if atual is None:
+                return jsonify({'sucesso': False, 'mensagem': f'Categoria com ID {categoria_id} não encontrada'}), 404
+            atualizados = request.get_json()
+            if not atualizados:
+                return jsonify({'sucesso': False, 'mensagem': 'Nenhum dado fornecido para atualização'}), 400
+            categoria = {**atual, **atualizados, 'id': categoria_id, 'atualizado_em': datetime.now().isoformat()}
+            t.gravar(categoria)
         # Emitir evento WebSocket para atualizar todos os clientes
-        socketio.emit('categoria_editada', {'dado': categorias[idx]})
-        return jsonify({'sucesso': True, 'mensagem': 'Categoria atualizada com sucesso', 'dado': categorias[idx]}), 200
+        transmissao.gravado('categoria', categoria)
+        return jsonify({'sucesso': True, 'mensagem': 'Categoria atualizada com sucesso', 'dado': categoria}), 200
     except Exception as e:
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao editar categoria: {str(e)}'}), 500
 
 # DELETE - Deletar uma categoria
-@app.route('/api/categorias/<int:categoria_id>', methods=['DELETE'])
+@rotas.route('/api/categorias/<int:categoria_id>', methods=['DELETE'])
 def deletar_categoria(categoria_id):
     try:
-        categorias = carregar_categorias()
-        idx = next((i for i, c in enumerate(categorias) if c['id'] == categoria_id), None)
-        if idx is None:
-            return jsonify({'sucesso': False, 'mensagem': f'Categoria com ID {categoria_id} não encontrada'}), 404
-        removida = categorias.pop(idx)
-        salvar_categorias(categorias)
-        # Remover referência da categoria das planilhas
-        remover_categoria_de_planilhas(categoria_id)
+        if USING_DB:
+            # Planilhas, associações e categoria numa única transação: se algo
+            # falhar no meio, nada é removido
+            with db.session.begin():
+                if db.session.get(Categoria, categoria_id) is None:
+                    removida = None
+                else:
+                    # Remove primeiro as planilhas da categoria, enquanto as associações ainda existem
+                    removidas = remover_planilhas_da_categoria(categoria_id, confirmar=False)
+                    removida = remover_categoria(categoria_id, confirmar=False)
+            if removida is None:
+                return jsonify({'sucesso': False, 'mensagem': f'Categoria com ID {categoria_id} não encontrada'}), 404
+            transmissao.removido('planilha', removidas)
+        else:
+            # Nada é removido se a categoria não existir
+            if arquivo_categorias.obter(categoria_id) is None:
+                return jsonify({'sucesso': False, 'mensagem': f'Categoria com ID {categoria_id} não encontrada'}), 404
+            remover_categoria_de_planilhas(categoria_id)
+            removida = remover_categoria(categoria_id)
+            if removida is None:
+                return jsonify({'sucesso': False, 'mensagem': f'Categoria com ID {categoria_id} não encontrada'}), 404
         # Emitir evento WebSocket para atualizar todos os clientes
-        socketio.emit('categoria_deletada', {'id': categoria_id})
+        transmissao.removido('categoria', [categoria_id])
         return jsonify({'sucesso': True, 'mensagem': 'Categoria deletada com sucesso', 'dado': removida}), 200
     except Exception as e:
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao deletar categoria: {str(e)}'}), 500
 
 # DELETE - Deletar todas as categorias
-@app.route('/api/categorias', methods=['DELETE'])
+@rotas.route('/api/categorias', methods=['DELETE'])
 def deletar_todas_categorias():
     try:
         salvar_categorias([])
+        transmissao.recarregar('categoria')
         return jsonify({'sucesso': True, 'mensagem': 'Todas as categorias foram deletadas'}), 200
     except Exception as e:
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao deletar categorias: {str(e)}'}), 500
@@ -248,88 +322,122 @@ def deletar_todas_categorias():
 PLANILHAS_FILE = 'dados.json'  # Mantém o nome para compatibilidade
 CATEGORIAS_FILE = 'categorias.json'
 
+# Snapshot + journal com lock entre threads/processos (ver armazenamento_json.py).
+# Também usados no modo banco, como origem de /api/migrate.
+# As planilhas têm um índice categoria -> planilhas, usado na remoção em cascata
+# e nas contagens por categoria (a chave None reúne as planilhas sem categoria),
+# e um índice de trigramas de título/URL para as sugestões (ver busca.py).
+def _chaves_categorias(planilha):
+    """Chaves do índice categoria -> planilhas. Um valor malformado (gravado
+    antes da validação) conta como "sem categoria" em vez de quebrar o índice."""
+    categorias = planilha.get('categorias')
+    if not isinstance(categorias, list):
+        return [None]
+    return [c for c in categorias if isinstance(c, int) and not isinstance(c, bool)] or [None]
+
+
+arquivo_planilhas = ArquivoJSON(PLANILHAS_FILE, indices={
+    'categorias': _chaves_categorias,
+    'texto': busca.IndiceTexto(),
+})
+arquivo_categorias = ArquivoJSON(CATEGORIAS_FILE)
+
+
+def _ajustar_sequencia(modelo):
+    """Após inserir IDs explícitos, avança a sequência do PostgreSQL para que
+    os próximos INSERTs com autoincremento não colidam com eles."""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    tabela = modelo.__tablename__
+    db.session.execute(db.text(
+        f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), "
+        f"COALESCE((SELECT MAX(id) FROM {tabela}), 0) + 1, false)"
+    ))
 
-# Funções utilitárias para planilhas
-def carregar_planilhas():
-    """Carrega planilhas.
 
-    Se `USING_DB` for True, carrega do banco via SQLAlchemy; caso contrário
-    carrega do arquivo JSON antigo para manter compatibilidade.
-    """
+# Funções utilitárias para planilhas
+def _ler_planilhas():
+    """Lê planilhas do banco ou do arquivo JSON (erros são propagados)."""
     if USING_DB:
-        try:
-            return [p.to_dict() for p in Planilha.query.order_by(Planilha.id).all()]
-        except Exception:
-            return []
-
-    if not os.path.exists(PLANILHAS_FILE):
-        return []
-
-    try:
-        with open(PLANILHAS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []
-
-def salvar_planilhas(planilhas):
+        # Duas consultas no total: as associações de todas as planilhas e as planilhas
+        categorias_por_planilha = {}
+        for pid, cid in db.session.execute(
+            db.select(planilha_categoria.c.planilha_id, planilha_categoria.c.categoria_id)
+            .order_by(planilha_categoria.c.planilha_id, planilha_categoria.c.categoria_id)
+        ):
+            categorias_por_planilha.setdefault(pid, []).append(cid)
+        planilhas = db.session.execute(db.select(Planilha).order_by(Planilha.id)).scalars()
+        return [p.to_dict(categorias_por_planilha.get(p.id, [])) for p in planilhas]
+
+    return arquivo_planilhas.ler()
+
+def salvar_planilhas(planilhas, confirmar=True):
+    """Substitui todas as planilhas pelas fornecidas.
+
+    No banco, a remoção e a inserção formam uma única transação: se alguma
+    linha falhar, nada é apagado e o erro é propagado. Com `confirmar=False`
+    o commit fica a cargo de quem chama.
+    """
     if USING_DB:
-        # Substitui todas as planilhas no banco pelos dados fornecidos.
         try:
             # Apaga todas as associações primeiro (antes de deletar as planilhas)
             db.session.execute(db.delete(planilha_categoria))
             # Depois apaga todas as planilhas
             Planilha.query.delete()
-            db.session.commit()
-            for p in planilhas:
-                categorias_ids = p.get('categorias', []) or []
-                nova = Planilha(
-                    id=p.get('id'),
-                    titulo=p.get('titulo'),
-                    url=p.get('url'),
-                    imagem=p.get('imagem') if 'imagem' in p else None,
-                )
-                # associa categorias existentes
-                for cid in categorias_ids:
-                    cat = Categoria.query.get(cid)
-                    if cat:
-                        nova.categorias.append(cat)
-                db.session.add(nova)
-            db.session.commit()
+            if planilhas:
+                # Resolve todas as categorias com um único IN e insere em lote
+                pedidas = {cid for p in planilhas for cid in (p.get('categorias') or []) if isinstance(cid, int)}
+                existentes = set(db.session.execute(
+                    db.select(Categoria.id).where(Categoria.id.in_(pedidas))
+                ).scalars()) if pedidas else set()
+                db.session.execute(Planilha.__table__.insert(), [
+                    {
+                        'id': p.get('id'),
+                        'titulo': p.get('titulo'),
+                        'url': p.get('url'),
+                        'imagem': p.get('imagem') if 'imagem' in p else None,
+                        'criado_em': _instante(p.get('criado_em')) or datetime.utcnow(),
+                        'atualizado_em': _instante(p.get('atualizado_em')),
+                    }
+                    for p in planilhas
+                ])
+                associacoes = {
+                    (p.get('id'), cid)
+                    for p in planilhas
+                    for cid in (p.get('categorias') or [])
+                    if cid in existentes
+                }
+                if associacoes:
+                    db.session.execute(planilha_categoria.insert(), [
+                        {'planilha_id': pid, 'categoria_id': cid} for pid, cid in associacoes
+                    ])
+                _ajustar_sequencia(Planilha)
+            if confirmar:
+                db.session.commit()
         except Exception:
             db.session.rollback()
+            raise
         return
 
-    with open(PLANILHAS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(planilhas, f, ensure_ascii=False, indent=2)
+    arquivo_planilhas.substituir(planilhas)
 
 # Funções utilitárias para categorias
-def carregar_categorias():
-    """Carrega categorias. Se `USING_DB` for True, consulta o banco.
-    Caso contrário, faz fallback para o arquivo JSON.
-    """
+def _ler_categorias():
+    """Lê categorias do banco ou do arquivo JSON (erros são propagados)."""
     if USING_DB:
-        try:
-            return [c.to_dict() for c in Categoria.query.order_by(Categoria.id).all()]
-        except Exception:
-            return []
-
-    if not os.path.exists(CATEGORIAS_FILE):
-        return []
+        return [c.to_dict() for c in Categoria.query.order_by(Categoria.id).all()]
 
-    try:
-        with open(CATEGORIAS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []
+    return arquivo_categorias.ler()
 
-def salvar_categorias(categorias):
+def salvar_categorias(categorias, confirmar=True):
+    """Substitui todas as categorias pelas fornecidas (no banco, numa única
+    transação, como `salvar_planilhas`)."""
     if USING_DB:
         try:
             # Apaga todas as associações primeiro (antes de deletar as categorias)
             db.session.execute(db.delete(planilha_categoria))
             # Depois apaga todas as categorias
             Categoria.query.delete()
-            db.session.commit()
             for c in categorias:
                 nova = Categoria(id=c.get('id'), nome=c.get('nome'))
                 # tenta preservar timestamps se existirem
@@ -339,93 +447,967 @@ def salvar_categorias(categorias):
                     except Exception:
                         pass
                 db.session.add(nova)
-            db.session.commit()
+            db.session.flush()
+            _ajustar_sequencia(Categoria)
+            if confirmar:
+                db.session.commit()
         except Exception:
             db.session.rollback()
+            raise
         return
 
-    with open(CATEGORIAS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(categorias, f, ensure_ascii=False, indent=2)
+    arquivo_categorias.substituir(categorias)
+
+
+# ==================== CACHE DE LEITURA ====================
+# Snapshots em memória usados pelos endpoints de leitura. As escritas nos
+# arquivos JSON invalidam o cache da coleção; no banco, qualquer commit da
+# sessão invalida as duas coleções. No modo JSON a assinatura dos arquivos
+# (snapshot + journal) também é verificada, para enxergar gravações feitas
+# por outro processo.
+
+if USING_DB:
+    # Um snapshot vale até a próxima escrita: é sempre lido do primário, nunca
+    # de uma réplica atrasada
+    cache_planilhas = CacheColecao('planilhas', replicas.do_primario(_ler_planilhas))
+    cache_categorias = CacheColecao('categorias', replicas.do_primario(_ler_categorias))
+
+    @db.event.listens_for(db.session, 'after_commit')
+    def _invalidar_cache_apos_commit(session):
+        replicas.marcar_escrita()
+        cache_planilhas.invalidar()
+        cache_categorias.invalidar()
+
+    # Commits feitos por outros workers chegam como mensagens delta pela fila
+    def _invalidar_cache_remoto(mensagem):
+        replicas.marcar_escrita()
+        cache_planilhas.invalidar()
+        cache_categorias.invalidar()
+
+    transmissao.observar_remotas(_invalidar_cache_remoto)
+else:
+    cache_planilhas = CacheColecao('planilhas', _ler_planilhas, arquivo_planilhas.assinatura)
+    cache_categorias = CacheColecao('categorias', _ler_categorias, arquivo_categorias.assinatura)
+    arquivo_planilhas.observar(cache_planilhas.invalidar)
+    arquivo_categorias.observar(cache_categorias.invalidar)
+
+
+def _codificacao_aceita():
+    return negociar(request.headers.get('Accept-Encoding'))
+
+
+def resposta_condicional(corpo, etag, modificado_em, codificacao=None):
+    """Monta a resposta JSON com ETag/Last-Modified e responde 304 quando o
+    cliente já possui a mesma representação (If-None-Match/If-Modified-Since).
+
+    `codificacao` indica que `corpo` já vem comprimido (gzip/br)."""
+    resposta = Response(corpo, status=200, mimetype=current_app.json.mimetype)
+    resposta.set_etag(etag)
+    resposta.last_modified = modificado_em
+    resposta.vary.add('Accept-Encoding')
+    if codificacao:
+        resposta.headers['Content-Encoding'] = codificacao
+    # Obriga o navegador a revalidar a cada uso, em vez de reaproveitar por heurística
+    resposta.cache_control.no_cache = True
+    return resposta.make_conditional(request)
+
+
+def resposta_lista(cache):
+    """Resposta de listagem servida a partir do corpo JSON pré-serializado
+    (e pré-comprimido) da versão atual."""
+    return resposta_condicional(*cache.representacao('lista', lambda dados: para_bytes({
+        'sucesso': True,
+        'total': len(dados),
+        'dados': dados
+    }), _codificacao_aceita()))
+
+
+def resposta_calculada(dados):
+    """Resposta condicional para dados montados na hora (sem corpo em cache):
+    o ETag vem do conteúdo e o Last-Modified da coleção alterada por último."""
+    corpo = para_bytes(dados)
+    corpo, etag, codificacao = codificar(corpo, calcular_etag(corpo), _codificacao_aceita())
+    modificado_em = max(cache_planilhas.modificado_em, cache_categorias.modificado_em)
+    return resposta_condicional(corpo, etag, modificado_em, codificacao)
+
+
+def resposta_item(cache, item_id):
+    """Resposta de detalhe (com ETag) ou None se o item não existir."""
+    corpo, etag, modificado_em, codificacao = cache.representacao_item(
+        item_id, lambda item: para_bytes({'sucesso': True, 'dado': item}), _codificacao_aceita()
+    )
+    if corpo is None:
+        return None
+    return resposta_condicional(corpo, etag, modificado_em, codificacao)
+
+
+# GET - Estatísticas do cache de leitura
+@rotas.route('/api/cache', methods=['GET'])
+def estatisticas_cache():
+    return jsonify({
+        'sucesso': True,
+        'planilhas': cache_planilhas.estatisticas(),
+        'categorias': cache_categorias.estatisticas()
+    }), 200
+
+
+# ==================== LISTAGEM PAGINADA E FILTRADA ====================
+# `GET /api/planilhas` aceita parâmetros opcionais:
+#   limit=N            tamanho da página (padrão 100, máximo 1000)
+#   cursor=ID          paginação por chave: planilhas com id > ID
+#   categoria=ID       apenas planilhas dessa categoria
+#   q=texto            título contendo o texto (sem diferenciar maiúsculas)
+#   fields=a,b,c       projeção de campos (o id é sempre incluído)
+#   updated_since=ISO  criadas ou alteradas a partir do instante informado
+# No banco os filtros viram SQL; no modo JSON usam um índice em memória
+# montado uma vez por versão do cache. Sem nenhum desses parâmetros a rota
+# continua devolvendo a lista completa.
+
+PARAMETROS_LISTAGEM = ('limit', 'cursor', 'categoria', 'q', 'fields', 'updated_since')
+CAMPOS_PLANILHA = ('id', 'titulo', 'url', 'imagem', 'criado_em', 'atualizado_em', 'categorias')
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 1000
+
+
+def _ler_filtros_listagem(args):
+    """Valida os parâmetros de listagem. Lança ValueError com a mensagem para o cliente."""
+    def inteiro(nome):
+        valor = args.get(nome, '').strip()
+        if not valor:
+            return None
+        try:
+            return int(valor)
+        except ValueError:
+            raise ValueError(f'Parâmetro {nome} deve ser um número inteiro')
+
+    limite = inteiro('limit')
+    if limite is None:
+        limite = LIMITE_PADRAO
+    elif limite < 1:
+        raise ValueError('Parâmetro limit deve ser maior que zero')
+
+    campos = None
+    if args.get('fields', '').strip():
+        campos = [c.strip() for c in args['fields'].split(',') if c.strip()]
+        invalidos = [c for c in campos if c not in CAMPOS_PLANILHA]
+        if invalidos:
+            raise ValueError(f'Campos inválidos em fields: {", ".join(invalidos)}')
+        if 'id' not in campos:
+            campos.insert(0, 'id')
+
+    desde = None
+    if args.get('updated_since', '').strip():
+        try:
+            desde = datetime.fromisoformat(args['updated_since'].strip())
+        except ValueError:
+            raise ValueError('Parâmetro updated_since deve estar no formato ISO 8601')
+
+    return {
+        'limite': min(limite, LIMITE_MAXIMO),
+        'cursor': inteiro('cursor'),
+        'categoria': inteiro('categoria'),
+        'q': args.get('q', '').strip() or None,
+        'campos': campos,
+        'desde': desde,
+    }
+
+
+def _instante(valor):
+    try:
+        return datetime.fromisoformat(valor) if valor else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _indice_listagem(planilhas):
+    """Índice em memória da listagem: planilhas ordenadas por id, por
+    categoria, títulos normalizados e instante da última modificação."""
+    ordenadas = sorted(planilhas, key=lambda p: p['id'])
+    por_categoria = {}
+    titulos = {}
+    modificado = {}
+    for p in ordenadas:
+        for cid in p.get('categorias') or []:
+            por_categoria.setdefault(cid, []).append(p)
+        titulos[p['id']] = str(p.get('titulo') or '').casefold()
+        instantes = [i for i in (_instante(p.get('criado_em')), _instante(p.get('atualizado_em'))) if i]
+        modificado[p['id']] = max(instantes) if instantes else None
+    return {
+        'todas': ([p['id'] for p in ordenadas], ordenadas),
+        'por_categoria': {cid: ([p['id'] for p in itens], itens) for cid, itens in por_categoria.items()},
+        'titulos': titulos,
+        'modificado': modificado,
+    }
+
+
+def _listar_planilhas_json(filtros):
+    indice = cache_planilhas.derivado('listagem', _indice_listagem)
+    if filtros['categoria'] is None:
+        ids, itens = indice['todas']
+    else:
+        ids, itens = indice['por_categoria'].get(filtros['categoria'], ([], []))
+    inicio = bisect_right(ids, filtros['cursor']) if filtros['cursor'] is not None else 0
+    termo = filtros['q'].casefold() if filtros['q'] else None
+    desde = filtros['desde']
+    if desde is not None and desde.tzinfo is not None:
+        # O arquivo JSON guarda horários locais sem fuso
+        desde = desde.astimezone().replace(tzinfo=None)
+
+    pagina = []
+    for i in range(inicio, len(itens)):
+        item = itens[i]
+        if termo and termo not in indice['titulos'][item['id']]:
+            continue
+        if desde is not None:
+            modificado = indice['modificado'][item['id']]
+            if modificado is None or modificado < desde:
+                continue
+        pagina.append(item)
+        if len(pagina) > filtros['limite']:
+            break
+    if filtros['campos'] is not None:
+        pagina = [{c: item.get(c) for c in filtros['campos']} for item in pagina]
+    return pagina
+
+
+def _listar_planilhas_db(filtros):
+    campos = filtros['campos'] or list(CAMPOS_PLANILHA)
+    colunas = [c for c in campos if c != 'categorias']
+    consulta = (
+        db.select(*[getattr(Planilha, c) for c in colunas])
+        .select_from(Planilha)
+        .order_by(Planilha.id)
+        .limit(filtros['limite'] + 1)
+    )
+    if filtros['cursor'] is not None:
+        consulta = consulta.where(Planilha.id > filtros['cursor'])
+    if filtros['categoria'] is not None:
+        consulta = consulta.join(planilha_categoria, planilha_categoria.c.planilha_id == Planilha.id).where(
+            planilha_categoria.c.categoria_id == filtros['categoria']
+        )
+    if filtros['q']:
+        consulta = consulta.where(Planilha.titulo.icontains(filtros['q'], autoescape=True))
+    if filtros['desde'] is not None:
+        desde = filtros['desde']
+        if desde.tzinfo is not None:
+            # O banco guarda horários UTC sem fuso (datetime.utcnow)
+            desde = desde.astimezone(timezone.utc).replace(tzinfo=None)
+        consulta = consulta.where(db.or_(Planilha.criado_em >= desde, Planilha.atualizado_em >= desde))
+
+    pagina = [
+        {c: (v.isoformat() if isinstance(v, datetime) else v) for c, v in zip(colunas, linha)}
+        for linha in db.session.execute(consulta)
+    ]
+    if 'categorias' in campos and pagina:
+        # Categorias da página inteira em uma única consulta
+        ids = [p['id'] for p in pagina[:filtros['limite']]]
+        por_planilha = {}
+        for pid, cid in db.session.execute(
+            db.select(planilha_categoria.c.planilha_id, planilha_categoria.c.categoria_id)
+            .where(planilha_categoria.c.planilha_id.in_(ids))
+            .order_by(planilha_categoria.c.planilha_id, planilha_categoria.c.categoria_id)
+        ):
+            por_planilha.setdefault(pid, []).append(cid)
+        for p in pagina:
+            p['categorias'] = por_planilha.get(p['id'], [])
+    return pagina
+
+
+def resposta_listagem_filtrada(filtros):
+    """Página de planilhas conforme os filtros, com `proximo_cursor` quando há mais resultados."""
+    pagina = _listar_planilhas_db(filtros) if USING_DB else _listar_planilhas_json(filtros)
+    tem_mais = len(pagina) > filtros['limite']
+    pagina = pagina[:filtros['limite']]
+    corpo = para_bytes({
+        'sucesso': True,
+        'total': len(pagina),
+        'dados': pagina,
+        'proximo_cursor': pagina[-1]['id'] if tem_mais else None
+    })
+    corpo, etag, codificacao = codificar(corpo, calcular_etag(corpo), _codificacao_aceita())
+    return resposta_condicional(corpo, etag, cache_planilhas.modificado_em, codificacao)
+
+
+# ==================== CONTAGEM POR CATEGORIA ====================
+# Quantas planilhas há em cada categoria, para a barra lateral não precisar
+# baixar todas as planilhas. No banco é um GROUP BY sobre `planilha_categoria`
+# (resolvido pelo índice categoria_id, planilha_id); no modo JSON são os
+# tamanhos do índice categoria -> planilhas, atualizado a cada escrita.
+
+def contar_planilhas_por_categoria():
+    """Retorna `(total_planilhas, {categoria_id: quantidade})`; a chave None
+    conta as planilhas sem nenhuma categoria."""
+    if not USING_DB:
+        return arquivo_planilhas.tamanho(), arquivo_planilhas.contagens('categorias')
+    contagens = dict(db.session.execute(
+        db.select(planilha_categoria.c.categoria_id, db.func.count())
+        .group_by(planilha_categoria.c.categoria_id)
+    ).all())
+    associada = db.exists().where(planilha_categoria.c.planilha_id == Planilha.id)
+    total, sem_categoria = db.session.execute(
+        db.select(db.func.count(Planilha.id), db.func.count(Planilha.id).filter(~associada))
+    ).one()
+    contagens[None] = sem_categoria
+    return total, contagens
+
+
+# ==================== SUGESTÕES (TYPEAHEAD) ====================
+# `GET /api/planilhas/sugestoes?q=texto&limit=N`: as N planilhas (padrão 10,
+# máximo 50) cujo título ou URL melhor casa com o que foi digitado, sem
+# diferenciar acentos e maiúsculas. Critérios de ordem em busca.py; no modo
+# JSON usa o índice de trigramas em memória, no banco os índices GIN
+# (PostgreSQL) ou uma varredura da tabela (SQLite).
+
+CAMPOS_SUGESTAO = ('id', 'titulo', 'url', 'imagem')
+
+
+def _sugerir_planilhas_json(consulta, limite):
+    ids = arquivo_planilhas.consultar('texto', lambda indice: indice.sugerir(consulta, limite))
+    # Títulos e URLs vêm do snapshot em cache, numa única leitura (e não uma
+    # sincronização do arquivo por sugestão)
+    return [{c: item.get(c) for c in CAMPOS_SUGESTAO} for item in cache_planilhas.obter_por_ids(ids)]
+
+
+@functools.lru_cache(maxsize=None)
+def _busca_normalizada():
+    """Se o banco tem `busca_normalizar` (SQLite: registrada a cada conexão;
+    PostgreSQL: criada pela migração 3). Consultado uma vez por processo."""
+    dialeto = db.engine.dialect.name
+    if dialeto == 'sqlite':
+        return True
+    if dialeto == 'postgresql':
+        return bool(db.session.execute(
+            db.text("SELECT to_regprocedure('busca_normalizar(text)') IS NOT NULL")
+        ).scalar())
+    return False
+
+
+def _sugerir_planilhas_db(consulta, limite):
+    preparada = busca.preparar_consulta(consulta)
+    if preparada is None:
+        return []
+    frase, palavras = preparada
+    normalizar = db.func.busca_normalizar if _busca_normalizada() else db.func.lower
+    titulo = normalizar(Planilha.titulo, type_=db.String)
+    url = normalizar(Planilha.url, type_=db.String)
+
+    def inicio_de_palavra(texto, palavra):
+        return (db.literal(' ') + texto).contains(' ' + palavra, autoescape=True)
+
+    def contem(texto, palavra):
+        # Mesma regra do modo JSON: palavras curtas só no início de palavras
+        if len(palavra) >= 3:
+            return texto.contains(palavra, autoescape=True)
+        return inicio_de_palavra(texto, palavra)
+
+    nivel = db.case(
+        (titulo.startswith(frase, autoescape=True), 0),
+        (db.and_(*[inicio_de_palavra(titulo, p) for p in palavras]), 1),
+        (db.and_(*[contem(titulo, p) for p in palavras]), 2),
+        else_=3,
+    )
+    consulta_sql = (
+        db.select(*[getattr(Planilha, c) for c in CAMPOS_SUGESTAO])
+        .where(*[db.or_(contem(titulo, p), contem(url, p)) for p in palavras])
+        .order_by(nivel, db.func.length(titulo), Planilha.id)
+        .limit(limite)
+    )
+    return [dict(zip(CAMPOS_SUGESTAO, linha)) for linha in db.session.execute(consulta_sql)]
+
+
+# ==================== REPOSITÓRIO (escritas por linha) ====================
+# Operações de escrita de uma única entidade. No modo banco cada função toca
+# apenas as linhas afetadas (INSERT/UPDATE/DELETE pontuais), em vez de apagar
+# e reinserir as tabelas inteiras como `salvar_planilhas`/`salvar_categorias`.
+# No modo JSON continuam carregando e regravando o arquivo.
+
+def _categorias_existentes(categoria_ids):
+    """Filtra `categoria_ids` mantendo apenas IDs de categorias existentes (ordem preservada)."""
+    categoria_ids = [cid for cid in categoria_ids if isinstance(cid, int)]
+    if not categoria_ids:
+        return []
+    if USING_DB:
+        validos = set(db.session.execute(
+            db.select(Categoria.id).where(Categoria.id.in_(set(categoria_ids)))
+        ).scalars())
+    else:
+        validos = arquivo_categorias.existentes(categoria_ids)
+    vistos = set()
+    resultado = []
+    for cid in categoria_ids:
+        if cid in validos and cid not in vistos:
+            vistos.add(cid)
+            resultado.append(cid)
+    return resultado
+
+
+def _validar_categorias(categoria_ids):
+    """Valida a lista `categorias` de uma edição: IDs inteiros de categorias
+    existentes. Retorna os IDs sem repetição ou lança ValueError."""
+    if not isinstance(categoria_ids, list) or any(
+            not isinstance(cid, int) or isinstance(cid, bool) for cid in categoria_ids):
+        raise ValueError('Campo categorias deve ser uma lista de IDs de categorias')
+    validas = _categorias_existentes(categoria_ids)
+    inexistentes = sorted(set(categoria_ids) - set(validas))
+    if inexistentes:
+        raise ValueError(f'Categorias não encontradas: {", ".join(map(str, inexistentes))}')
+    return validas
+
+
+def _sincronizar_associacoes(planilha_id, categoria_ids):
+    """Aplica na tabela `planilha_categoria` apenas a diferença entre as
+    associações atuais da planilha e `categoria_ids` (sem commit)."""
+    atuais = set(db.session.execute(
+        db.select(planilha_categoria.c.categoria_id).where(planilha_categoria.c.planilha_id == planilha_id)
+    ).scalars())
+    desejadas = set(categoria_ids)
+    removidas = atuais - desejadas
+    adicionadas = desejadas - atuais
+    if removidas:
+        db.session.execute(
+            planilha_categoria.delete().where(
+                planilha_categoria.c.planilha_id == planilha_id,
+                planilha_categoria.c.categoria_id.in_(removidas),
+            )
+        )
+    if adicionadas:
+        db.session.execute(
+            planilha_categoria.insert(),
+            [{'planilha_id': planilha_id, 'categoria_id': cid} for cid in adicionadas],
+        )
+
+
+def inserir_planilha(dados):
+    """Insere uma planilha e retorna o dicionário persistido."""
+    categoria_ids = _categorias_existentes(dados.get('categorias') or [])
+    if USING_DB:
+        try:
+            nova = Planilha(titulo=dados.get('titulo'), url=dados.get('url'), imagem=dados.get('imagem'))
+            db.session.add(nova)
+            db.session.flush()
+            _sincronizar_associacoes(nova.id, categoria_ids)
+            db.session.commit()
+            return nova.to_dict(categoria_ids)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    with arquivo_planilhas.transacao() as t:
+        nova = dict(dados)
+        nova['id'] = t.proximo_id()
+        nova['criado_em'] = datetime.now().isoformat()
+        nova['categorias'] = categoria_ids
+        t.gravar(nova)
+    return nova
+
+
+def remover_planilha(planilha_id):
+    """Remove uma planilha. Retorna o dicionário removido ou None se não existir."""
+    if USING_DB:
+        try:
+            planilha = db.session.get(Planilha, planilha_id)
+            if planilha is None:
+                return None
+            removida = planilha.to_dict()
+            db.session.execute(planilha_categoria.delete().where(planilha_categoria.c.planilha_id == planilha_id))
+            db.session.execute(db.delete(Planilha).where(Planilha.id == planilha_id))
+            db.session.commit()
+            return removida
+        except Exception:
+            db.session.rollback()
+            raise
+
+    with arquivo_planilhas.transacao() as t:
+        removida = t.obter(planilha_id)
+        if removida is not None:
+            t.remover(planilha_id)
+    return removida
+
+
+def definir_categorias_planilha(planilha_id, categoria_ids):
+    """Substitui as categorias de uma planilha, ignorando IDs inexistentes.
+
+    Retorna a planilha atualizada ou None se ela não existir.
+    """
+    if USING_DB:
+        try:
+            planilha = db.session.get(Planilha, planilha_id)
+            if planilha is None:
+                return None
+            validas = _categorias_existentes(categoria_ids)
+            _sincronizar_associacoes(planilha_id, validas)
+            planilha.atualizado_em = datetime.utcnow()
+            db.session.commit()
+            return planilha.to_dict(validas)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    validas = _categorias_existentes(categoria_ids)
+    with arquivo_planilhas.transacao() as t:
+        atual = t.obter(planilha_id)
+        if atual is None:
+            return None
+        planilha = {**atual, 'categorias': validas, 'atualizado_em': datetime.now().isoformat()}
+        t.gravar(planilha)
+    return planilha
+
+
+def remover_planilhas_da_categoria(categoria_id, confirmar=True):
+    """Remove todas as planilhas associadas à categoria. Retorna os IDs removidos.
+
+    No banco, com `confirmar=False` o commit (e o rollback) fica a cargo de quem chama.
+    """
+    if USING_DB:
+        try:
+            ids = list(db.session.execute(
+                db.select(planilha_categoria.c.planilha_id).where(planilha_categoria.c.categoria_id == categoria_id)
+            ).scalars())
+            if ids:
+                db.session.execute(planilha_categoria.delete().where(planilha_categoria.c.planilha_id.in_(ids)))
+                db.session.execute(db.delete(Planilha).where(Planilha.id.in_(ids)))
+                if confirmar:
+                    db.session.commit()
+            return ids
+        except Exception:
+            if confirmar:
+                db.session.rollback()
+            raise
+
+    with arquivo_planilhas.transacao() as t:
+        removidas = [p['id'] for p in t.buscar('categorias', categoria_id)]
+        for pid in removidas:
+            t.remover(pid)
+    return removidas
+
+
+def inserir_categoria(dados):
+    """Insere uma categoria e retorna o dicionário persistido."""
+    if USING_DB:
+        try:
+            nova = Categoria(nome=dados.get('nome'))
+            db.session.add(nova)
+            db.session.commit()
+            return nova.to_dict()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    with arquivo_categorias.transacao() as t:
+        nova = dict(dados)
+        nova['id'] = t.proximo_id()
+        nova['criado_em'] = datetime.now().isoformat()
+        t.gravar(nova)
+    return nova
+
+
+def remover_categoria(categoria_id, confirmar=True):
+    """Remove uma categoria. Retorna o dicionário removido ou None se não existir.
+
+    No banco, com `confirmar=False` o commit (e o rollback) fica a cargo de quem chama.
+    """
+    if USING_DB:
+        try:
+            categoria = db.session.get(Categoria, categoria_id)
+            if categoria is None:
+                return None
+            removida = categoria.to_dict()
+            db.session.execute(planilha_categoria.delete().where(planilha_categoria.c.categoria_id == categoria_id))
+            db.session.execute(db.delete(Categoria).where(Categoria.id == categoria_id))
+            if confirmar:
+                db.session.commit()
+            return removida
+        except Exception:
+            if confirmar:
+                db.session.rollback()
+            raise
+
+    with arquivo_categorias.transacao() as t:
+        removida = t.obter(categoria_id)
+        if removida is not None:
+            t.remover(categoria_id)
+    return removida
 
 
 # Endpoint auxiliar: migra os arquivos JSON atuais para o banco (quando aplicável)
-@app.route('/api/migrate', methods=['POST'])
+@rotas.route('/api/migrate', methods=['POST'])
 def migrate_json_to_db():
     if not USING_DB:
-        return jsonify({'sucesso': False, 'mensagem': 'DATABASE_URL não configurado; migração não necessária'}), 400
+        return jsonify({'sucesso': False, 'mensagem': 'DATABASE_URL ou ARMAZENAMENTO=sqlite não configurado; migração não necessária'}), 400
     try:
-        # importa categorias
-        raw_cats = []
-        if os.path.exists(CATEGORIAS_FILE):
-            with open(CATEGORIAS_FILE, 'r', encoding='utf-8') as f:
-                raw_cats = json.load(f) or []
-        # importa planilhas
-        raw_pls = []
-        if os.path.exists(PLANILHAS_FILE):
-            with open(PLANILHAS_FILE, 'r', encoding='utf-8') as f:
-                raw_pls = json.load(f) or []
-
-        # Salva categorias e planilhas usando as funções DB-aware
-        salvar_categorias(raw_cats)
-        salvar_planilhas(raw_pls)
+        # importa categorias e planilhas (snapshot + journal dos arquivos JSON)
+        raw_cats = arquivo_categorias.ler()
+        raw_pls = arquivo_planilhas.ler()
+
+        # Categorias e planilhas numa única transação: uma linha inválida
+        # desfaz tudo e o banco continua como estava
+        salvar_categorias(raw_cats, confirmar=False)
+        salvar_planilhas(raw_pls, confirmar=False)
+        db.session.commit()
+        if db.engine.dialect.name == 'sqlite':
+            # Atualiza as estatísticas do planejador depois da carga em massa
+            db.session.execute(db.text('PRAGMA optimize'))
+        transmissao.recarregar('categoria')
+        transmissao.recarregar('planilha')
         return jsonify({'sucesso': True, 'mensagem': 'Migração concluída', 'categorias': len(raw_cats), 'planilhas': len(raw_pls)}), 200
     except Exception as e:
         return jsonify({'sucesso': False, 'mensagem': f'Erro na migração: {str(e)}'}), 500
 
+
+# ==================== IMPORTAÇÃO E EXPORTAÇÃO EM LOTE (NDJSON) ====================
+# Formato: um objeto JSON por linha. Linhas com "tipo": "categoria" descrevem
+# categorias; as demais (ou "tipo": "planilha") descrevem planilhas. A
+# exportação emite todas as categorias antes das planilhas, de modo que o
+# arquivo exportado pode ser reimportado diretamente em outro ambiente.
+
+TAMANHO_LOTE = 1000
+MAX_ERROS_REPORTADOS = 1000
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def _validar_registro_importacao(registro):
+    """Normaliza uma linha importada. Retorna `(tipo, dados)` ou lança ValueError."""
+    if not isinstance(registro, dict):
+        raise ValueError('Cada linha deve ser um objeto JSON')
+    tipo = registro.get('tipo', 'planilha')
+    if tipo not in ('planilha', 'categoria'):
+        raise ValueError(f'Tipo desconhecido: {tipo}')
+    if 'id' in registro and registro['id'] is not None and (
+            not isinstance(registro['id'], int) or isinstance(registro['id'], bool)):
+        raise ValueError('Campo id deve ser um número inteiro')
+
+    if tipo == 'categoria':
+        if not registro.get('nome'):
+            raise ValueError('Nome da categoria é obrigatório')
+        campos = ('id', 'nome', 'criado_em', 'atualizado_em')
+    else:
+        if not registro.get('titulo') or not registro.get('url'):
+            raise ValueError('Título e URL são obrigatórios')
+        if not isinstance(registro.get('categorias', []), list):
+            raise ValueError('Campo categorias deve ser uma lista de IDs')
+        campos = ('id', 'titulo', 'url', 'imagem', 'criado_em', 'atualizado_em', 'categorias')
+    dados = {c: registro[c] for c in campos if registro.get(c) is not None}
+    if 'categorias' in dados:
+        # Nos dois modos, valores que não são IDs inteiros são ignorados
+        dados['categorias'] = [c for c in dados['categorias'] if isinstance(c, int) and not isinstance(c, bool)]
+    return tipo, dados
+
+
+def _ler_linhas_ndjson(fluxo):
+    """Gera `(numero_da_linha, registro | ValueError)` lendo o fluxo linha a linha."""
+    for numero, bruta in enumerate(fluxo, 1):
+        texto = bruta.decode('utf-8', errors='replace').strip() if isinstance(bruta, bytes) else bruta.strip()
+        if not texto:
+            continue
+        try:
+            yield numero, _validar_registro_importacao(carregar(texto))
+        except json.JSONDecodeError:
+            yield numero, ValueError('JSON inválido')
+        except ValueError as e:
+            yield numero, e
+
+
+class _ResultadoImportacao:
+    def __init__(self):
+        self.categorias = 0
+        self.planilhas = 0
+        self.total_erros = 0
+        self.erros = []
+
+    def erro(self, numero, mensagem):
+        self.total_erros += 1
+        if len(self.erros) < MAX_ERROS_REPORTADOS:
+            self.erros.append({'linha': numero, 'mensagem': mensagem})
+
+    def to_dict(self):
+        return {
+            'sucesso': True,
+            'mensagem': 'Importação concluída',
+            'categorias': self.categorias,
+            'planilhas': self.planilhas,
+            'total_erros': self.total_erros,
+            'erros': self.erros,
+        }
+
+
+def _importar_ndjson_db(linhas):
+    """Importa no banco em lotes de `TAMANHO_LOTE`, dentro de uma única transação.
+
+    Segue as mesmas regras do modo JSON: os IDs ausentes são atribuídos aqui
+    (depois do maior existente e dos já usados na importação), um ID repetido
+    é um erro da linha, e as referências a categorias são resolvidas no
+    final, valendo também as categorias definidas mais adiante no arquivo.
+    """
+    resultado = _ResultadoImportacao()
+    ids_categorias = set(db.session.execute(db.select(Categoria.id)).scalars())
+    ids_planilhas = set(db.session.execute(db.select(Planilha.id)).scalars())
+    ultimo = {'categoria': max(ids_categorias, default=0), 'planilha': max(ids_planilhas, default=0)}
+    lote_categorias = []
+    lote_planilhas = []
+    # (planilha_id, categoria_ids) de todas as planilhas, associadas no final
+    referencias = []
+
+    def novo_id(tipo, ocupados):
+        ultimo[tipo] += 1
+        while ultimo[tipo] in ocupados:
+            ultimo[tipo] += 1
+        return ultimo[tipo]
+
+    def gravar(modelo, lote):
+        if lote:
+            # Todas as linhas com as mesmas colunas (o executemany exige)
+            colunas = modelo.__table__.columns.keys()
+            db.session.execute(db.insert(modelo), [{c: linha.get(c) for c in colunas} for linha in lote])
+            lote.clear()
+
+    try:
+        for numero, item in linhas:
+            if isinstance(item, ValueError):
+                resultado.erro(numero, str(item))
+                continue
+            tipo, dados = item
+            for campo in ('criado_em', 'atualizado_em'):
+                if campo in dados:
+                    dados[campo] = _instante(dados[campo])
+            dados.setdefault('criado_em', datetime.utcnow())
+            if tipo == 'categoria':
+                if 'id' in dados and dados['id'] in ids_categorias:
+                    resultado.erro(numero, f'Categoria com ID {dados["id"]} já existe')
+                    continue
+                if 'id' not in dados:
+                    dados['id'] = novo_id('categoria', ids_categorias)
+                ids_categorias.add(dados['id'])
+                lote_categorias.append(dados)
+                resultado.categorias += 1
+                if len(lote_categorias) >= TAMANHO_LOTE:
+                    gravar(Categoria, lote_categorias)
+            else:
+                if 'id' in dados and dados['id'] in ids_planilhas:
+                    resultado.erro(numero, f'Planilha com ID {dados["id"]} já existe')
+                    continue
+                if 'id' not in dados:
+                    dados['id'] = novo_id('planilha', ids_planilhas)
+                ids_planilhas.add(dados['id'])
+                referencias.append((dados['id'], dados.pop('categorias', [])))
+                lote_planilhas.append(dados)
+                resultado.planilhas += 1
+                if len(lote_planilhas) >= TAMANHO_LOTE:
+                    gravar(Planilha, lote_planilhas)
+        gravar(Categoria, lote_categorias)
+        gravar(Planilha, lote_planilhas)
+
+        # Categorias podem aparecer depois das planilhas que as usam: filtra no final
+        associacoes = []
+        for pid, cids in referencias:
+            associacoes.extend(
+                {'planilha_id': pid, 'categoria_id': cid} for cid in dict.fromkeys(cids) if cid in ids_categorias
+            )
+            if len(associacoes) >= TAMANHO_LOTE:
+                db.session.execute(planilha_categoria.insert(), associacoes)
+                associacoes = []
+        if associacoes:
+            db.session.execute(planilha_categoria.insert(), associacoes)
+        _ajustar_sequencia(Categoria)
+        _ajustar_sequencia(Planilha)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return resultado
+
+
+def _novo_id(transacao, reservados):
+    """Próximo id da sequência de `transacao` que não esteja em `reservados`."""
+    novo = transacao.proximo_id()
+    while novo in reservados:
+        novo = transacao.proximo_id()
+    return novo
+
+
+def _importar_ndjson_json(linhas):
+    """Importa nos arquivos JSON, numa transação de cada arquivo.
+
+    Os dois arquivos ficam travados durante toda a importação (categorias
+    antes de planilhas, a mesma ordem das demais rotas): uma escrita de outra
+    requisição ou worker espera o fim da importação em vez de se perder.
+    """
+    resultado = _ResultadoImportacao()
+    with arquivo_categorias.transacao() as categorias, arquivo_planilhas.transacao() as planilhas:
+        # IDs das planilhas desta importação; só são gravadas no final
+        reservados = set()
+        pendentes = []
+
+        for numero, item in linhas:
+            if isinstance(item, ValueError):
+                resultado.erro(numero, str(item))
+                continue
+            tipo, dados = item
+            dados.setdefault('criado_em', datetime.now().isoformat())
+            if tipo == 'categoria':
+                if 'id' in dados and categorias.obter(dados['id']) is not None:
+                    resultado.erro(numero, f'Categoria com ID {dados["id"]} já existe')
+                    continue
+                if 'id' not in dados:
+                    # A sequência do arquivo: IDs de itens já removidos não voltam
+                    dados['id'] = categorias.proximo_id()
+                categorias.gravar(dados)
+                resultado.categorias += 1
+            else:
+                if 'id' in dados and (dados['id'] in reservados or planilhas.obter(dados['id']) is not None):
+                    resultado.erro(numero, f'Planilha com ID {dados["id"]} já existe')
+                    continue
+                if 'id' not in dados:
+                    dados['id'] = _novo_id(planilhas, reservados)
+                reservados.add(dados['id'])
+                pendentes.append(dados)
+                resultado.planilhas += 1
+
+        # Categorias podem aparecer depois das planilhas que as usam: filtra no final
+        for dados in pendentes:
+            dados['categorias'] = list(dict.fromkeys(
+                cid for cid in dados.get('categorias', []) if categorias.obter(cid) is not None
+            ))
+            planilhas.gravar(dados)
+    return resultado
+
+
+def _exportar_ndjson():
+    """Gera o NDJSON de exportação em blocos de até `TAMANHO_LOTE` linhas."""
+    def linha(tipo, dados):
+        return current_app.json.dumps({'tipo': tipo, **dados}) + '\n'
+
+    if not USING_DB:
+        categorias = cache_categorias.obter()
+        planilhas = cache_planilhas.obter()
+        for inicio in range(0, len(categorias), TAMANHO_LOTE):
+            yield ''.join(linha('categoria', c) for c in categorias[inicio:inicio + TAMANHO_LOTE])
+        for inicio in range(0, len(planilhas), TAMANHO_LOTE):
+            yield ''.join(linha('planilha', p) for p in planilhas[inicio:inicio + TAMANHO_LOTE])
+        return
+
+    # yield_per usa cursor do lado do servidor: só um lote fica em memória
+    categorias = db.session.execute(
+        db.select(Categoria).order_by(Categoria.id).execution_options(yield_per=TAMANHO_LOTE)
+    ).scalars()
+    for lote in categorias.partitions():
+        yield ''.join(linha('categoria', c.to_dict()) for c in lote)
+
+    planilhas = db.session.execute(
+        db.select(Planilha).order_by(Planilha.id).execution_options(yield_per=TAMANHO_LOTE)
+    ).scalars()
+    for lote in planilhas.partitions():
+        por_planilha = {}
+        for pid, cid in db.session.execute(
+            db.select(planilha_categoria.c.planilha_id, planilha_categoria.c.categoria_id)
+            .where(planilha_categoria.c.planilha_id.in_([p.id for p in lote]))
+            .order_by(planilha_categoria.c.planilha_id, planilha_categoria.c.categoria_id)
+        ):
+            por_planilha.setdefault(pid, []).append(cid)
+        yield ''.join(linha('planilha', p.to_dict(por_planilha.get(p.id, []))) for p in lote)
+
+
+# POST - Importar planilhas (e categorias) em lote a partir de NDJSON
+@rotas.route('/api/planilhas/bulk', methods=['POST'])
+def importar_planilhas_lote():
+    """Importa um corpo NDJSON lido linha a linha. Linhas inválidas são
+    reportadas e ignoradas; as válidas são gravadas em uma única transação."""
+    try:
+        linhas = _ler_linhas_ndjson(request.stream)
+        resultado = _importar_ndjson_db(linhas) if USING_DB else _importar_ndjson_json(linhas)
+        if resultado.categorias:
+            transmissao.recarregar('categoria')
+        if resultado.planilhas:
+            transmissao.recarregar('planilha')
+        return jsonify(resultado.to_dict()), 200
+    except SQLAlchemyError:
+        # Sem o SQL nem os parâmetros do erro do driver na resposta
+        current_app.logger.exception('Erro do banco na importação NDJSON')
+        return jsonify({'sucesso': False, 'mensagem': 'Erro do banco na importação; nenhuma linha foi gravada'}), 500
+    except Exception as e:
+        return jsonify({'sucesso': False, 'mensagem': f'Erro na importação: {str(e)}'}), 500
+
+
+# GET - Exportar categorias e planilhas como NDJSON (streaming)
+@rotas.route('/api/export', methods=['GET'])
+def exportar_ndjson():
+    return Response(
+        stream_with_context(_exportar_ndjson()),
+        mimetype=NDJSON_MIMETYPE,
+        headers={'Content-Disposition': 'attachment; filename=export.ndjson'}
+    )
+
 # ==================== ROTAS ====================
 
 
 # ==================== PLANILHAS ====================
 
+# GET - Sugestões de planilhas enquanto o usuário digita
+@rotas.route('/api/planilhas/sugestoes', methods=['GET'])
+@coalescer
+def sugerir_planilhas():
+    try:
+        try:
+            limite = int(request.args.get('limit', busca.LIMITE_PADRAO))
+        except ValueError:
+            return jsonify({'sucesso': False, 'mensagem': 'Parâmetro limit deve ser um número inteiro'}), 400
+        if limite < 1:
+            return jsonify({'sucesso': False, 'mensagem': 'Parâmetro limit deve ser maior que zero'}), 400
+        limite = min(limite, busca.LIMITE_MAXIMO)
+        consulta = request.args.get('q', '')
+        sugestoes = _sugerir_planilhas_db(consulta, limite) if USING_DB else _sugerir_planilhas_json(consulta, limite)
+        return jsonify({'sucesso': True, 'total': len(sugestoes), 'dados': sugestoes}), 200
+    except Exception as e:
+        return jsonify({'sucesso': False, 'mensagem': f'Erro ao buscar sugestões: {str(e)}'}), 500
+
 # GET - Listar todas as planilhas
-@app.route('/api/planilhas', methods=['GET'])
+@rotas.route('/api/planilhas', methods=['GET'])
+@coalescer
 def listar_planilhas():
-    """Lista todas as planilhas"""
-    planilhas = carregar_planilhas()
-    return jsonify({
-        'sucesso': True,
-        'total': len(planilhas),
-        'dados': planilhas
-    }), 200
+    """Lista as planilhas (todas ou paginadas/filtradas, conforme os parâmetros)"""
+    try:
+        if any(p in request.args for p in PARAMETROS_LISTAGEM):
+            try:
+                filtros = _ler_filtros_listagem(request.args)
+            except ValueError as e:
+                return jsonify({'sucesso': False, 'mensagem': str(e)}), 400
+            return resposta_listagem_filtrada(filtros)
+        return resposta_lista(cache_planilhas)
+    except Exception as e:
+        return jsonify({'sucesso': False, 'mensagem': f'Erro ao listar planilhas: {str(e)}'}), 500
 
 
 # GET - Obter uma planilha específica por ID
-@app.route('/api/planilhas/<int:planilha_id>', methods=['GET'])
+@rotas.route('/api/planilhas/<int:planilha_id>', methods=['GET'])
+@coalescer
 def obter_planilha(planilha_id):
     """Obtém uma planilha específica pelo ID"""
-    planilhas = carregar_planilhas()
-    planilha = next((p for p in planilhas if p['id'] == planilha_id), None)
-    if planilha:
-        return jsonify({'sucesso': True, 'dado': planilha}), 200
+    resposta = resposta_item(cache_planilhas, planilha_id)
+    if resposta is not None:
+        return resposta
     return jsonify({'sucesso': False, 'mensagem': f'Planilha com ID {planilha_id} não encontrada'}), 404
 
 
 # POST - Criar uma nova planilha
-@app.route('/api/planilhas', methods=['POST'])
+@rotas.route('/api/planilhas', methods=['POST'])
 def criar_planilha():
     """Cria uma nova planilha (card)"""
     try:
-        planilhas = carregar_planilhas()
-        nova = request.get_json()
-        if not nova or 'titulo' not in nova or 'url' not in nova:
+        dados = request.get_json()
+        if not dados or 'titulo' not in dados or 'url' not in dados:
             return jsonify({'sucesso': False, 'mensagem': 'Título e URL são obrigatórios'}), 400
-        novo_id = max([p['id'] for p in planilhas], default=0) + 1
-        nova['id'] = novo_id
-        nova['criado_em'] = datetime.now().isoformat()
-        # Permite categorias opcionais (lista de ids)
-        if 'categorias' not in nova:
-            nova['categorias'] = []
-        planilhas.append(nova)
-        salvar_planilhas(planilhas)
+        # Permite categorias opcionais (lista de ids; IDs inexistentes são ignorados)
+        if not isinstance(dados.get('categorias') or [], list):
+            return jsonify({'sucesso': False, 'mensagem': 'Campo categorias deve ser uma lista de IDs de categorias'}), 400
+        nova = inserir_planilha(dados)
         # Emitir evento WebSocket para atualizar todos os clientes
-        socketio.emit('planilha_criada', {'dado': nova})
+        transmissao.gravado('planilha', nova, criado=True)
         return jsonify({'sucesso': True, 'mensagem': 'Planilha criada com sucesso', 'dado': nova}), 201
     except Exception as e:
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao criar planilha: {str(e)}'}), 500
 
 
 # PUT - Editar uma planilha
-@app.route('/api/planilhas/<int:planilha_id>', methods=['PUT'])
+@rotas.route('/api/planilhas/<int:planilha_id>', methods=['PUT'])
 def editar_planilha(planilha_id):
     """Edita uma planilha existente"""
     try:
@@ -437,60 +1419,71 @@ def editar_planilha(planilha_id):
             atualizados = request.get_json()
             if not atualizados:
                 return jsonify({'sucesso': False, 'mensagem': 'Nenhum dado fornecido para atualização'}), 400
+            categorias = None
+            if 'categorias' in atualizados:
+                try:
+                    categorias = _validar_categorias(atualizados['categorias'])
+                except ValueError as e:
+                    return jsonify({'sucesso': False, 'mensagem': str(e)}), 400
             if 'titulo' in atualizados:
                 planilha.titulo = atualizados['titulo']
             if 'url' in atualizados:
                 planilha.url = atualizados['url']
             if 'imagem' in atualizados:
                 planilha.imagem = atualizados['imagem']
+            if categorias is not None:
+                _sincronizar_associacoes(planilha_id, categorias)
             planilha.atualizado_em = datetime.utcnow()
             db.session.commit()
-            socketio.emit('planilha_editada', {'dado': planilha.to_dict()})
-            return jsonify({'sucesso': True, 'mensagem': 'Planilha atualizada com sucesso', 'dado': planilha.to_dict()}), 200
+            dado = planilha.to_dict(categorias)
+            transmissao.gravado('planilha', dado)
+            return jsonify({'sucesso': True, 'mensagem': 'Planilha atualizada com sucesso', 'dado': dado}), 200
         
         # Fallback para arquivos JSON
-        planilhas = carregar_planilhas()
-        idx = next((i for i, p in enumerate(planilhas) if p['id'] == planilha_id), None)
-        if idx is None:
-            return jsonify({'sucesso': False, 'mensagem': f'Planilha com ID {planilha_id} não encontrada'}), 404
         atualizados = request.get_json()
-        if not atualizados:
-            return jsonify({'sucesso': False, 'mensagem': 'Nenhum dado fornecido para atualização'}), 400
-        planilhas[idx].update(atualizados)
-        planilhas[idx]['id'] = planilha_id
-        planilhas[idx]['atualizado_em'] = datetime.now().isoformat()
-        salvar_planilhas(planilhas)
+        if atualizados and 'categorias' in atualizados:
+            # Validada antes da transação (consulta o arquivo de categorias)
+            try:
+                atualizados = {**atualizados, 'categorias': _validar_categorias(atualizados['categorias'])}
+            except ValueError as e:
+                return jsonify({'sucesso': False, 'mensagem': str(e)}), 400
+        with arquivo_planilhas.transacao() as t:
+            atual = t.obter(planilha_id)
+            if atual is None:
+                return jsonify({'sucesso': False, 'mensagem': f'Planilha com ID {planilha_id} não encontrada'}), 404
+            if not atualizados:
+                return jsonify({'sucesso': False, 'mensagem': 'Nenhum dado fornecido para atualização'}), 400
+            planilha = {**atual, **atualizados, 'id': planilha_id, 'atualizado_em': datetime.now().isoformat()}
+            t.gravar(planilha)
         # Emitir evento WebSocket para atualizar todos os clientes
-        socketio.emit('planilha_editada', {'dado': planilhas[idx]})
-        return jsonify({'sucesso': True, 'mensagem': 'Planilha atualizada com sucesso', 'dado': planilhas[idx]}), 200
+        transmissao.gravado('planilha', planilha)
+        return jsonify({'sucesso': True, 'mensagem': 'Planilha atualizada com sucesso', 'dado': planilha}), 200
     except Exception as e:
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao editar planilha: {str(e)}'}), 500
 
 
 # DELETE - Deletar uma planilha
-@app.route('/api/planilhas/<int:planilha_id>', methods=['DELETE'])
+@rotas.route('/api/planilhas/<int:planilha_id>', methods=['DELETE'])
 def deletar_planilha(planilha_id):
     """Deleta uma planilha"""
     try:
-        planilhas = carregar_planilhas()
-        idx = next((i for i, p in enumerate(planilhas) if p['id'] == planilha_id), None)
-        if idx is None:
+        removida = remover_planilha(planilha_id)
+        if removida is None:
             return jsonify({'sucesso': False, 'mensagem': f'Planilha com ID {planilha_id} não encontrada'}), 404
-        removida = planilhas.pop(idx)
-        salvar_planilhas(planilhas)
         # Emitir evento WebSocket para atualizar todos os clientes
-        socketio.emit('planilha_deletada', {'id': planilha_id})
+        transmissao.removido('planilha', [planilha_id])
         return jsonify({'sucesso': True, 'mensagem': 'Planilha deletada com sucesso', 'dado': removida}), 200
     except Exception as e:
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao deletar planilha: {str(e)}'}), 500
 
 
 # DELETE - Deletar todas as planilhas
-@app.route('/api/planilhas', methods=['DELETE'])
+@rotas.route('/api/planilhas', methods=['DELETE'])
 def deletar_todas_planilhas():
     """Deleta todas as planilhas"""
     try:
         salvar_planilhas([])
+        transmissao.recarregar('planilha')
         return jsonify({'sucesso': True, 'mensagem': 'Todas as planilhas foram deletadas'}), 200
     except Exception as e:
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao deletar planilhas: {str(e)}'}), 500
@@ -498,7 +1491,7 @@ def deletar_todas_planilhas():
 
 # ==================== ENDPOINT DE TESTE ====================
 
-@app.route('/api/teste', methods=['GET'])
+@rotas.route('/api/teste', methods=['GET'])
 def teste():
     """Endpoint simples para verificar se a API está no ar."""
     return jsonify(
@@ -510,9 +1503,97 @@ def teste():
     ), 200
 
 
+# ==================== FÁBRICA DA APLICAÇÃO ====================
+
+def create_app(config=None):
+    """Monta a aplicação Flask e liga as extensões (banco, Socket.IO, métricas).
+
+    Não abre conexão com o banco: a engine só conecta na primeira consulta e
+    o esquema vem das migrações (`python migracoes.py` ou `flask --app main
+    migrar`). `db` e `socketio` são globais deste módulo, então vale uma
+    aplicação por processo. `config` sobrepõe valores de `app.config`.
+    """
+    app = Flask(__name__, static_folder='static', static_url_path='')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pool de conexões por processo, para o primário e para cada réplica
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '3600')),
+        'pool_pre_ping': True,
+        # QueuePool que mede a espera por conexão (ver metricas.py)
+        'poolclass': PoolMedido,
+    }
+    # Réplicas somente leitura (DATABASE_REPLICA_URLS), uma por bind
+    app.config['SQLALCHEMY_BINDS'] = replicas.binds() if database_url else {}
+    if database_url and database_url.startswith('sqlite'):
+        # SQLite embutido: pool sem pre-ping, conexões entre threads (ver armazenamento_sqlite.py)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(armazenamento_sqlite.opcoes_engine())
+    if config:
+        app.config.update(config)
+
+    # O cabeçalho de leitura das próprias escritas precisa ser legível pelo
+    # front-end em outro domínio (ver replicas.py)
+    CORS(app, expose_headers=[replicas.CABECALHO])
+    # jsonify/get_json com orjson quando disponível (ver serializacao.py)
+    app.json = ProvedorJSON(app)
+    # Métricas por rota em GET /metrics; SERVER_TIMING=1 adiciona o cabeçalho Server-Timing
+    instrumentar_app(app, server_timing=os.environ.get('SERVER_TIMING') == '1')
+    # Respostas JSON a partir de COMPRESSAO_LIMIAR bytes saem com gzip/brotli (ver compressao.py)
+    instalar_compressao(app)
+    app.register_blueprint(rotas)
+    # Leituras idênticas simultâneas executam uma vez; LIMITE_CONCORRENCIA/
+    # LIMITE_FILA limitam o trabalho em paralelo (503 + Retry-After; ver sobrecarga.py)
+    instalar_sobrecarga(app, versao=lambda: (cache_planilhas.versao, cache_categorias.versao))
+    app.cli.add_command(comando_migrar)
+
+    if USING_DB:
+        db.init_app(app)
+        # Consultas acima de SLOW_QUERY_MS (padrão 200 ms) vão para o log
+        instrumentar_sqlalchemy(limite_lento=float(os.environ.get('SLOW_QUERY_MS', '200')) / 1000)
+        with app.app_context():
+            # SQLite: WAL, PRAGMAs e busca_normalizar() em cada conexão
+            for engine in db.engines.values():
+                if engine.dialect.name == 'sqlite':
+                    db.event.listen(engine, 'connect',
+                                    lambda conexao, _: armazenamento_sqlite.configurar_conexao(conexao))
+        if app.config['SQLALCHEMY_BINDS']:
+            # Quem acabou de escrever lê do primário, mesmo em outro worker
+            replicas.instalar(app)
+
+    # Com mais de um worker/servidor, SOCKETIO_MESSAGE_QUEUE aponta para a fila
+    # compartilhada (redis://..., amqp://... ou sqlite:///arquivo.db; ver fila_mensagens.py)
+    # SOCKETIO_ASYNC_MODE: threading (padrão), gevent ou eventlet. Para gevent e
+    # eventlet use o ponto de entrada servidor.py, que aplica o monkey patching
+    # antes de importar este módulo.
+    socketio.init_app(app, cors_allowed_origins="*", json=JSON_SOCKETIO,
+                      async_mode=os.environ.get('SOCKETIO_ASYNC_MODE', 'threading'),
+                      **opcoes_fila(os.environ.get('SOCKETIO_MESSAGE_QUEUE')))
+    # Mensagens delta de outros workers entram no histórico deste (ressincronização)
+    observar_emissoes(socketio.server, 'alteracoes', transmissao.registrar_remota)
+    return app
+
+
+def __getattr__(nome):
+    # `main.app` (gunicorn main:app, servidor.py, testes) é criada no primeiro acesso
+    if nome == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {nome!r}')
+
+
 # ==================== INICIALIZAÇÃO ====================
 
 if __name__ == '__main__':
+    app = create_app()
+    if USING_DB:
+        # Em desenvolvimento aplica as migrações pendentes antes de subir
+        engine_migracoes = criar_engine_migracoes(database_url)
+        migrar(engine_migracoes)
+        engine_migracoes.dispose()
     # Evita UnicodeEncodeError no Windows (console cp1252) por causa de emojis
     print("Servidor iniciado em http://localhost:5000")
     print("\nEndpoints disponíveis:")
@@ -532,7 +1613,9 @@ if __name__ == '__main__':
     print("    DELETE /api/categorias/<id>           - Deletar uma categoria")
     print("    DELETE /api/categorias                - Deletar todas as categorias")
     print("\n  OUTROS:")
-    print("    GET    /api/teste                     - Testar a API\n")
+    print("    GET    /api/teste                     - Testar a API")
+    print("    GET    /api/cache                     - Estatísticas do cache de leitura")
+    print("    GET    /metrics                       - Métricas no formato do Prometheus\n")
     print("  WEBSOCKETS:")
     print("    Conecta automaticamente para atualizações em tempo real\n")
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,356 @@
+"""Métricas de requisições, consultas SQL e Socket.IO no formato do Prometheus.
+
+Sem dependências externas: os contadores, medidores e histogramas ficam em
+memória (por processo) e são expostos em texto por `GET /metrics`.
+
+- `instrumentar_app(app)`: latência, tamanho da resposta e status por rota
+  (o padrão da rota, ex. `/api/planilhas/<int:planilha_id>`, não a URL) e,
+  opcionalmente, o cabeçalho `Server-Timing` em cada resposta;
+- `instrumentar_sqlalchemy()`: número e duração das consultas (no total e
+  por requisição) e log das consultas lentas;
+- `PoolMedido`: `QueuePool` que mede a espera para obter uma conexão e
+  quantas vezes o pool esgotou (usado via `poolclass`);
+- `instrumentar_socketio(socketio)`: emissões por evento e clientes
+  conectados por sala.
+"""
+import logging
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+PREFIXO = 'dashboards_'
+TIPO_CONTEUDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+BALDES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BALDES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+BALDES_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+log_sql = logging.getLogger('dashboards.sql')
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _rotulos(nomes, valores, extra=''):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+# ==================== TIPOS DE MÉTRICA ====================
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = PREFIXO + nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def cabecalho(self):
+        return [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} {self.tipo}']
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, *valores_rotulos, valor=1):
+        with self._lock:
+            self._series[valores_rotulos] = self._series.get(valores_rotulos, 0) + valor
+
+    def expor(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return self.cabecalho() + [f'{self.nome}{_rotulos(self.rotulos, r)} {_numero(v)}' for r, v in series]
+
+
+class Medidor(_Metrica):
+    """Valor instantâneo. `coletar()` (opcional) devolve `{rotulos: valor}` na hora da leitura."""
+    tipo = 'gauge'
+
+    def __init__(self, nome, ajuda, rotulos=(), coletar=None):
+        super().__init__(nome, ajuda, rotulos)
+        self._coletar = coletar
+
+    def definir(self, *valores_rotulos, valor):
+        with self._lock:
+            self._series[valores_rotulos] = valor
+
+    def expor(self):
+        with self._lock:
+            series = dict(self._series)
+        if self._coletar is not None:
+            series.update(self._coletar())
+        return self.cabecalho() + [f'{self.nome}{_rotulos(self.rotulos, r)} {_numero(v)}'
+                                   for r, v in sorted(series.items())]
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), baldes=BALDES_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.baldes = tuple(baldes)
+
+    def observar(self, valor, *valores_rotulos):
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                serie = self._series[valores_rotulos] = [[0] * len(self.baldes), 0, 0.0]
+            for i, limite in enumerate(self.baldes):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += 1
+            serie[2] += valor
+
+    def expor(self):
+        with self._lock:
+            series = sorted((r, (list(s[0]), s[1], s[2])) for r, s in self._series.items())
+        linhas = self.cabecalho()
+        for rotulos, (baldes, quantidade, soma) in series:
+            for limite, acumulado in zip(self.baldes + (float('inf'),), baldes + [quantidade]):
+                extra = f'le="{_numero(float(limite))}"'
+                linhas.append(f'{self.nome}_bucket{_rotulos(self.rotulos, rotulos, extra)} {acumulado}')
+            linhas.append(f'{self.nome}_sum{_rotulos(self.rotulos, rotulos)} {_numero(soma)}')
+            linhas.append(f'{self.nome}_count{_rotulos(self.rotulos, rotulos)} {quantidade}')
+        return linhas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+
+    def adicionar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def expor(self):
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.expor())
+        return '\n'.join(linhas) + '\n'
+
+
+registro = Registro()
+
+# ==================== HTTP ====================
+
+http_requisicoes = registro.adicionar(Contador(
+    'http_requisicoes_total', 'Requisições HTTP atendidas', ('metodo', 'rota', 'status')))
+http_duracao = registro.adicionar(Histograma(
+    'http_duracao_segundos', 'Tempo de atendimento das requisições HTTP', ('metodo', 'rota')))
+http_resposta_bytes = registro.adicionar(Histograma(
+    'http_resposta_bytes', 'Tamanho do corpo das respostas (respostas em streaming não entram)',
+    ('metodo', 'rota'), BALDES_BYTES))
+http_em_andamento = registro.adicionar(Medidor(
+    'http_requisicoes_em_andamento', 'Requisições HTTP sendo atendidas agora'))
+http_em_andamento.definir(valor=0)
+
+
+def _rota():
+    return request.url_rule.rule if request.url_rule is not None else 'sem_rota'
+
+
+def instrumentar_app(app, server_timing=False, rota_metricas='/metrics'):
+    """Mede cada requisição e registra `GET <rota_metricas>`.
+
+    Com `server_timing`, cada resposta leva `Server-Timing: app;dur=..,
+    db;dur=..;desc="N consultas"` (visível nas ferramentas do navegador).
+    """
+    em_andamento = [0]
+    lock = threading.Lock()
+
+    @app.before_request
+    def _iniciar_medicao():
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_consultas = 0
+        g.metricas_consultas_s = 0.0
+        g.metricas_em_andamento = True
+        with lock:
+            em_andamento[0] += 1
+            http_em_andamento.definir(valor=em_andamento[0])
+
+    @app.after_request
+    def _registrar_medicao(resposta):
+        inicio = g.pop('metricas_inicio', None)
+        if inicio is None:
+            return resposta
+        duracao = time.perf_counter() - inicio
+        rota = _rota()
+        http_requisicoes.inc(request.method, rota, str(resposta.status_code))
+        http_duracao.observar(duracao, request.method, rota)
+        if not resposta.is_streamed and resposta.content_length is not None:
+            http_resposta_bytes.observar(resposta.content_length, request.method, rota)
+        consultas = g.get('metricas_consultas', 0)
+        if _sqlalchemy_instrumentado[0]:
+            consultas_por_requisicao.observar(consultas, request.method, rota)
+        if server_timing:
+            resposta.headers.add(
+                'Server-Timing',
+                f'app;dur={duracao * 1000:.1f}, '
+                f'db;dur={g.get("metricas_consultas_s", 0.0) * 1000:.1f};desc="{consultas} consultas"',
+            )
+        return resposta
+
+    @app.teardown_request
+    def _finalizar_medicao(_erro=None):
+        if not g.pop('metricas_em_andamento', False):
+            return
+        with lock:
+            em_andamento[0] -= 1
+            http_em_andamento.definir(valor=em_andamento[0])
+
+    @app.route(rota_metricas, methods=['GET'])
+    def metricas():
+        """Métricas no formato texto do Prometheus"""
+        return Response(registro.expor(), content_type=TIPO_CONTEUDO)
+
+
+# ==================== SQLALCHEMY ====================
+
+db_consultas = registro.adicionar(Contador(
+    'db_consultas_total', 'Consultas SQL executadas'))
+db_consulta_duracao = registro.adicionar(Histograma(
+    'db_consulta_duracao_segundos', 'Duração das consultas SQL'))
+db_consultas_lentas = registro.adicionar(Contador(
+    'db_consultas_lentas_total', 'Consultas SQL acima do limite de consulta lenta'))
+consultas_por_requisicao = registro.adicionar(Histograma(
+    'db_consultas_por_requisicao', 'Consultas SQL feitas por requisição HTTP',
+    ('metodo', 'rota'), BALDES_CONSULTAS))
+_sqlalchemy_instrumentado = [False]
+
+
+def instrumentar_sqlalchemy(limite_lento=0.2):
+    """Escuta todas as engines do SQLAlchemy (inclusive as criadas depois).
+
+    Consultas que levam mais de `limite_lento` segundos são registradas no
+    logger `dashboards.sql` (sem os parâmetros).
+    """
+    if _sqlalchemy_instrumentado[0]:
+        return
+    _sqlalchemy_instrumentado[0] = True
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metricas_inicio', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def _depois(conn, cursor, statement, parameters, context, executemany):
+        inicios = conn.info.get('metricas_inicio')
+        if not inicios:
+            return
+        duracao = time.perf_counter() - inicios.pop()
+        db_consultas.inc()
+        db_consulta_duracao.observar(duracao)
+        if has_request_context():
+            g.metricas_consultas = g.get('metricas_consultas', 0) + 1
+            g.metricas_consultas_s = g.get('metricas_consultas_s', 0.0) + duracao
+        if duracao >= limite_lento:
+            db_consultas_lentas.inc()
+            log_sql.warning('Consulta lenta (%.1f ms): %s', duracao * 1000, ' '.join(statement.split())[:1000])
+
+    @event.listens_for(Engine, 'handle_error')
+    def _erro(contexto):
+        inicios = contexto.connection.info.get('metricas_inicio') if contexto.connection is not None else None
+        if inicios:
+            inicios.pop()
+
+
+# ==================== POOL DE CONEXÕES ====================
+
+db_pool_espera = registro.adicionar(Histograma(
+    'db_pool_espera_segundos', 'Espera para obter uma conexão do pool'))
+db_pool_esgotado = registro.adicionar(Contador(
+    'db_pool_esgotado_total', 'Pedidos de conexão que estouraram o pool_timeout'))
+db_pool_overflow_usado = registro.adicionar(Contador(
+    'db_pool_overflow_total', 'Conexões abertas além de pool_size (max_overflow)'))
+
+_pools = []
+
+
+class PoolMedido(QueuePool):
+    """`QueuePool` que mede a espera no checkout. Use com `poolclass=PoolMedido`."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _pools.append(self)
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        overflow_antes = self.overflow()
+        try:
+            conexao = super()._do_get()
+        except exc.TimeoutError:
+            db_pool_esgotado.inc()
+            raise
+        finally:
+            db_pool_espera.observar(time.perf_counter() - inicio)
+        if self.overflow() > overflow_antes and self.overflow() > 0:
+            db_pool_overflow_usado.inc()
+        return conexao
+
+    def dispose(self):
+        # Engine.dispose() troca o pool por um novo: o antigo deixa de contar
+        super().dispose()
+        if self in _pools:
+            _pools.remove(self)
+
+
+def _estado_pools():
+    valores = {('em_uso',): 0, ('ociosas',): 0, ('overflow',): 0, ('tamanho',): 0}
+    for pool in list(_pools):
+        valores[('em_uso',)] += pool.checkedout()
+        valores[('ociosas',)] += pool.checkedin()
+        valores[('overflow',)] += max(0, pool.overflow())
+        valores[('tamanho',)] += pool.size()
+    return valores
+
+
+registro.adicionar(Medidor(
+    'db_pool_conexoes', 'Conexões do pool por estado (em_uso, ociosas, overflow, tamanho)',
+    ('estado',), coletar=_estado_pools))
+
+# ==================== SOCKET.IO ====================
+
+socketio_emissoes = registro.adicionar(Contador(
+    'socketio_emissoes_total', 'Eventos Socket.IO emitidos por este processo', ('evento',)))
+
+
+def instrumentar_socketio(socketio):
+    """Conta as emissões por evento e expõe os clientes conectados por sala."""
+    original = socketio.emit
+
+    def emit(evento, *args, **kwargs):
+        socketio_emissoes.inc(evento)
+        return original(evento, *args, **kwargs)
+
+    socketio.emit = emit
+
+    def clientes():
+        salas = socketio.server.manager.rooms.get('/', {})
+        valores = {('todos',): len(salas.get(None, ()))}
+        for sala, participantes in list(salas.items()):
+            if isinstance(sala, str) and sala not in participantes:
+                # Salas nomeadas (as salas privadas têm o nome do próprio sid)
+                valores[(sala,)] = len(participantes)
+        return valores
+
+    registro.adicionar(Medidor(
+        'socketio_clientes', 'Clientes Socket.IO conectados a este processo, por sala',
+        ('sala',), coletar=clientes))
@@ -0,0 +1,203 @@
+"""Migrações versionadas do esquema do banco de dados.
+
+O esquema não é mais criado no import da aplicação (o antigo
+`db.create_all()` custava várias idas ao banco a cada worker iniciado e
+disputava a criação das tabelas quando dois workers subiam juntos). As
+migrações rodam por um comando separado, antes de subir o servidor:
+
+    python migracoes.py                # usa DATABASE_URL ou ARMAZENAMENTO=sqlite
+    flask --app main migrar            # o mesmo, pelo CLI do Flask
+    python migracoes.py --status       # só mostra a versão atual
+
+Cada migração tem um número; a tabela `schema_versao` guarda as que já
+foram aplicadas, e só as novas são executadas. Tudo roda numa única
+transação, protegida por um lock exclusivo (`pg_advisory_xact_lock` no
+PostgreSQL, `BEGIN IMMEDIATE` no SQLite): dois processos rodando o comando
+ao mesmo tempo aplicam cada migração uma única vez.
+
+As tabelas das migrações são definidas aqui, congeladas, e não a partir
+dos modelos de `main.py`: mudar um modelo exige uma migração nova. A
+primeira migração usa `checkfirst`, então bancos criados pelo antigo
+`create_all` são adotados sem erro.
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+
+import armazenamento_sqlite
+import busca
+
+log = logging.getLogger('dashboards.migracoes')
+
+# Número arbitrário e fixo: identifica o lock das migrações no PostgreSQL
+CHAVE_LOCK_POSTGRESQL = 7_420_318
+
+_metadata = sa.MetaData()
+schema_versao = sa.Table(
+    'schema_versao', _metadata,
+    sa.Column('versao', sa.Integer, primary_key=True),
+    sa.Column('descricao', sa.String(255), nullable=False),
+    sa.Column('aplicada_em', sa.DateTime, nullable=False),
+)
+
+
+# ==================== MIGRAÇÕES ====================
+
+def _v1_tabelas(conexao):
+    metadata = sa.MetaData()
+    sa.Table(
+        'categorias', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('nome', sa.String(255), nullable=False),
+        sa.Column('criado_em', sa.DateTime),
+        sa.Column('atualizado_em', sa.DateTime),
+    )
+    sa.Table(
+        'planilhas', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('titulo', sa.String(255), nullable=False),
+        sa.Column('url', sa.String(2048), nullable=False),
+        sa.Column('imagem', sa.String(2048), nullable=True),
+        sa.Column('criado_em', sa.DateTime),
+        sa.Column('atualizado_em', sa.DateTime),
+    )
+    sa.Table(
+        'planilha_categoria', metadata,
+        sa.Column('planilha_id', sa.Integer, sa.ForeignKey('planilhas.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('categoria_id', sa.Integer, sa.ForeignKey('categorias.id', ondelete='CASCADE'), primary_key=True),
+    )
+    metadata.create_all(conexao, checkfirst=True)
+
+
+def _v2_indices(conexao):
+    """Índices da listagem (updated_since) e do filtro por categoria."""
+    metadata = sa.MetaData()
+    planilhas = sa.Table('planilhas', metadata, sa.Column('criado_em'), sa.Column('atualizado_em'))
+    associacao = sa.Table('planilha_categoria', metadata, sa.Column('planilha_id'), sa.Column('categoria_id'))
+    for indice in (
+        sa.Index('ix_planilhas_criado_em', planilhas.c.criado_em),
+        sa.Index('ix_planilhas_atualizado_em', planilhas.c.atualizado_em),
+        sa.Index('ix_planilha_categoria_categoria_id', associacao.c.categoria_id, associacao.c.planilha_id),
+    ):
+        indice.create(conexao, checkfirst=True)
+
+
+def _v3_busca_textual(conexao):
+    """PostgreSQL: pg_trgm, unaccent e índices GIN das sugestões (ver busca.py)."""
+    if conexao.dialect.name != 'postgresql':
+        return
+    try:
+        with conexao.begin_nested():
+            for comando in busca.DDL_POSTGRESQL:
+                conexao.exec_driver_sql(comando)
+    except sa.exc.DBAPIError as e:
+        # Sem permissão para criar extensões: as sugestões funcionam sem índice
+        # e sensíveis a acentos
+        log.warning('Migração 3 sem pg_trgm/unaccent: %s', e.orig)
+
+
+MIGRACOES = [
+    (1, 'tabelas categorias, planilhas e planilha_categoria', _v1_tabelas),
+    (2, 'índices de data e de categoria', _v2_indices),
+    (3, 'busca textual (pg_trgm)', _v3_busca_textual),
+]
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+
+# ==================== EXECUÇÃO ====================
+
+def criar_engine(url):
+    """Engine própria das migrações (sem pool), com transações que travam o banco."""
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    engine = sa.create_engine(url, poolclass=sa.pool.NullPool)
+    if engine.dialect.name == 'sqlite':
+        # O driver sqlite3 não abre transação para DDL; assim o BEGIN é nosso
+        @sa.event.listens_for(engine, 'connect')
+        def _sem_transacao_implicita(conexao_dbapi, _):
+            conexao_dbapi.isolation_level = None
+            armazenamento_sqlite.configurar_conexao(conexao_dbapi)
+
+        @sa.event.listens_for(engine, 'begin')
+        def _begin_exclusivo(conexao):
+            conexao.exec_driver_sql('BEGIN IMMEDIATE')
+    return engine
+
+
+def _travar(conexao):
+    if conexao.dialect.name == 'postgresql':
+        conexao.execute(sa.text('SELECT pg_advisory_xact_lock(:chave)'), {'chave': CHAVE_LOCK_POSTGRESQL})
+    # SQLite: o BEGIN IMMEDIATE já é exclusivo para escrita
+
+
+def versao(conexao):
+    """Maior versão aplicada (0 se nenhuma)."""
+    if not sa.inspect(conexao).has_table('schema_versao'):
+        return 0
+    return conexao.execute(sa.select(sa.func.max(schema_versao.c.versao))).scalar() or 0
+
+
+def migrar(engine, ate=None):
+    """Aplica as migrações pendentes (até a versão `ate`). Retorna as versões aplicadas."""
+    aplicadas = []
+    with engine.begin() as conexao:
+        _travar(conexao)
+        schema_versao.create(conexao, checkfirst=True)
+        atual = versao(conexao)
+        for numero, descricao, funcao in MIGRACOES:
+            if numero <= atual or (ate is not None and numero > ate):
+                continue
+            log.info('Aplicando migração %d: %s', numero, descricao)
+            funcao(conexao)
+            conexao.execute(schema_versao.insert().values(
+                versao=numero, descricao=descricao, aplicada_em=datetime.utcnow()))
+            aplicadas.append(numero)
+    return aplicadas
+
+
+@click.command('migrar')
+@click.option('--ate', type=int, help='para na versão informada')
+def comando_migrar(ate):
+    """Aplica as migrações pendentes do banco da aplicação (flask --app main migrar)."""
+    url = current_app.config.get('SQLALCHEMY_DATABASE_URI')
+    if not url:
+        click.echo('Sem banco configurado (DATABASE_URL ou ARMAZENAMENTO=sqlite): no modo JSON não há migrações.')
+        return
+    engine = criar_engine(url)
+    try:
+        aplicadas = migrar(engine, ate=ate)
+    finally:
+        engine.dispose()
+    click.echo(f'Migrações aplicadas: {", ".join(map(str, aplicadas))}' if aplicadas else 'Esquema já atualizado.')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Aplica as migrações pendentes do banco (DATABASE_URL ou ARMAZENAMENTO=sqlite).')
+    parser.add_argument('--database-url', default=armazenamento_sqlite.url_configurada())
+    parser.add_argument('--ate', type=int, help='para na versão informada')
+    parser.add_argument('--status', action='store_true', help='só mostra a versão atual')
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        print('Sem banco configurado (DATABASE_URL ou ARMAZENAMENTO=sqlite): no modo JSON não há migrações.')
+        return 0
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    engine = criar_engine(args.database_url)
+    try:
+        if args.status:
+            with engine.connect() as conexao:
+                print(f'Versão do esquema: {versao(conexao)} (mais recente: {VERSAO_ATUAL})')
+            return 0
+        aplicadas = migrar(engine, ate=args.ate)
+        print(f'Migrações aplicadas: {", ".join(map(str, aplicadas))}' if aplicadas else 'Esquema já atualizado.')
+    finally:
+        engine.dispose()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Leituras em réplicas do banco, com leitura das próprias escritas.
+
+`DATABASE_REPLICA_URLS` (URLs separadas por vírgula) lista réplicas somente
+leitura do banco principal (`DATABASE_URL`). Cada uma vira um bind do
+Flask-SQLAlchemy (`replica_1`, `replica_2`, ...), com as mesmas opções de
+pool, e `SessaoRoteada` escolhe o banco de cada comando:
+
+- escritas, flushes, SQL textual e qualquer comando fora de uma requisição
+  GET/HEAD vão para o primário;
+- os SELECTs de uma requisição GET/HEAD vão para uma réplica, a mesma
+  durante toda a requisição (rodízio entre as réplicas);
+- depois de uma escrita, as leituras voltam ao primário por
+  `REPLICA_ATRASO_MAXIMO_S` segundos (padrão 5), o atraso de replicação
+  tolerado: no processo inteiro após um commit local ou de outro worker, e
+  para o cliente que escreveu, mesmo que a próxima requisição caia em outro
+  worker (ver `instalar`);
+- `primario()` força o primário num trecho de código (ex.: snapshots do
+  cache, que valem até a próxima escrita e não podem vir de uma réplica
+  atrasada).
+
+Sem réplicas configuradas tudo vai para o primário, como antes.
+"""
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+
+from metricas import Contador, registro
+
+PREFIXO_BIND = 'replica_'
+COOKIE = 'leitura_primaria'
+# O mesmo sinal em cabeçalho, para front-ends em outro domínio: um `fetch`
+# sem credenciais não envia cookies. O valor é o instante (Unix, segundos)
+# até o qual o cliente deve ler do primário; o cliente o devolve nas
+# requisições seguintes.
+CABECALHO = 'X-Leitura-Primaria'
+METODOS_LEITURA = ('GET', 'HEAD')
+
+consultas_roteadas = registro.adicionar(Contador(
+    'db_consultas_roteadas_total', 'Comandos SQL por destino (primário ou réplica)', ('destino',)))
+
+_local = threading.local()
+_rodizio = itertools.count()
+# Instante (time.monotonic) até o qual as leituras deste processo vão ao primário
+_primario_ate = [0.0]
+# Há réplicas configuradas (`instalar` foi chamado)
+_ativo = [False]
+
+
+def atraso_maximo():
+    return float(os.environ.get('REPLICA_ATRASO_MAXIMO_S', '5'))
+
+
+def binds(ambiente=None):
+    """`{'replica_1': url, ...}` a partir de `DATABASE_REPLICA_URLS`."""
+    ambiente = os.environ if ambiente is None else ambiente
+    urls = [u.strip() for u in (ambiente.get('DATABASE_REPLICA_URLS') or '').split(',') if u.strip()]
+    return {
+        f'{PREFIXO_BIND}{i}': u.replace('postgres://', 'postgresql://', 1) if u.startswith('postgres://') else u
+        for i, u in enumerate(urls, 1)
+    }
+
+
+@contextmanager
+def primario():
+    """Dentro do bloco, todos os comandos vão para o banco primário."""
+    anterior = getattr(_local, 'primario', False)
+    _local.primario = True
+    try:
+        yield
+    finally:
+        _local.primario = anterior
+
+
+def do_primario(funcao):
+    """`funcao` que sempre lê do primário."""
+    def envolvida(*args, **kwargs):
+        with primario():
+            return funcao(*args, **kwargs)
+    return envolvida
+
+
+def marcar_escrita():
+    """Houve uma escrita (neste processo ou noutro): leituras no primário por um tempo."""
+    _primario_ate[0] = time.monotonic() + atraso_maximo()
+
+
+def leitura_primaria():
+    """True se as leituras desta requisição vão para o primário por causa de
+    uma escrita recente (do próprio cliente ou deste processo).
+
+    Faz parte da chave da coalescência (ver sobrecarga.py): quem acabou de
+    escrever não pode aproveitar uma leitura em andamento numa réplica.
+    """
+    if not _ativo[0]:
+        return False
+    return bool(g.get('replica_primario')) or time.monotonic() < _primario_ate[0]
+
+
+def _ler_em_replica():
+    if getattr(_local, 'primario', False) or not has_request_context():
+        return False
+    return request.method in METODOS_LEITURA and not leitura_primaria()
+
+
+def _escrita_recente_do_cliente():
+    if request.cookies.get(COOKIE):
+        return True
+    try:
+        return float(request.headers.get(CABECALHO, '')) > time.time()
+    except ValueError:
+        return False
+
+
+class SessaoRoteada(Session):
+    """Sessão que manda os SELECTs das requisições de leitura para uma réplica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and getattr(clause, 'is_select', False) and _ler_em_replica():
+            replicas = sorted(k for k in self._db.engines if isinstance(k, str) and k.startswith(PREFIXO_BIND))
+            if replicas:
+                escolhida = g.get('replica_escolhida')
+                if escolhida not in replicas:
+                    escolhida = g.replica_escolhida = replicas[next(_rodizio) % len(replicas)]
+                consultas_roteadas.inc('replica')
+                return self._db.engines[escolhida]
+        consultas_roteadas.inc('primario')
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def instalar(app):
+    """Leitura das próprias escritas entre workers: o cliente que acabou de
+    escrever lê do primário por `REPLICA_ATRASO_MAXIMO_S` segundos.
+
+    A resposta de uma escrita bem-sucedida traz o cookie `leitura_primaria`
+    (enviado sozinho pelo navegador no mesmo domínio) e o cabeçalho
+    `X-Leitura-Primaria`, que um front-end em outro domínio deve devolver
+    nas requisições seguintes (o `static/app.js` faz isso). A origem precisa
+    expor o cabeçalho no CORS (ver `create_app`).
+    """
+    _ativo[0] = True
+
+    @app.before_request
+    def _verificar_escrita_recente():
+        if _escrita_recente_do_cliente():
+            g.replica_primario = True
+
+    @app.after_request
+    def _marcar_cliente(resposta):
+        if request.method not in METODOS_LEITURA and request.method != 'OPTIONS' and resposta.status_code < 400:
+            segundos = max(1, int(atraso_maximo() + 0.999))
+            resposta.set_cookie(COOKIE, '1', max_age=segundos, httponly=True, samesite='Lax')
+            resposta.headers[CABECALHO] = str(int(time.time()) + segundos)
+        return resposta
@@ -0,0 +1,83 @@
+"""Codificação JSON rápida: orjson quando instalado, senão a biblioteca padrão.
+
+Usada pelas respostas da API (`ProvedorJSON`, instalado em `app.json`), pelo
+armazenamento em arquivo (`armazenamento_json.py`) e pelos pacotes do
+Socket.IO (`JSON_SOCKETIO`). As chaves saem ordenadas, como no provedor
+padrão do Flask, e o texto é UTF-8 (sem escapar acentos).
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # sem orjson: json da biblioteca padrão
+    orjson = None
+
+MOTOR = 'orjson' if orjson is not None else 'json'
+
+
+def _padrao(obj):
+    # Tipos que nenhum dos dois motores serializa sozinho (Decimal, UUID,
+    # dataclasses, datas no formato HTTP...): mesmas regras do Flask
+    return DefaultJSONProvider.default(obj)
+
+
+if orjson is not None:
+    _OPCOES = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def para_bytes(obj, indentar=False):
+        """Serializa `obj` em bytes UTF-8 (`indentar` = 2 espaços por nível)."""
+        opcoes = _OPCOES | orjson.OPT_INDENT_2 if indentar else _OPCOES
+        return orjson.dumps(obj, default=_padrao, option=opcoes)
+
+    def carregar(dados):
+        """Lê JSON de `str` ou `bytes`."""
+        return orjson.loads(dados)
+else:
+    def para_bytes(obj, indentar=False):
+        """Serializa `obj` em bytes UTF-8 (`indentar` = 2 espaços por nível)."""
+        return json.dumps(
+            obj, default=_padrao, ensure_ascii=False, sort_keys=True,
+            indent=2 if indentar else None, separators=None if indentar else (',', ':'),
+        ).encode('utf-8')
+
+    def carregar(dados):
+        """Lê JSON de `str` ou `bytes`."""
+        return json.loads(dados)
+
+
+def para_texto(obj, indentar=False):
+    return para_bytes(obj, indentar).decode('utf-8')
+
+
+class ProvedorJSON(DefaultJSONProvider):
+    """Provedor do Flask (`app.json`) que usa `para_bytes`/`carregar`.
+
+    Afeta `jsonify`, `app.json.dumps` e `request.get_json()`.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return para_texto(obj)
+
+    def loads(self, s, **kwargs):
+        return carregar(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(para_bytes(obj), mimetype=self.mimetype)
+
+
+class _JSONSocketIO:
+    """Módulo `json` compatível com o python-socketio (`dumps` devolve `str`)."""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return para_texto(obj)
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return carregar(s)
+
+
+JSON_SOCKETIO = _JSONSocketIO()
@@ -0,0 +1,61 @@
+"""Ponto de entrada de produção.
+
+O modo assíncrono do Socket.IO é escolhido por `SOCKETIO_ASYNC_MODE`:
+
+- `threading` (padrão): uma thread por conexão; simples, mas cada aba
+  aberta no dashboard ocupa uma thread (e sua pilha) enquanto estiver
+  conectada;
+- `gevent` ou `eventlet`: uma greenlet por conexão, o que permite milhares
+  de conexões WebSocket ociosas por processo. Exigem `pip install gevent`
+  ou `pip install eventlet`.
+
+O monkey patching de gevent/eventlet precisa acontecer antes de qualquer
+outro import, por isso este módulo o faz e só então importa `main`. Se a
+variável não estiver definida e o processo já tiver sido preparado por um
+worker do gunicorn (`-k gevent` / `-k eventlet`), o modo correspondente é
+usado automaticamente.
+
+Uso:
+    python servidor.py                                   # servidor embutido
+    gunicorn -k gevent -w 1 --worker-connections 1000 servidor:app
+    gunicorn -k gthread -w 1 --threads 100 servidor:app  # modo threading
+"""
+import os
+import sys
+
+MODOS = ('threading', 'gevent', 'eventlet')
+
+
+def _detectar_modo():
+    """Modo já preparado pelo worker do gunicorn, se houver."""
+    gevent = sys.modules.get('gevent.monkey')
+    if gevent is not None and gevent.is_module_patched('socket'):
+        return 'gevent'
+    eventlet = sys.modules.get('eventlet.patcher')
+    if eventlet is not None and eventlet.is_monkey_patched('socket'):
+        return 'eventlet'
+    return 'threading'
+
+
+MODO = os.environ.get('SOCKETIO_ASYNC_MODE') or _detectar_modo()
+if MODO not in MODOS:
+    raise SystemExit(f'SOCKETIO_ASYNC_MODE inválido: {MODO!r} (use um de {", ".join(MODOS)})')
+os.environ['SOCKETIO_ASYNC_MODE'] = MODO
+
+if MODO == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif MODO == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
+from main import app, socketio  # noqa: E402
+
+if __name__ == '__main__':
+    host = os.environ.get('HOST', '0.0.0.0')
+    porta = int(os.environ.get('PORT', '5000'))
+    print(f"Servidor iniciado em http://{host}:{porta} (modo {MODO})")
+    # No modo threading o servidor embutido é o do Werkzeug; para produção
+    # prefira o gunicorn (ver docstring acima).
+    socketio.run(app, host=host, port=porta, log_output=False,
+                 allow_unsafe_werkzeug=(MODO == 'threading'))
@@ -0,0 +1,266 @@
+"""Coalescência de leituras idênticas e limite de concorrência.
+
+Quando um worker reinicia, todos os dashboards abertos reconectam o socket
+e pedem `GET /api/categorias` e `GET /api/planilhas` ao mesmo tempo. Duas
+proteções:
+
+- `@coalescer` (single-flight): leituras GET idênticas e simultâneas (mesma
+  URL, mesma codificação aceita, mesmos `If-None-Match`/`If-Modified-Since`,
+  mesma versão dos dados e mesmo destino, réplica ou primário) executam a
+  rota uma única vez; as demais
+  esperam e recebem uma cópia da mesma resposta, já serializada e
+  comprimida. Um erro também é compartilhado: uma falha do banco não é
+  repetida por cada requisição da fila.
+- `LimiteConcorrencia`: no máximo `LIMITE_CONCORRENCIA` requisições de
+  `/api/` executam ao mesmo tempo; até `LIMITE_FILA` esperam por uma vaga
+  (no máximo `LIMITE_ESPERA_S` segundos). Além disso a resposta é
+  `503 Service Unavailable` com `Retry-After` (`RETRY_AFTER_S`), em vez de
+  empilhar trabalho até estourar memória e timeouts. Quem espera por uma
+  leitura coalescida não ocupa vaga: só a execução compartilhada ocupa.
+
+`LIMITE_CONCORRENCIA=0` desliga o limite; a coalescência vale sempre que
+`instalar(app)` foi chamado.
+"""
+import functools
+import os
+import threading
+
+from flask import current_app, g, jsonify, request
+
+import replicas
+from compressao import negociar
+from metricas import Contador, Medidor, registro
+
+PREFIXO = '/api/'
+# Verificação de saúde: responde mesmo com o servidor sobrecarregado
+ISENTOS = ('/api/teste',)
+
+leituras_coalescidas = registro.adicionar(Contador(
+    'leituras_coalescidas_total', 'Leituras GET atendidas por uma execução já em andamento', ('rota',)))
+requisicoes_rejeitadas = registro.adicionar(Contador(
+    'requisicoes_rejeitadas_total', 'Requisições recusadas com 503 pelo limite de concorrência', ('motivo',)))
+# Controle instalado por último (uma aplicação por processo)
+_instalado = [None]
+
+
+def _estado():
+    controle = _instalado[0]
+    limite = controle.limite if controle is not None else None
+    return {
+        ('executando',): limite.executando if limite is not None else 0,
+        ('esperando',): limite.esperando if limite is not None else 0,
+        ('coalescendo',): controle.voos.em_andamento() if controle is not None else 0,
+    }
+
+
+registro.adicionar(Medidor(
+    'requisicoes_limitadas', 'Requisições de /api/ executando, esperando vaga e leituras coalescidas em andamento',
+    ('estado',), coletar=_estado))
+
+
+class Sobrecarga(Exception):
+    """Sem vaga no limite de concorrência (`motivo`: 'fila_cheia' ou 'espera')."""
+
+    def __init__(self, motivo):
+        super().__init__(motivo)
+        self.motivo = motivo
+
+
+# ==================== SINGLE-FLIGHT ====================
+
+class _Voo:
+    __slots__ = ('pronto', 'resultado', 'erro')
+
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class Coalescedor:
+    """Chamadas simultâneas com a mesma chave compartilham uma execução."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._voos = {}
+
+    def executar(self, chave, funcao):
+        """Retorna `(resultado, compartilhado)`; `compartilhado` é True para
+        quem aproveitou a execução de outra chamada."""
+        with self._lock:
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = _Voo()
+        if not lider:
+            voo.pronto.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.resultado, True
+        try:
+            voo.resultado = funcao()
+        except BaseException as e:
+            voo.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._voos[chave]
+            voo.pronto.set()
+        return voo.resultado, False
+
+    def em_andamento(self):
+        with self._lock:
+            return len(self._voos)
+
+
+# ==================== LIMITE DE CONCORRÊNCIA ====================
+
+class LimiteConcorrencia:
+    """No máximo `limite` execuções simultâneas e `fila` esperando por vaga."""
+
+    def __init__(self, limite, fila, espera):
+        self.limite = limite
+        self.fila = fila
+        self.espera = espera
+        self._condicao = threading.Condition()
+        self.executando = 0
+        self.esperando = 0
+
+    def entrar(self):
+        """Ocupa uma vaga, esperando até `espera` segundos; `Sobrecarga` se não conseguir."""
+        with self._condicao:
+            if self.executando < self.limite and not self.esperando:
+                self.executando += 1
+                return
+            if self.esperando >= self.fila:
+                raise Sobrecarga('fila_cheia')
+            self.esperando += 1
+            try:
+                if not self._condicao.wait_for(lambda: self.executando < self.limite, timeout=self.espera):
+                    raise Sobrecarga('espera')
+                self.executando += 1
+            finally:
+                self.esperando -= 1
+
+    def sair(self):
+        with self._condicao:
+            self.executando -= 1
+            self._condicao.notify()
+
+
+# ==================== INTEGRAÇÃO COM O FLASK ====================
+
+def coalescer(view):
+    """Marca uma rota GET para ter as chamadas idênticas e simultâneas coalescidas.
+
+    A resposta da rota deve ser completa (não em streaming) e depender só da
+    URL, dos cabeçalhos de negociação e dos dados (ver `versao` em `instalar`).
+    """
+    @functools.wraps(view)
+    def envolvida(*args, **kwargs):
+        controle = current_app.extensions.get('sobrecarga')
+        if controle is None:
+            return view(*args, **kwargs)
+        return controle.leitura(view, args, kwargs)
+
+    envolvida.coalescida = True
+    return envolvida
+
+
+def _resposta_sobrecarga(motivo, retry_after):
+    requisicoes_rejeitadas.inc(motivo)
+    resposta = jsonify({'sucesso': False, 'mensagem': 'Servidor sobrecarregado, tente novamente em instantes'})
+    resposta.status_code = 503
+    resposta.headers['Retry-After'] = str(retry_after)
+    return resposta
+
+
+class _Controle:
+    def __init__(self, limite, versao, retry_after):
+        self.limite = limite
+        self.versao = versao
+        self.retry_after = retry_after
+        self.voos = Coalescedor()
+
+    def _chave(self):
+        return (
+            request.endpoint,
+            request.full_path,
+            negociar(request.headers.get('Accept-Encoding')),
+            request.headers.get('If-None-Match'),
+            request.headers.get('If-Modified-Since'),
+            # Uma escrita concluída muda a versão: quem lê depois dela não
+            # aproveita uma leitura que começou antes
+            self.versao() if self.versao else None,
+            # Quem acabou de escrever lê do primário: não aproveita uma
+            # leitura em andamento numa réplica possivelmente atrasada
+            replicas.leitura_primaria(),
+        )
+
+    def _executar(self, view, args, kwargs):
+        """Roda a rota (ocupando uma vaga) e devolve a resposta em partes copiáveis."""
+        try:
+            if self.limite is not None:
+                self.limite.entrar()
+        except Sobrecarga as e:
+            resposta = _resposta_sobrecarga(e.motivo, self.retry_after)
+        else:
+            try:
+                resposta = current_app.make_response(view(*args, **kwargs))
+            finally:
+                if self.limite is not None:
+                    self.limite.sair()
+        if resposta.is_streamed or resposta.direct_passthrough:
+            return resposta
+        return resposta.get_data(), resposta.status_code, list(resposta.headers.items())
+
+    def leitura(self, view, args, kwargs):
+        resultado, compartilhado = self.voos.executar(self._chave(), lambda: self._executar(view, args, kwargs))
+        if not isinstance(resultado, tuple):
+            # Resposta em streaming: não dá para copiar, cada um executa a sua
+            return resultado if not compartilhado else view(*args, **kwargs)
+        if compartilhado:
+            leituras_coalescidas.inc(request.url_rule.rule if request.url_rule is not None else 'sem_rota')
+        corpo, status, cabecalhos = resultado
+        return current_app.response_class(corpo, status=status, headers=cabecalhos)
+
+
+def instalar(app, versao=None, limite=None, fila=None, espera=None, retry_after=None):
+    """Liga a coalescência (rotas com `@coalescer`) e o limite de concorrência às
+    requisições de `/api/`.
+
+    `versao()` identifica o estado dos dados (ex.: as versões dos caches);
+    os demais parâmetros, quando omitidos, vêm das variáveis de ambiente.
+    """
+    if limite is None:
+        limite = int(os.environ.get('LIMITE_CONCORRENCIA', '32'))
+    if fila is None:
+        fila = int(os.environ.get('LIMITE_FILA', '256'))
+    if espera is None:
+        espera = float(os.environ.get('LIMITE_ESPERA_S', '10'))
+    if retry_after is None:
+        retry_after = int(os.environ.get('RETRY_AFTER_S', '1'))
+    controle_limite = LimiteConcorrencia(limite, fila, espera) if limite > 0 else None
+    _instalado[0] = app.extensions['sobrecarga'] = _Controle(controle_limite, versao, retry_after)
+
+    if controle_limite is None:
+        return
+
+    @app.before_request
+    def _ocupar_vaga():
+        if not request.path.startswith(PREFIXO) or request.path in ISENTOS:
+            return None
+        view = app.view_functions.get(request.endpoint)
+        if getattr(view, 'coalescida', False):
+            return None  # a vaga é ocupada só pela execução compartilhada
+        try:
+            controle_limite.entrar()
+        except Sobrecarga as e:
+            return _resposta_sobrecarga(e.motivo, retry_after)
+        g.sobrecarga_vaga = True
+        return None
+
+    @app.teardown_request
+    def _liberar_vaga(_erro=None):
+        if g.pop('sobrecarga_vaga', False):
+            controle_limite.sair()
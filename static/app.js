@@ -91,14 +91,99 @@ const api = {
   planilhas: `${API_BASE_URL}/api/planilhas`
 };
 
+// Leitura das próprias escritas com réplicas do banco: depois de uma escrita
+// o servidor responde com X-Leitura-Primaria (até quando ler do primário).
+// Devolvemos o valor nas requisições seguintes enquanto ele valer; em outro
+// domínio o fetch não envia o cookie equivalente.
+const CABECALHO_LEITURA_PRIMARIA = 'X-Leitura-Primaria';
+let leituraPrimariaAte = null;
+
+async function requisitar(url, opcoes = {}) {
+  const headers = { ...(opcoes.headers || {}) };
+  if (leituraPrimariaAte !== null && Date.now() / 1000 < Number(leituraPrimariaAte)) {
+    headers[CABECALHO_LEITURA_PRIMARIA] = leituraPrimariaAte;
+  }
+  const res = await fetch(url, { ...opcoes, headers });
+  const ate = res.headers.get(CABECALHO_LEITURA_PRIMARIA);
+  if (ate) leituraPrimariaAte = ate;
+  return res;
+}
+
 // ========== WEBSOCKET PARA ATUALIZAÇÕES EM TEMPO REAL ==========
+// Protocolo delta: o servidor agrupa as alterações e envia um único evento
+// `alteracoes` numerado (epoca + seq). Se uma mensagem se perder, pedimos ao
+// servidor só o que falta (`ressincronizar`) em vez de recarregar tudo.
+// Com vários workers cada um tem a sua época, então guardamos um seq por época.
 let socket = null;
+let seqs = null;               // epoca -> último seq aplicado
+const ressincronizando = new Set();
+
+function pedirRessincronizacao(epoca) {
+  if (ressincronizando.has(epoca)) return;
+  ressincronizando.add(epoca);
+  socket.emit('ressincronizar', { epoca, desde: seqs[epoca] || 0 });
+}
+
+function recarregarTudo(epocas) {
+  ressincronizando.clear();
+  seqs = { ...epocas };
+  atualizarCategorias();
+  atualizarPlanilhas();
+}
+
+function aplicarAlteracoes(mensagem) {
+  seqs[mensagem.epoca] = mensagem.seq;
+  let mudouCategorias = false;
+  let mudouPlanilhas = false;
+  let recarregarCategorias = false;
+  let recarregarPlanilhas = false;
+
+  mensagem.alteracoes.forEach(alt => {
+    if (alt.entidade === 'categoria') {
+      mudouCategorias = true;
+      if (alt.acao === 'recarregar') {
+        recarregarCategorias = true;
+      } else if (alt.acao === 'gravar') {
+        categoriasAtuais = categoriasAtuais.filter(c => c.id !== alt.dado.id).concat([alt.dado]);
+        categoriasAtuais.sort((a, b) => a.id - b.id);
+      } else if (alt.acao === 'remover') {
+        categoriasAtuais = categoriasAtuais.filter(c => !alt.ids.includes(c.id));
+        categoriasSelecionadas = categoriasSelecionadas.filter(id => !alt.ids.includes(id));
+      }
+    } else if (alt.entidade === 'planilha') {
+      mudouPlanilhas = true;
+      if (alt.acao === 'recarregar') {
+        recarregarPlanilhas = true;
+      } else if (alt.acao === 'gravar') {
+        planilhasVisiveis = planilhasVisiveis.filter(p => p.id !== alt.dado.id);
+        if (planilhaVisivel(alt.dado)) {
+          planilhasVisiveis.push(alt.dado);
+          planilhasVisiveis.sort((a, b) => a.id - b.id);
+        }
+      } else if (alt.acao === 'remover') {
+        planilhasVisiveis = planilhasVisiveis.filter(p => !alt.ids.includes(p.id));
+      }
+    }
+  });
+
+  if (recarregarCategorias) {
+    atualizarCategorias();
+  } else if (mudouCategorias) {
+    renderizarCategorias();
+  }
+  if (recarregarPlanilhas) {
+    atualizarPlanilhas();
+  } else if (mudouPlanilhas || mudouCategorias) {
+    renderizarPlanilhas();
+  }
+}
 
 function conectarWebSocket() {
   // Conecta ao WebSocket usando a mesma URL base da API
   const socketUrl = API_BASE_URL || window.location.origin;
   socket = io(socketUrl, {
     transports: ['websocket', 'polling'],
+    query: { protocolo: 'delta' },
     reconnection: true,
     reconnectionDelay: 1000,
     reconnectionAttempts: 5
@@ -112,58 +197,56 @@ function conectarWebSocket() {
     console.log('Desconectado do servidor WebSocket');
   });
 
-  // Escuta eventos de categorias
-  socket.on('categoria_criada', (data) => {
-    console.log('Categoria criada:', data);
-    atualizarCategorias();
-    atualizarPlanilhas();
-  });
-
-  socket.on('categoria_editada', (data) => {
-    console.log('Categoria editada:', data);
-    atualizarCategorias();
-    atualizarPlanilhas();
-  });
-
-  socket.on('categoria_deletada', (data) => {
-    console.log('Categoria deletada:', data);
-    categoriasSelecionadas = [];
-    atualizarCategorias();
-    atualizarPlanilhas();
-  });
-
-  // Escuta eventos de planilhas
-  socket.on('planilha_criada', (data) => {
-    console.log('Planilha criada:', data);
-    atualizarPlanilhas();
-  });
-
-  socket.on('planilha_editada', (data) => {
-    console.log('Planilha editada:', data);
-    atualizarPlanilhas();
+  // Enviado a cada conexão: numa reconexão, recupera o que foi perdido
+  socket.on('estado', (estado) => {
+    if (seqs === null) {
+      seqs = { ...estado.epocas };
+      return;
+    }
+    // Época que o servidor não conhece (worker reiniciado): não há como saber o que se perdeu
+    if (Object.keys(seqs).some(epoca => !(epoca in estado.epocas))) {
+      recarregarTudo(estado.epocas);
+      return;
+    }
+    Object.entries(estado.epocas).forEach(([epoca, seq]) => {
+      if (seq > (seqs[epoca] || 0)) pedirRessincronizacao(epoca);
+    });
   });
 
-  socket.on('planilha_deletada', (data) => {
-    console.log('Planilha deletada:', data);
-    atualizarPlanilhas();
+  socket.on('alteracoes', (mensagem) => {
+    if (seqs === null || ressincronizando.has(mensagem.epoca)) return;
+    const atual = seqs[mensagem.epoca] || 0;
+    if (mensagem.seq <= atual) return;
+    if (mensagem.seq !== atual + 1) {
+      console.log('Mensagens perdidas, ressincronizando');
+      pedirRessincronizacao(mensagem.epoca);
+      return;
+    }
+    aplicarAlteracoes(mensagem);
   });
 
-  socket.on('planilhas_atualizadas', () => {
-    console.log('Planilhas atualizadas');
-    atualizarPlanilhas();
+  socket.on('ressincronizacao', (resposta) => {
+    if (resposta.completo) {
+      recarregarTudo(resposta.epocas);
+      return;
+    }
+    ressincronizando.delete(resposta.epoca);
+    resposta.mensagens.forEach(m => {
+      if (m.seq > (seqs[m.epoca] || 0)) aplicarAlteracoes(m);
+    });
   });
 }
 
 // ========== CATEGORIAS ==========
 async function carregarCategorias() {
-  const res = await fetch(api.categorias);
+  const res = await requisitar(api.categorias);
   const data = await res.json();
   return data.dados || [];
 }
 
 async function criarCategoria(nome) {
   try {
-    const res = await fetch(api.categorias, {
+    const res = await requisitar(api.categorias, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ nome })
@@ -179,7 +262,7 @@ async function criarCategoria(nome) {
 
 async function editarCategoria(id, nome) {
   try {
-    const res = await fetch(`${api.categorias}/${id}`, {
+    const res = await requisitar(`${api.categorias}/${id}`, {
       method: 'PUT',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ nome })
@@ -195,7 +278,7 @@ async function editarCategoria(id, nome) {
 
 async function deletarCategoria(id) {
   try {
-    const res = await fetch(`${api.categorias}/${id}`, { method: 'DELETE' });
+    const res = await requisitar(`${api.categorias}/${id}`, { method: 'DELETE' });
     const data = await res.json();
     if (!res.ok) throw new Error(data.mensagem || 'Erro ao deletar categoria');
     return data;
@@ -206,10 +289,24 @@ async function deletarCategoria(id) {
 }
 
 // ========== PLANILHAS ==========
-async function carregarPlanilhas() {
-  const res = await fetch(api.planilhas);
-  const data = await res.json();
-  return data.dados || [];
+// Campos usados pelos cards (evita baixar timestamps e demais campos)
+const CAMPOS_CARD = 'id,titulo,url,imagem,categorias';
+
+// Carrega planilhas. Com filtros ({ categoria, q, fields, ... }) a API responde
+// paginado e as páginas são seguidas pelo `proximo_cursor`.
+async function carregarPlanilhas(filtros = {}) {
+  const dados = [];
+  let cursor = null;
+  do {
+    const params = new URLSearchParams(filtros);
+    if (cursor !== null) params.set('cursor', cursor);
+    const query = params.toString();
+    const res = await requisitar(query ? `${api.planilhas}?${query}` : api.planilhas);
+    const data = await res.json();
+    dados.push(...(data.dados || []));
+    cursor = data.proximo_cursor ?? null;
+  } while (cursor !== null);
+  return dados;
 }
 
 // Criar planilha (agora com campo opcional de imagem)
@@ -226,7 +323,7 @@ async function criarPlanilha(titulo, url, categoriaId, imagem) {
       body.imagem = imagem.trim();
     }
 
-    const res = await fetch(api.planilhas, {
+    const res = await requisitar(api.planilhas, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(body)
@@ -258,7 +355,7 @@ async function editarPlanilha(id, titulo, url, categoriaId, imagem) {
       }
     }
 
-    const res = await fetch(`${api.planilhas}/${id}`, {
+    const res = await requisitar(`${api.planilhas}/${id}`, {
       method: 'PUT',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(body)
@@ -274,7 +371,7 @@ async function editarPlanilha(id, titulo, url, categoriaId, imagem) {
 
 async function deletarPlanilha(id) {
   try {
-    const res = await fetch(`${api.planilhas}/${id}`, { method: 'DELETE' });
+    const res = await requisitar(`${api.planilhas}/${id}`, { method: 'DELETE' });
     const data = await res.json();
     if (!res.ok) throw new Error(data.mensagem || 'Erro ao deletar planilha');
     return data;
@@ -295,6 +392,10 @@ const searchInput = document.querySelector('.search');
 
 let categoriasSelecionadas = [];
 let termoPesquisa = '';
+// Estado exibido: atualizado por fetch ou pelas alterações recebidas via WebSocket
+let categoriasAtuais = [];
+let planilhasVisiveis = [];
+let pedidoPlanilhas = 0;
 
 // Event listener para pesquisa de planilhas
 if (searchInput) {
@@ -373,7 +474,12 @@ sidebarDelBtn.onclick = async () => {
 // Formulário removido - criação de planilha agora acontece via modal
 
 async function atualizarCategorias() {
-  const categorias = await carregarCategorias();
+  categoriasAtuais = await carregarCategorias();
+  renderizarCategorias();
+}
+
+function renderizarCategorias() {
+  const categorias = categoriasAtuais;
   
   // Atualiza select
   selectCategoria.innerHTML = '<option value="">Selecione a categoria</option>';
@@ -407,28 +513,48 @@ async function atualizarCategorias() {
 }
 
 async function atualizarPlanilhas() {
-  const planilhas = await carregarPlanilhas();
-  const categorias = await carregarCategorias();
+  // Ignora respostas de buscas antigas (ex.: digitação rápida na pesquisa)
+  const pedido = ++pedidoPlanilhas;
+  if (categoriasAtuais.length === 0) {
+    categoriasAtuais = await carregarCategorias();
+  }
   
-  // Filtrar planilhas pela pesquisa primeiro (pesquisa tem prioridade)
+  // Filtrar planilhas pela pesquisa primeiro (pesquisa tem prioridade);
+  // o filtro é feito pela API, que devolve só os campos usados nos cards
   let planilhasFiltradas = [];
   
   if (termoPesquisa.length > 0) {
     // Se houver pesquisa, mostrar de TODAS as categorias
-    planilhasFiltradas = planilhas.filter(p =>
-      p.titulo.toLowerCase().includes(termoPesquisa)
-    );
+    planilhasFiltradas = await carregarPlanilhas({ q: termoPesquisa, fields: CAMPOS_CARD });
   } else if (categoriasSelecionadas.length > 0) {
     // Se não houver pesquisa, filtrar pela categoria selecionada
     const categoriaId = categoriasSelecionadas[0];
-    planilhasFiltradas = planilhas.filter(p => 
-      p.categorias && p.categorias.includes(categoriaId)
-    );
+    planilhasFiltradas = await carregarPlanilhas({ categoria: categoriaId, fields: CAMPOS_CARD });
   } else {
     // Sem pesquisa e sem categoria selecionada: não mostra nada para evitar confusão
     planilhasFiltradas = [];
   }
   
+  if (pedido !== pedidoPlanilhas) return;
+  planilhasVisiveis = planilhasFiltradas;
+  renderizarPlanilhas();
+}
+
+// Critério da tela atual, usado para aplicar as alterações recebidas via WebSocket
+function planilhaVisivel(planilha) {
+  if (termoPesquisa.length > 0) {
+    return planilha.titulo.toLowerCase().includes(termoPesquisa);
+  }
+  if (categoriasSelecionadas.length > 0) {
+    return !!planilha.categorias && planilha.categorias.includes(categoriasSelecionadas[0]);
+  }
+  return false;
+}
+
+function renderizarPlanilhas() {
+  const categorias = categoriasAtuais;
+  const planilhasFiltradas = planilhasVisiveis;
+  
   listaPlanilhas.innerHTML = '';
   
   // Se nenhuma planilha encontrada
@@ -0,0 +1,78 @@
+"""Fixtures dos testes: a aplicação roda com o SQLite embutido num diretório temporário.
+
+`main` lê a configuração de armazenamento no import, então o ambiente é
+definido aqui, antes de qualquer teste importar o módulo. Os arquivos JSON
+relativos (`dados.json`, `categorias.json`) também ficam no diretório
+temporário, longe dos dados do repositório.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+_DIRETORIO = tempfile.mkdtemp(prefix='dashboards-testes-')
+for _variavel in ('DATABASE_URL', 'DATABASE_REPLICA_URLS', 'SOCKETIO_MESSAGE_QUEUE'):
+    os.environ.pop(_variavel, None)
+os.environ['ARMAZENAMENTO'] = 'sqlite'
+os.environ['SQLITE_PATH'] = os.path.join(_DIRETORIO, 'dados.db')
+os.chdir(_DIRETORIO)
+
+
+@pytest.fixture(scope='session')
+def app():
+    import main
+    import migracoes
+
+    engine = migracoes.criar_engine(main.database_url)
+    migracoes.migrar(engine)
+    engine.dispose()
+    return main.app
+
+
+@pytest.fixture
+def banco(app):
+    """Banco vazio no início de cada teste (o commit também invalida os caches)."""
+    import main
+
+    with app.app_context():
+        main.db.session.execute(main.planilha_categoria.delete())
+        main.db.session.execute(main.db.delete(main.Planilha))
+        main.db.session.execute(main.db.delete(main.Categoria))
+        main.db.session.commit()
+    return main.db
+
+
+@pytest.fixture
+def cliente(app, banco):
+    return app.test_client()
+
+
+class ContadorConsultas:
+    """Conta os comandos SQL enviados ao banco dentro do bloco `with`."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.total = 0
+
+    def _contar(self, *_):
+        self.total += 1
+
+    def __enter__(self):
+        self.total = 0
+        event.listen(self.engine, 'before_cursor_execute', self._contar)
+        return self
+
+    def __exit__(self, *_):
+        event.remove(self.engine, 'before_cursor_execute', self._contar)
+
+
+@pytest.fixture
+def consultas(app, banco):
+    with app.app_context():
+        engine = banco.engine
+    return ContadorConsultas(engine)
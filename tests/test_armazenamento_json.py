@@ -0,0 +1,56 @@
+"""Snapshot + journal: operações inválidas não corrompem o arquivo."""
+import json
+
+import pytest
+
+from armazenamento_json import ArquivoJSON
+
+
+def _abrir(diretorio):
+    # Mesmo formato de índice do `arquivo_planilhas`, sem tolerar valores inválidos
+    return ArquivoJSON(str(diretorio / 'dados.json'), sincronizar_disco=False,
+                       indices={'categorias': lambda p: p.get('categorias') or [None]})
+
+
+def test_operacao_invalida_nao_vai_para_o_journal(tmp_path):
+    arquivo = _abrir(tmp_path)
+    with arquivo.transacao() as t:
+        t.gravar({'id': t.proximo_id(), 'titulo': 'A', 'categorias': [1]})
+    journal = (tmp_path / 'dados.json.journal').read_bytes()
+
+    with pytest.raises(TypeError):
+        with arquivo.transacao() as t:
+            t.gravar({'id': 2, 'titulo': 'B'})
+            t.gravar({'id': 1, 'titulo': 'A', 'categorias': 5})
+
+    # Nada da transação foi aplicado nem gravado
+    assert (tmp_path / 'dados.json.journal').read_bytes() == journal
+    assert arquivo.ler() == [{'id': 1, 'titulo': 'A', 'categorias': [1]}]
+    assert arquivo.buscar('categorias', 1) == [{'id': 1, 'titulo': 'A', 'categorias': [1]}]
+
+    reaberto = _abrir(tmp_path)
+    assert reaberto.ler() == [{'id': 1, 'titulo': 'A', 'categorias': [1]}]
+    with reaberto.transacao() as t:
+        assert t.proximo_id() == 2
+
+
+def test_journal_com_operacao_invalida_reabre(tmp_path):
+    linhas = [
+        {'op': 'gravar', 'item': {'id': 1, 'titulo': 'A', 'categorias': [1]}},
+        # Gravada por uma versão sem validação
+        {'op': 'gravar', 'item': {'id': 1, 'titulo': 'A', 'categorias': 5}},
+        {'op': 'gravar', 'item': {'id': 2, 'titulo': 'B', 'categorias': []}},
+    ]
+    (tmp_path / 'dados.json.journal').write_text(''.join(json.dumps(op) + '\n' for op in linhas))
+
+    arquivo = _abrir(tmp_path)
+    # A operação inválida é descartada; as seguintes continuam valendo
+    assert arquivo.ler() == [linhas[0]['item'], linhas[2]['item']]
+    assert [p['id'] for p in arquivo.buscar('categorias', None)] == [2]
+    with arquivo.transacao() as t:
+        novo = t.proximo_id()
+        t.gravar({'id': novo, 'titulo': 'C'})
+    assert novo == 3
+
+    reaberto = _abrir(tmp_path)
+    assert [p['id'] for p in reaberto.ler()] == [1, 2, 3]
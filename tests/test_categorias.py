@@ -0,0 +1,46 @@
+"""Remoção de categorias: as planilhas da categoria saem junto, tudo ou nada."""
+
+
+def _semear(cliente):
+    categoria = cliente.post('/api/categorias', json={'nome': 'Vendas'}).get_json()['dado']
+    outra = cliente.post('/api/categorias', json={'nome': 'Compras'}).get_json()['dado']
+    dentro = cliente.post('/api/planilhas', json={
+        'titulo': 'Dentro', 'url': 'https://exemplo.com/d', 'categorias': [categoria['id'], outra['id']]})
+    fora = cliente.post('/api/planilhas', json={
+        'titulo': 'Fora', 'url': 'https://exemplo.com/f', 'categorias': [outra['id']]})
+    return categoria, dentro.get_json()['dado'], fora.get_json()['dado']
+
+
+def test_remocao_leva_as_planilhas_da_categoria(cliente):
+    categoria, dentro, fora = _semear(cliente)
+
+    resposta = cliente.delete(f'/api/categorias/{categoria["id"]}')
+
+    assert resposta.status_code == 200
+    assert resposta.get_json()['dado']['id'] == categoria['id']
+    assert [p['id'] for p in cliente.get('/api/planilhas').get_json()['dados']] == [fora['id']]
+    assert cliente.get(f'/api/categorias/{categoria["id"]}').status_code == 404
+
+
+def test_remocao_de_categoria_inexistente(cliente):
+    resposta = cliente.delete('/api/categorias/999')
+    assert resposta.status_code == 404
+    assert resposta.get_json()['sucesso'] is False
+
+
+def test_falha_depois_da_cascata_nao_remove_nada(cliente, monkeypatch):
+    import main
+
+    categoria, dentro, fora = _semear(cliente)
+    antes = cliente.get('/api/planilhas').get_json()['dados']
+
+    def falhar(categoria_id, confirmar=True):
+        raise RuntimeError('banco fora do ar')
+
+    monkeypatch.setattr(main, 'remover_categoria', falhar)
+    resposta = cliente.delete(f'/api/categorias/{categoria["id"]}')
+
+    assert resposta.status_code == 500
+    # As planilhas da categoria e as associações continuam lá
+    assert cliente.get('/api/planilhas').get_json()['dados'] == antes
+    assert cliente.get(f'/api/categorias/{categoria["id"]}').status_code == 200
@@ -0,0 +1,56 @@
+"""Número de comandos SQL por rota: não pode crescer com o número de linhas (N+1)."""
+import pytest
+
+
+def _semear(cliente, planilhas, categorias=3):
+    ids = [cliente.post('/api/categorias', json={'nome': f'Categoria {i}'}).get_json()['dado']['id']
+           for i in range(categorias)]
+    for i in range(planilhas):
+        resposta = cliente.post('/api/planilhas', json={
+            'titulo': f'Planilha {i}', 'url': f'https://exemplo.com/{i}', 'categorias': ids[:1 + i % categorias]})
+        assert resposta.status_code == 201
+    return ids
+
+
+@pytest.mark.parametrize('planilhas', [5, 200])
+def test_listagem_completa_usa_duas_consultas(cliente, consultas, planilhas):
+    _semear(cliente, planilhas)
+    with consultas:
+        resposta = cliente.get('/api/planilhas')
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()['dados']) == planilhas
+    # Planilhas + todas as associações
+    assert consultas.total == 2
+
+
+@pytest.mark.parametrize('planilhas', [5, 200])
+def test_pagina_filtrada_usa_duas_consultas(cliente, consultas, planilhas):
+    ids = _semear(cliente, planilhas)
+    with consultas:
+        resposta = cliente.get(f'/api/planilhas?limit=50&categoria={ids[0]}')
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()['dados']) == min(50, planilhas)
+    # A página + as associações da página
+    assert consultas.total == 2
+
+
+def test_listagem_em_cache_nao_consulta_o_banco(cliente, consultas):
+    _semear(cliente, 20)
+    cliente.get('/api/planilhas')
+    with consultas:
+        assert cliente.get('/api/planilhas').status_code == 200
+    assert consultas.total == 0
+
+
+def test_criacao_nao_depende_do_numero_de_categorias(cliente, consultas):
+    ids = _semear(cliente, 0, categorias=40)
+    totais = []
+    for quantidade in (1, 10, 40):
+        with consultas:
+            resposta = cliente.post('/api/planilhas', json={
+                'titulo': 'Nova', 'url': 'https://exemplo.com/nova', 'categorias': ids[:quantidade]})
+        assert resposta.status_code == 201
+        assert resposta.get_json()['dado']['categorias'] == ids[:quantidade]
+        totais.append(consultas.total)
+    assert totais == [totais[0]] * 3
+    assert totais[0] == 5
@@ -0,0 +1,123 @@
+"""Importação NDJSON (`POST /api/planilhas/bulk`)."""
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def arquivos(app, tmp_path, monkeypatch):
+    """`main` com arquivos JSON novos e vazios (o modo JSON, sem depender do banco)."""
+    import busca
+    import main
+    from armazenamento_json import ArquivoJSON
+
+    monkeypatch.setattr(main, 'arquivo_categorias', ArquivoJSON(str(tmp_path / 'categorias.json')))
+    monkeypatch.setattr(main, 'arquivo_planilhas', ArquivoJSON(str(tmp_path / 'dados.json'), indices={
+        'categorias': main._chaves_categorias,
+        'texto': busca.IndiceTexto(),
+    }))
+    return main
+
+
+def _linhas(registros, antes_do_fim=None):
+    import main
+
+    for numero, registro in enumerate(registros, 1):
+        yield numero, main._validar_registro_importacao(registro)
+    if antes_do_fim is not None:
+        antes_do_fim()
+
+
+def test_importacao_json_nao_perde_escrita_concorrente(arquivos):
+    main = arquivos
+    no_meio = threading.Event()
+    liberar = threading.Event()
+
+    def pausar():
+        no_meio.set()
+        liberar.wait(5)
+
+    importacao = threading.Thread(target=main._importar_ndjson_json, args=(_linhas([
+        {'tipo': 'categoria', 'nome': 'Vendas'},
+        {'titulo': 'Importada', 'url': 'https://exemplo.com/i', 'categorias': [1]},
+    ], antes_do_fim=pausar),))
+    importacao.start()
+    assert no_meio.wait(5)
+
+    def gravar_concorrente():
+        # O que POST /api/planilhas faz no modo JSON
+        with main.arquivo_planilhas.transacao() as t:
+            t.gravar({'id': t.proximo_id(), 'titulo': 'Concorrente', 'url': 'https://exemplo.com/c'})
+
+    concorrente = threading.Thread(target=gravar_concorrente)
+    concorrente.start()
+    concorrente.join(0.2)
+    # Espera a importação terminar em vez de gravar por baixo dela
+    assert concorrente.is_alive()
+
+    liberar.set()
+    importacao.join(5)
+    concorrente.join(5)
+    planilhas = main.arquivo_planilhas.ler()
+    assert sorted((p['id'], p['titulo']) for p in planilhas) == [(1, 'Importada'), (2, 'Concorrente')]
+    assert main.arquivo_planilhas.obter(1)['categorias'] == [1]
+
+
+# Auto-ID seguido de ID explícito igual, categoria definida depois das
+# planilhas que a usam, referência inválida e categoria repetida
+ENTRADA = [
+    {'titulo': 'A', 'url': 'https://exemplo.com/a', 'categorias': [1, 2]},
+    {'id': 1, 'titulo': 'B', 'url': 'https://exemplo.com/b'},
+    {'id': 5, 'titulo': 'C', 'url': 'https://exemplo.com/c', 'categorias': [1, {'x': 1}, '2', 99]},
+    {'titulo': 'D', 'url': 'https://exemplo.com/d'},
+    {'tipo': 'categoria', 'nome': 'Definida depois'},
+    {'tipo': 'categoria', 'id': 1, 'nome': 'Repetida'},
+]
+ESPERADO_PLANILHAS = [(1, 'A', [1]), (2, 'D', []), (5, 'C', [1])]
+ESPERADO_ERROS = [
+    {'linha': 2, 'mensagem': 'Planilha com ID 1 já existe'},
+    {'linha': 6, 'mensagem': 'Categoria com ID 1 já existe'},
+]
+
+
+def _ndjson(registros):
+    import json
+
+    return '\n'.join(json.dumps(r) for r in registros)
+
+
+def test_importacao_no_banco(cliente):
+    resposta = cliente.post('/api/planilhas/bulk', data=_ndjson(ENTRADA))
+
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert (corpo['planilhas'], corpo['categorias'], corpo['erros']) == (3, 1, ESPERADO_ERROS)
+    dados = cliente.get('/api/planilhas').get_json()['dados']
+    assert [(p['id'], p['titulo'], p['categorias']) for p in dados] == ESPERADO_PLANILHAS
+    # Os próximos IDs automáticos continuam depois dos importados
+    nova = cliente.post('/api/planilhas', json={'titulo': 'E', 'url': 'https://exemplo.com/e'})
+    assert nova.get_json()['dado']['id'] == 6
+
+
+def test_importacao_nos_arquivos_json_tem_o_mesmo_resultado(arquivos):
+    main = arquivos
+    resultado = main._importar_ndjson_json(_linhas(ENTRADA))
+
+    assert (resultado.planilhas, resultado.categorias, resultado.erros) == (3, 1, ESPERADO_ERROS)
+    planilhas = main.arquivo_planilhas.ler()
+    assert sorted((p['id'], p['titulo'], p['categorias']) for p in planilhas) == ESPERADO_PLANILHAS
+
+
+def test_erro_do_banco_nao_expoe_sql(cliente, monkeypatch):
+    import main
+    from sqlalchemy.exc import IntegrityError
+
+    def falhar(linhas):
+        list(linhas)
+        raise IntegrityError('INSERT INTO planilhas (id) VALUES (?)', (1,), Exception('UNIQUE constraint failed'))
+
+    monkeypatch.setattr(main, '_importar_ndjson_db', falhar)
+    resposta = cliente.post('/api/planilhas/bulk', data=_ndjson(ENTRADA[:1]))
+
+    assert resposta.status_code == 500
+    assert 'INSERT' not in resposta.get_json()['mensagem']
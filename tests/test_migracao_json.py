@@ -0,0 +1,45 @@
+"""`POST /api/migrate`: cópia dos arquivos JSON para o banco, tudo ou nada."""
+import pytest
+
+
+@pytest.fixture
+def origem(app):
+    import main
+
+    yield main.arquivo_categorias, main.arquivo_planilhas
+    main.arquivo_categorias.substituir([])
+    main.arquivo_planilhas.substituir([])
+
+
+def test_migracao_copia_categorias_e_planilhas(cliente, origem):
+    categorias, planilhas = origem
+    categorias.substituir([{'id': 7, 'nome': 'Vendas'}])
+    planilhas.substituir([
+        {'id': 1, 'titulo': 'A', 'url': 'https://exemplo.com/a', 'categorias': [7]},
+        {'id': 2, 'titulo': 'B', 'url': 'https://exemplo.com/b', 'categorias': []},
+    ])
+
+    resposta = cliente.post('/api/migrate')
+
+    assert resposta.status_code == 200
+    assert resposta.get_json()['planilhas'] == 2
+    dados = cliente.get('/api/planilhas').get_json()['dados']
+    assert [(p['id'], p['categorias']) for p in dados] == [(1, [7]), (2, [])]
+
+
+def test_linha_invalida_desfaz_a_migracao(cliente, origem):
+    existente = cliente.post('/api/planilhas', json={'titulo': 'Existente', 'url': 'https://exemplo.com/x'})
+    categorias, planilhas = origem
+    categorias.substituir([{'id': 7, 'nome': 'Vendas'}])
+    planilhas.substituir([
+        {'id': 1, 'titulo': 'A', 'url': 'https://exemplo.com/a', 'categorias': [7]},
+        {'id': 2, 'url': 'https://exemplo.com/sem-titulo'},
+    ])
+
+    resposta = cliente.post('/api/migrate')
+
+    assert resposta.status_code == 500
+    assert resposta.get_json()['sucesso'] is False
+    # Nada foi apagado: o banco continua como antes da tentativa
+    assert cliente.get('/api/planilhas').get_json()['dados'] == [existente.get_json()['dado']]
+    assert cliente.get('/api/categorias').get_json()['dados'] == []
@@ -0,0 +1,44 @@
+"""Validação das rotas de planilhas."""
+import pytest
+
+
+@pytest.fixture
+def planilha(cliente):
+    return cliente.post('/api/planilhas', json={'titulo': 'A', 'url': 'https://exemplo.com/a'}).get_json()['dado']
+
+
+@pytest.mark.parametrize('categorias', [5, 'abc', [1, 'x'], [True], {'id': 1}])
+def test_edicao_recusa_categorias_malformadas(cliente, planilha, categorias):
+    resposta = cliente.put(f'/api/planilhas/{planilha["id"]}', json={'categorias': categorias})
+    assert resposta.status_code == 400
+    assert resposta.get_json()['sucesso'] is False
+    assert cliente.get(f'/api/planilhas/{planilha["id"]}').get_json()['dado'] == planilha
+
+
+def test_edicao_recusa_categoria_inexistente(cliente, planilha):
+    resposta = cliente.put(f'/api/planilhas/{planilha["id"]}', json={'categorias': [999]})
+    assert resposta.status_code == 400
+    assert '999' in resposta.get_json()['mensagem']
+
+
+def test_edicao_substitui_categorias(cliente, planilha):
+    ids = [cliente.post('/api/categorias', json={'nome': n}).get_json()['dado']['id'] for n in ('X', 'Y')]
+    resposta = cliente.put(f'/api/planilhas/{planilha["id"]}', json={'titulo': 'B', 'categorias': ids})
+    assert resposta.status_code == 200
+    assert resposta.get_json()['dado']['categorias'] == ids
+    dado = cliente.get(f'/api/planilhas/{planilha["id"]}').get_json()['dado']
+    assert (dado['titulo'], dado['categorias']) == ('B', ids)
+
+
+def test_criacao_recusa_categorias_que_nao_sao_lista(cliente):
+    resposta = cliente.post('/api/planilhas', json={'titulo': 'A', 'url': 'https://exemplo.com/a', 'categorias': 5})
+    assert resposta.status_code == 400
+    assert cliente.get('/api/planilhas').get_json()['dados'] == []
+
+
+def test_indice_de_categorias_tolera_valor_malformado():
+    import main
+
+    assert main._chaves_categorias({'categorias': 5}) == [None]
+    assert main._chaves_categorias({'categorias': [3, 'x', {}]}) == [3]
+    assert main._chaves_categorias({}) == [None]
@@ -0,0 +1,144 @@
+"""Roteamento para réplicas: GETs nas réplicas, escritas no primário, e leitura
+das próprias escritas pelo cookie, pelo cabeçalho `X-Leitura-Primaria` e por
+`replicas.leitura_primaria()`.
+
+`main` lê `DATABASE_URL`/`DATABASE_REPLICA_URLS` no import e só há uma
+aplicação por processo, então o cenário roda num subprocesso com um primário
+e duas réplicas SQLite. Cada arquivo tem uma planilha diferente, e o título
+devolvido mostra de qual banco veio a leitura. O subprocesso imprime o que
+observou (JSON) e as verificações ficam aqui.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import migracoes
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CENARIO = r'''
+import json
+import time
+
+import main
+import replicas
+
+app = main.app
+observado = {}
+
+
+def titulos(cliente, **kwargs):
+    resposta = cliente.get('/api/planilhas?limit=50', **kwargs)
+    return sorted(p['titulo'] for p in resposta.get_json()['dados'])
+
+
+def leitura_primaria(**kwargs):
+    with app.test_request_context('/api/planilhas', **kwargs):
+        for funcao in app.before_request_funcs[None]:
+            if funcao.__name__ == '_verificar_escrita_recente':
+                funcao()
+        return replicas.leitura_primaria()
+
+
+# Sem escrita recente: rodízio entre as réplicas
+observado['leituras'] = [titulos(app.test_client()) for _ in range(4)]
+observado['leitura_primaria_sem_escrita'] = leitura_primaria()
+
+escritor = app.test_client()
+resposta = escritor.post('/api/planilhas', json={'titulo': 'Nova', 'url': 'https://exemplo.com/nova'})
+cabecalho = resposta.headers.get(replicas.CABECALHO)
+observado['escrita'] = resposta.status_code
+observado['cookie'] = escritor.get_cookie(replicas.COOKIE) is not None
+observado['cabecalho_no_futuro'] = cabecalho is not None and float(cabecalho) > time.time()
+# Logo depois de um commit, o processo inteiro lê do primário
+observado['processo_apos_escrita'] = titulos(app.test_client())
+observado['leitura_primaria_apos_escrita'] = leitura_primaria()
+
+# Daqui em diante o processo faz de conta que é outro worker, que não viu o commit
+replicas._primario_ate[0] = 0.0
+observado['escritor_com_cookie'] = titulos(escritor)
+observado['outro_cliente'] = titulos(app.test_client())
+observado['com_cabecalho'] = titulos(app.test_client(), headers={replicas.CABECALHO: cabecalho})
+observado['cabecalho_vencido'] = titulos(
+    app.test_client(), headers={replicas.CABECALHO: str(int(time.time()) - 1)})
+observado['leitura_primaria_com_cabecalho'] = leitura_primaria(headers={replicas.CABECALHO: cabecalho})
+observado['leitura_primaria_com_cookie'] = leitura_primaria(
+    headers={'Cookie': f'{replicas.COOKIE}=1'})
+observado['leitura_primaria_sem_sinal'] = leitura_primaria()
+print(json.dumps(observado))
+'''
+
+
+def _banco(caminho, titulo):
+    engine = migracoes.criar_engine(f'sqlite:///{caminho}')
+    migracoes.migrar(engine)
+    engine.dispose()
+    with sqlite3.connect(caminho) as conexao:
+        conexao.execute('INSERT INTO planilhas (titulo, url) VALUES (?, ?)', (titulo, f'https://exemplo.com/{titulo}'))
+    return caminho
+
+
+def _titulos(caminho):
+    with sqlite3.connect(caminho) as conexao:
+        return sorted(linha[0] for linha in conexao.execute('SELECT titulo FROM planilhas'))
+
+
+@pytest.fixture(scope='module')
+def cenario(tmp_path_factory):
+    pasta = tmp_path_factory.mktemp('replicas')
+    primario = _banco(str(pasta / 'primario.db'), 'Primário')
+    replica_1 = _banco(str(pasta / 'replica_1.db'), 'Réplica 1')
+    replica_2 = _banco(str(pasta / 'replica_2.db'), 'Réplica 2')
+    ambiente = {
+        **os.environ,
+        'DATABASE_URL': f'sqlite:///{primario}',
+        'DATABASE_REPLICA_URLS': f'sqlite:///{replica_1},sqlite:///{replica_2}',
+        'REPLICA_ATRASO_MAXIMO_S': '60',
+        'PYTHONPATH': RAIZ,
+    }
+    execucao = subprocess.run([sys.executable, '-c', CENARIO], cwd=pasta, env=ambiente,
+                              capture_output=True, text=True, timeout=60)
+    assert execucao.returncode == 0, execucao.stderr
+    observado = json.loads(execucao.stdout.strip().splitlines()[-1])
+    return observado, primario, (replica_1, replica_2)
+
+
+def test_gets_vao_para_as_replicas_em_rodizio(cenario):
+    observado, _, _ = cenario
+    assert observado['leituras'] == [['Réplica 1'], ['Réplica 2'], ['Réplica 1'], ['Réplica 2']]
+    assert observado['leitura_primaria_sem_escrita'] is False
+
+
+def test_escrita_vai_para_o_primario(cenario):
+    observado, primario, replicas = cenario
+    assert observado['escrita'] == 201
+    assert _titulos(primario) == ['Nova', 'Primário']
+    assert [_titulos(r) for r in replicas] == [['Réplica 1'], ['Réplica 2']]
+
+
+def test_processo_le_do_primario_depois_de_um_commit(cenario):
+    observado, _, _ = cenario
+    assert observado['processo_apos_escrita'] == ['Nova', 'Primário']
+    assert observado['leitura_primaria_apos_escrita'] is True
+
+
+def test_cookie_leva_o_escritor_ao_primario(cenario):
+    observado, _, _ = cenario
+    assert observado['cookie'] is True
+    assert observado['escritor_com_cookie'] == ['Nova', 'Primário']
+    assert observado['leitura_primaria_com_cookie'] is True
+    # Quem não escreveu continua nas réplicas
+    assert observado['outro_cliente'] in (['Réplica 1'], ['Réplica 2'])
+    assert observado['leitura_primaria_sem_sinal'] is False
+
+
+def test_cabecalho_leva_ao_primario_ate_vencer(cenario):
+    observado, _, _ = cenario
+    assert observado['cabecalho_no_futuro'] is True
+    assert observado['com_cabecalho'] == ['Nova', 'Primário']
+    assert observado['leitura_primaria_com_cabecalho'] is True
+    assert observado['cabecalho_vencido'] in (['Réplica 1'], ['Réplica 2'])
@@ -0,0 +1,112 @@
+"""Rajadas de requisições: coalescência das leituras e 503 quando não há vaga."""
+import threading
+import time
+
+from flask import Flask, jsonify
+
+import sobrecarga
+
+
+def _disparar(quantidade, requisitar):
+    """Executa `requisitar()` em `quantidade` threads liberadas ao mesmo tempo."""
+    largada = threading.Barrier(quantidade)
+    respostas = [None] * quantidade
+
+    def executar(i):
+        largada.wait()
+        respostas[i] = requisitar()
+
+    threads = [threading.Thread(target=executar, args=(i,)) for i in range(quantidade)]
+    for t in threads:
+        t.start()
+    return threads, respostas
+
+
+def test_rajada_com_cache_frio_carrega_uma_vez(app, cliente, monkeypatch):
+    import main
+
+    for i in range(20):
+        cliente.post('/api/planilhas', json={'titulo': f'Planilha {i}', 'url': f'https://exemplo.com/{i}'})
+    cache = main.cache_planilhas
+    carregar = cache._carregar
+    cargas = []
+
+    def carregar_devagar():
+        cargas.append(1)
+        # Segura a carga para que todas as requisições cheguem durante ela
+        time.sleep(0.3)
+        return carregar()
+
+    monkeypatch.setattr(cache, '_carregar', carregar_devagar)
+    cache.invalidar()
+
+    threads, respostas = _disparar(300, lambda: app.test_client().get('/api/planilhas'))
+    for t in threads:
+        t.join()
+
+    assert [r.status_code for r in respostas] == [200] * 300
+    assert {len(r.get_json()['dados']) for r in respostas} == {20}
+    assert len(cargas) == 1
+
+
+def test_falha_da_carga_e_compartilhada_pela_rajada(app, cliente, monkeypatch):
+    import main
+
+    cache = main.cache_planilhas
+    cargas = []
+
+    def carregar_com_falha():
+        cargas.append(1)
+        time.sleep(0.3)
+        raise RuntimeError('banco fora do ar')
+
+    monkeypatch.setattr(cache, '_carregar', carregar_com_falha)
+    cache.invalidar()
+
+    threads, respostas = _disparar(300, lambda: app.test_client().get('/api/planilhas'))
+    for t in threads:
+        t.join()
+
+    assert {r.status_code for r in respostas} == {500}
+    # Sem a coalescência cada requisição da fila repetiria a carga (300 tentativas)
+    assert len(cargas) <= 3
+
+
+def _app_lenta(liberar, limite, fila):
+    app = Flask(__name__)
+
+    @app.route('/api/lenta')
+    def lenta():
+        liberar.wait(10)
+        return jsonify({'sucesso': True})
+
+    @app.route('/api/teste')
+    def teste():
+        return jsonify({'sucesso': True})
+
+    sobrecarga.instalar(app, limite=limite, fila=fila, espera=10, retry_after=2)
+    return app
+
+
+def test_sem_vaga_responde_503_com_retry_after():
+    liberar = threading.Event()
+    app = _app_lenta(liberar, limite=4, fila=8)
+    threads, respostas = _disparar(60, lambda: app.test_client().get('/api/lenta'))
+
+    # 4 executando e 8 na fila: as outras 48 são recusadas sem esperar
+    limite = time.monotonic() + 10
+    while sum(r is not None for r in respostas) < 48 and time.monotonic() < limite:
+        time.sleep(0.01)
+    recusadas = [r for r in respostas if r is not None]
+    assert len(recusadas) == 48
+    assert {r.status_code for r in recusadas} == {503}
+    assert {r.headers['Retry-After'] for r in recusadas} == {'2'}
+    assert recusadas[0].get_json()['sucesso'] is False
+
+    # A verificação de saúde responde mesmo com o servidor saturado
+    assert app.test_client().get('/api/teste').status_code == 200
+
+    liberar.set()
+    for t in threads:
+        t.join()
+    assert sorted(r.status_code for r in respostas) == [200] * 12 + [503] * 48
@@ -0,0 +1,42 @@
+"""Sugestões (typeahead) no modo JSON: os dados vêm do cache, numa única leitura."""
+import pytest
+
+
+@pytest.fixture
+def arquivo(app, tmp_path, monkeypatch):
+    import busca
+    import main
+    from armazenamento_json import ArquivoJSON
+    from cache_colecoes import CacheColecao
+
+    arquivo = ArquivoJSON(str(tmp_path / 'dados.json'), indices={'texto': busca.IndiceTexto()})
+    monkeypatch.setattr(main, 'arquivo_planilhas', arquivo)
+    cache = CacheColecao('planilhas', main._ler_planilhas, arquivo.assinatura)
+    arquivo.observar(cache.invalidar)
+    monkeypatch.setattr(main, 'cache_planilhas', cache)
+    monkeypatch.setattr(main, 'USING_DB', False)
+    return arquivo
+
+
+def test_sugestoes_nao_leem_o_arquivo_por_resultado(arquivo, monkeypatch):
+    import main
+
+    arquivo.substituir([
+        {'id': 1, 'titulo': 'Relatório de vendas', 'url': 'https://exemplo.com/1', 'categorias': []},
+        {'id': 2, 'titulo': 'Vendas por região', 'url': 'https://exemplo.com/2', 'categorias': []},
+        {'id': 3, 'titulo': 'Estoque', 'url': 'https://exemplo.com/3', 'categorias': []},
+    ])
+    obtidos = []
+    obter = arquivo.obter
+    monkeypatch.setattr(arquivo, 'obter', lambda item_id: obtidos.append(item_id) or obter(item_id))
+
+    sugestoes = main._sugerir_planilhas_json('vendas', 10)
+
+    assert [s['id'] for s in sugestoes] == [2, 1]
+    assert sugestoes[0] == {'id': 2, 'titulo': 'Vendas por região', 'url': 'https://exemplo.com/2', 'imagem': None}
+    assert obtidos == []
+
+    # Uma planilha removida some das sugestões
+    with arquivo.transacao() as t:
+        t.remover(2)
+    assert [s['id'] for s in main._sugerir_planilhas_json('vendas', 10)] == [1]
@@ -0,0 +1,80 @@
+"""Tarefa de transmissão em segundo plano: uma falha de envio não a encerra."""
+import threading
+import time
+
+import pytest
+
+from transmissao import SALA_DELTA, AgendadorTransmissao
+
+
+class SocketIOFalso:
+    """Tarefas em threads e `emit` que falha nas primeiras `falhas` chamadas."""
+
+    def __init__(self, falhas=0):
+        self.falhas = falhas
+        self.emitidos = []
+        self.tarefas = 0
+
+    def start_background_task(self, alvo):
+        self.tarefas += 1
+        thread = threading.Thread(target=alvo, daemon=True)
+        thread.start()
+        return thread
+
+    def sleep(self, segundos):
+        time.sleep(segundos)
+
+    def emit(self, evento, dados, to=None):
+        if self.falhas:
+            self.falhas -= 1
+            raise ConnectionError('fila de mensagens fora do ar')
+        self.emitidos.append((evento, dados, to))
+
+
+def _esperar(condicao, limite=5):
+    fim = time.monotonic() + limite
+    while not condicao() and time.monotonic() < fim:
+        time.sleep(0.01)
+    return condicao()
+
+
+def test_falha_de_envio_nao_encerra_a_tarefa():
+    socketio = SocketIOFalso(falhas=1)
+    agendador = AgendadorTransmissao(socketio, janela=0.01)
+
+    agendador.gravado('planilha', {'id': 1, 'titulo': 'A'}, criado=True)
+    assert _esperar(lambda: socketio.falhas == 0)
+    agendador.gravado('planilha', {'id': 2, 'titulo': 'B'}, criado=True)
+
+    assert _esperar(lambda: any(e[0] == 'alteracoes' for e in socketio.emitidos))
+    deltas = [dados for evento, dados, sala in socketio.emitidos if evento == 'alteracoes' and sala == SALA_DELTA]
+    assert [a['dado']['id'] for a in deltas[0]['alteracoes']] == [2]
+    # A mensagem que falhou continua no histórico (o cliente a pede pelo seq)
+    assert deltas[0]['seq'] == 2
+    assert socketio.tarefas == 1
+
+
+# A exceção que encerra a tarefa escapa da thread de propósito
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_tarefa_encerrada_e_reiniciada():
+    class Parar(BaseException):
+        pass
+
+    socketio = SocketIOFalso()
+    dormir = socketio.sleep
+    paradas = [1]
+
+    def sleep(segundos):
+        if paradas:
+            paradas.pop()
+            raise Parar()
+        dormir(segundos)
+
+    socketio.sleep = sleep
+    agendador = AgendadorTransmissao(socketio, janela=0.01)
+    agendador.gravado('planilha', {'id': 1, 'titulo': 'A'}, criado=True)
+    assert _esperar(lambda: agendador._tarefa is None)
+
+    agendador.gravado('planilha', {'id': 2, 'titulo': 'B'}, criado=True)
+    assert _esperar(lambda: any(e[0] == 'alteracoes' for e in socketio.emitidos))
+    assert socketio.tarefas == 2
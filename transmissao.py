@@ -0,0 +1,213 @@
+"""Agendador de transmissões WebSocket com agrupamento e mensagens delta.
+
+As rotas não chamam mais `socketio.emit` diretamente: registram as
+alterações aqui e uma tarefa em segundo plano as envia a cada `janela`
+segundos, já agrupadas.
+
+Clientes que conectam com `?protocolo=delta` entram na sala `delta` e
+recebem um único evento `alteracoes` por janela:
+
+    {"epoca": "...", "seq": 42, "alteracoes": [
+        {"entidade": "planilha", "acao": "gravar", "dado": {...}},
+        {"entidade": "planilha", "acao": "remover", "ids": [3, 4, 5]},
+        {"entidade": "categoria", "acao": "recarregar"}
+    ]}
+
+Várias alterações do mesmo item na mesma janela viram uma só (a última).
+`seq` é sequencial por processo e `epoca` muda a cada reinício do servidor;
+com eles o cliente detecta mensagens perdidas e pede, via evento
+`ressincronizar` com `{"epoca": ..., "desde": seq}`, apenas o que perdeu.
+Se o histórico não cobrir o intervalo, a resposta pede recarga completa.
+
+Com vários workers ligados por uma fila de mensagens (ver
+`fila_mensagens.py`), cada worker tem a própria `epoca` e a própria
+sequência. Todo worker registra também as mensagens `alteracoes` dos
+outros (`registrar_remota`), de modo que qualquer um deles responde a uma
+ressincronização; o cliente acompanha um `seq` por `epoca`.
+
+Os demais clientes (sala `legado`) continuam recebendo os eventos antigos
+(`planilha_criada`, `categoria_deletada`, `planilhas_atualizadas`, ...).
+"""
+import logging
+import threading
+import uuid
+from collections import OrderedDict, deque
+
+SALA_DELTA = 'delta'
+SALA_LEGADO = 'legado'
+
+log = logging.getLogger('dashboards.transmissao')
+
+
+class AgendadorTransmissao:
+
+    # Quantas épocas (workers, atuais ou já reiniciados) são lembradas
+    MAX_EPOCAS = 64
+
+    def __init__(self, socketio, janela=0.05, historico=1000):
+        self.socketio = socketio
+        self.janela = janela
+        self.epoca = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._tamanho_historico = historico
+        self._historico = deque(maxlen=historico)
+        # epoca -> (histórico, último seq) de todos os workers conhecidos
+        self._epocas = OrderedDict()
+        self._observadores_remotos = []
+        # (entidade, id) -> alteração; chaves ('recarregar', entidade) para recargas
+        self._pendentes = {}
+        self._legados = []
+        self._tarefa = None
+
+    # ---------- registro de alterações (chamado pelas rotas) ----------
+
+    def gravado(self, entidade, dado, criado=False):
+        """Item criado ou alterado; `dado` é o dicionário completo."""
+        with self._lock:
+            self._pendentes[(entidade, dado['id'])] = {'entidade': entidade, 'acao': 'gravar', 'dado': dado}
+            self._legados.append((f'{entidade}_{"criada" if criado else "editada"}', {'dado': dado}))
+        self._garantir_tarefa()
+
+    def removido(self, entidade, ids):
+        """Itens removidos (ex.: cascata de uma categoria)."""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            for item_id in ids:
+                self._pendentes[(entidade, item_id)] = {'entidade': entidade, 'acao': 'remover', 'id': item_id}
+            if len(ids) == 1:
+                self._legados.append((f'{entidade}_deletada', {'id': ids[0]}))
+            else:
+                self._legados.append((f'{entidade}s_atualizadas', {}))
+        self._garantir_tarefa()
+
+    def recarregar(self, entidade):
+        """A coleção mudou em bloco (importação, exclusão total): clientes recarregam."""
+        with self._lock:
+            for chave in [c for c in self._pendentes if c[0] == entidade]:
+                del self._pendentes[chave]
+            self._pendentes[('recarregar', entidade)] = {'entidade': entidade, 'acao': 'recarregar'}
+            self._legados.append((f'{entidade}s_atualizadas', {}))
+        self._garantir_tarefa()
+
+    # ---------- envio ----------
+
+    def _garantir_tarefa(self):
+        with self._lock:
+            if self._tarefa is None:
+                self._tarefa = self.socketio.start_background_task(self._executar)
+
+    def _executar(self):
+        try:
+            while True:
+                self.socketio.sleep(self.janela)
+                try:
+                    self.descarregar()
+                except Exception:
+                    # Uma falha de envio (ex.: fila de mensagens fora do ar) não
+                    # encerra a tarefa; os clientes recuperam a mensagem perdida
+                    # pelo `seq` (ressincronização)
+                    log.exception('Falha ao transmitir alterações')
+        finally:
+            # Se a tarefa terminar mesmo assim, a próxima alteração inicia outra
+            with self._lock:
+                self._tarefa = None
+
+    def descarregar(self):
+        """Envia imediatamente o que estiver pendente. Retorna a mensagem delta ou None."""
+        with self._lock:
+            if not self._pendentes and not self._legados:
+                return None
+            alteracoes = self._agrupar(self._pendentes.values())
+            legados = []
+            recargas = set()
+            for evento, dados in self._legados:
+                # Eventos de recarga (sem payload) são enviados uma vez por janela
+                if not dados:
+                    if evento in recargas:
+                        continue
+                    recargas.add(evento)
+                legados.append((evento, dados))
+            self._pendentes = {}
+            self._legados = []
+            mensagem = None
+            if alteracoes:
+                self._seq += 1
+                mensagem = {'epoca': self.epoca, 'seq': self._seq, 'alteracoes': alteracoes}
+                self._historico.append(mensagem)
+        if mensagem is not None:
+            self.socketio.emit('alteracoes', mensagem, to=SALA_DELTA)
+        for evento, dados in legados:
+            self.socketio.emit(evento, dados, to=SALA_LEGADO)
+        return mensagem
+
+    @staticmethod
+    def _agrupar(pendentes):
+        """Junta as remoções de cada entidade numa única entrada com a lista de IDs."""
+        alteracoes = []
+        remocoes = {}
+        for alteracao in pendentes:
+            if alteracao['acao'] == 'remover':
+                remocoes.setdefault(alteracao['entidade'], []).append(alteracao['id'])
+            else:
+                alteracoes.append(alteracao)
+        for entidade, ids in remocoes.items():
+            alteracoes.append({'entidade': entidade, 'acao': 'remover', 'ids': ids})
+        return alteracoes
+
+    # ---------- outros workers ----------
+
+    def observar_remotas(self, callback):
+        """Registra `callback(mensagem)` para cada mensagem delta de outro worker."""
+        self._observadores_remotos.append(callback)
+
+    def registrar_remota(self, mensagem):
+        """Guarda uma mensagem `alteracoes` recebida pela fila de mensagens.
+
+        As mensagens do próprio worker (que também voltam pela fila) são
+        ignoradas; repetidas ou fora de ordem também.
+        """
+        epoca = mensagem.get('epoca') if isinstance(mensagem, dict) else None
+        if not epoca or epoca == self.epoca:
+            return
+        with self._lock:
+            if epoca not in self._epocas:
+                self._epocas[epoca] = [deque(maxlen=self._tamanho_historico), 0]
+                while len(self._epocas) > self.MAX_EPOCAS:
+                    self._epocas.popitem(last=False)
+            self._epocas.move_to_end(epoca)
+            entrada = self._epocas[epoca]
+            if mensagem['seq'] <= entrada[1]:
+                return
+            entrada[0].append(mensagem)
+            entrada[1] = mensagem['seq']
+        for callback in self._observadores_remotos:
+            callback(mensagem)
+
+    # ---------- ressincronização ----------
+
+    def mensagens_desde(self, epoca, seq):
+        """Mensagens posteriores a `seq`, ou None se o cliente precisa recarregar tudo."""
+        with self._lock:
+            if epoca == self.epoca:
+                historico, ultimo = self._historico, self._seq
+            elif epoca in self._epocas:
+                historico, ultimo = self._epocas[epoca]
+            else:
+                return None
+            if not isinstance(seq, int) or seq > ultimo:
+                return None
+            if seq == ultimo:
+                return []
+            if not historico or historico[0]['seq'] > seq + 1:
+                return None
+            return [m for m in historico if m['seq'] > seq]
+
+    def estado(self):
+        """Época e `seq` deste worker, mais o último `seq` de cada época conhecida."""
+        with self._lock:
+            epocas = {epoca: entrada[1] for epoca, entrada in self._epocas.items()}
+            epocas[self.epoca] = self._seq
+            return {'epoca': self.epoca, 'seq': self._seq, 'epocas': epocas}